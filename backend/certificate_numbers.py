@@ -0,0 +1,61 @@
+# Certificate Number Allocation for Driving School Platform
+import os
+import asyncio
+from typing import List, Dict
+from pymongo import ReturnDocument
+
+def state_code(state: str) -> str:
+    return state[:3].upper()
+
+class CertificateNumberAllocator:
+    """Per-state certificate sequences reserved from `certificate_sequences` in blocks.
+
+    Each reservation is a single atomic $inc, so numbers never collide across
+    processes; a process hands out numbers from its current block without
+    touching the database. Numbers left in a block when a process exits are
+    skipped, never reused.
+    """
+
+    def __init__(self, db, block_size: int = None):
+        self.db = db
+        self.block_size = block_size or int(os.environ.get('CERTIFICATE_NUMBER_BLOCK', '50'))
+        self._blocks: Dict[str, List[int]] = {}  # state code -> [next, end)
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def _reserve(self, code: str, count: int) -> int:
+        """Reserve `count` consecutive numbers and return the first one"""
+        sequence = await self.db.certificate_sequences.find_one_and_update(
+            {"id": code},
+            {"$inc": {"next": count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return sequence["next"] - count + 1
+
+    def _format(self, code: str, number: int) -> str:
+        return f"DZ-{code}-{number:06d}"
+
+    async def allocate(self, state: str) -> str:
+        return (await self.allocate_many(state, 1))[0]
+
+    async def allocate_many(self, state: str, count: int) -> List[str]:
+        """Allocate `count` certificate numbers for students of a state"""
+        code = state_code(state)
+        lock = self._locks.setdefault(code, asyncio.Lock())
+        async with lock:
+            numbers = []
+            block = self._blocks.get(code)
+            if block:
+                take = min(count, block[1] - block[0])
+                numbers.extend(range(block[0], block[0] + take))
+                block[0] += take
+
+            missing = count - len(numbers)
+            if missing:
+                # Large requests (batches) reserve exactly what they need plus a fresh block
+                reserve = missing + self.block_size
+                first = await self._reserve(code, reserve)
+                numbers.extend(range(first, first + missing))
+                self._blocks[code] = [first + missing, first + reserve]
+
+        return [self._format(code, number) for number in numbers]
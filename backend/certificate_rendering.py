@@ -0,0 +1,333 @@
+# Certificate Rendering for Driving School Platform
+import os
+import asyncio
+import logging
+import importlib.util
+from io import BytesIO
+from pathlib import Path
+from typing import Optional, Dict
+from concurrent.futures import ProcessPoolExecutor
+import qrcode
+import arabic_reshaper
+from bidi.algorithm import get_display
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.graphics.shapes import Drawing, Path as VectorPath
+from reportlab.graphics import renderSVG
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.lib import colors
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.lib.fonts import addMapping
+
+logger = logging.getLogger(__name__)
+
+CERTIFICATE_FOLDER = "certificates"
+
+def _default_font_dir() -> Optional[Path]:
+    # matplotlib (a backend dependency) ships DejaVu Sans, which covers Arabic
+    spec = importlib.util.find_spec("matplotlib")
+    return Path(spec.origin).parent / "mpl-data" / "fonts" / "ttf" if spec and spec.origin else None
+
+def register_unicode_font() -> Optional[str]:
+    """Register the TrueType font used for Arabic text; None when it cannot be found"""
+    font_dir = _default_font_dir()
+    regular = os.environ.get('CERTIFICATE_FONT') or (str(font_dir / "DejaVuSans.ttf") if font_dir else None)
+    bold = os.environ.get('CERTIFICATE_FONT_BOLD') or (str(font_dir / "DejaVuSans-Bold.ttf") if font_dir else None)
+    if not regular or not Path(regular).is_file():
+        logger.warning("No Arabic-capable certificate font found; set CERTIFICATE_FONT")
+        return None
+    pdfmetrics.registerFont(TTFont("CertificateSans", regular))
+    pdfmetrics.registerFont(TTFont("CertificateSans-Bold", bold if bold and Path(bold).is_file() else regular))
+    addMapping("CertificateSans", 0, 0, "CertificateSans")
+    addMapping("CertificateSans", 1, 0, "CertificateSans-Bold")
+    return "CertificateSans"
+
+# Registered on import, so in every rendering process
+UNICODE_FONT = register_unicode_font()
+
+def shape_arabic(text: str) -> str:
+    """Arabic in visual order with joined letter forms, as a left-to-right PDF text run needs it"""
+    return get_display(arabic_reshaper.reshape(text))
+
+def qr_drawing(data: str, size: float = 100) -> Drawing:
+    """QR code as vector shapes, placed directly in PDFs or exported as SVG"""
+    qr = qrcode.QRCode(border=4)
+    qr.add_data(data)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+
+    # One filled path, with each horizontal run of dark modules as a single rectangle
+    module = size / len(matrix)
+    path = VectorPath(fillColor=colors.black, strokeColor=None, strokeWidth=0)
+    for row_index, row in enumerate(matrix):
+        y0 = size - (row_index + 1) * module
+        y1 = y0 + module
+        col = 0
+        while col < len(row):
+            if not row[col]:
+                col += 1
+                continue
+            start = col
+            while col < len(row) and row[col]:
+                col += 1
+            x0, x1 = start * module, col * module
+            path.moveTo(x0, y0)
+            path.lineTo(x1, y0)
+            path.lineTo(x1, y1)
+            path.lineTo(x0, y1)
+            path.closePath()
+
+    drawing = Drawing(size, size)
+    drawing.add(path)
+    return drawing
+
+def render_qr_svg(data: str, size: float = 200) -> str:
+    """QR code as an SVG document"""
+    return renderSVG.drawToString(qr_drawing(data, size))
+
+def verification_payload(certificate_data: dict) -> str:
+    """Data encoded in the certificate QR code: the signed payload when the certificate has one"""
+    return certificate_data.get("qr_payload") or f"VERIFY:{certificate_data['certificate_number']}"
+
+# Wording of each certificate template; the Arabic title is shared.
+# Right-to-left templates carry no inline markup: shaping would reorder the tags.
+ARABIC_TITLE = "شهادة رخصة القيادة"
+
+TEMPLATE_TEXT = {
+    "en": {
+        "direction": "ltr",
+        "country": "🇩🇿 REPUBLIC OF ALGERIA",
+        "ministry": "MINISTRY OF TRANSPORT",
+        "title": "DRIVING LICENSE CERTIFICATE",
+        "certifies": "This certifies that <b>{student_name}</b> has successfully completed",
+        "program": "the comprehensive driving education program at <b>{school_name}</b>",
+        "labels": ["Certificate Number:", "Issue Date:", "Valid Until:", "Student ID:", "School Location:"],
+        "date_format": "%B %d, %Y",
+        "scan": "Scan QR Code to Verify Certificate:",
+        "authority": "Authorized by the Ministry of Transport, Algeria",
+        "validity": "This certificate is valid for 5 years from the date of issue."
+    },
+    "fr": {
+        "direction": "ltr",
+        "country": "🇩🇿 RÉPUBLIQUE ALGÉRIENNE",
+        "ministry": "MINISTÈRE DES TRANSPORTS",
+        "title": "CERTIFICAT DE PERMIS DE CONDUIRE",
+        "certifies": "Nous certifions que <b>{student_name}</b> a suivi avec succès",
+        "program": "le programme complet de formation à la conduite de <b>{school_name}</b>",
+        "labels": ["N° de certificat :", "Date de délivrance :", "Valable jusqu'au :", "ID étudiant :", "Adresse de l'école :"],
+        "date_format": "%d/%m/%Y",
+        "scan": "Scannez le QR code pour vérifier le certificat :",
+        "authority": "Délivré sous l'autorité du Ministère des Transports, Algérie",
+        "validity": "Ce certificat est valable 5 ans à compter de sa date de délivrance."
+    },
+    "ar": {
+        "direction": "rtl",
+        "country": "الجمهورية الجزائرية الديمقراطية الشعبية",
+        "ministry": "وزارة النقل",
+        "title": ARABIC_TITLE,
+        "certifies": "نشهد بأن {student_name} قد أتم بنجاح",
+        "program": "البرنامج الكامل لتعليم القيادة في {school_name}",
+        "labels": ["رقم الشهادة:", "تاريخ الإصدار:", "صالحة حتى:", "رقم الطالب:", "عنوان المدرسة:"],
+        "date_format": "%d/%m/%Y",
+        "scan": "امسح رمز QR للتحقق من الشهادة:",
+        "authority": "صادرة بترخيص من وزارة النقل، الجزائر",
+        "validity": "هذه الشهادة صالحة لمدة 5 سنوات من تاريخ الإصدار."
+    }
+}
+
+class CertificateTemplate:
+    """Styles and static flowables of a certificate layout, built once and reused for every certificate"""
+
+    def __init__(self, language: str = "en", accent_color: Optional[str] = None):
+        self.text = TEMPLATE_TEXT[language]
+        self.rtl = self.text["direction"] == "rtl"
+        accent = colors.HexColor(accent_color) if accent_color else colors.darkblue
+        # Helvetica has no Arabic glyphs
+        font = UNICODE_FONT if self.rtl else None
+
+        styles = getSampleStyleSheet()
+        self.title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            textColor=accent,
+            alignment=1,  # Center alignment
+            spaceAfter=30
+        )
+        self.subtitle_style = ParagraphStyle(
+            'CustomSubtitle',
+            parent=styles['Heading2'],
+            fontSize=18,
+            textColor=colors.blue if not accent_color else accent,
+            alignment=1,
+            spaceAfter=20
+        )
+        self.content_style = ParagraphStyle(
+            'CustomContent',
+            parent=styles['Normal'],
+            fontSize=12,
+            alignment=1,
+            spaceAfter=10
+        )
+        if font:
+            for style in (self.title_style, self.subtitle_style, self.content_style):
+                style.fontName = font
+        arabic_style = ParagraphStyle('ArabicSubtitle', parent=self.subtitle_style, fontName=UNICODE_FONT or 'Helvetica')
+
+        # Right-to-left: labels in the right-hand column
+        label_column = 1 if self.rtl else 0
+        value_column = 1 - label_column
+        self.table_style = TableStyle([
+            ('BACKGROUND', (label_column, 0), (label_column, -1), colors.lightblue),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+            ('ALIGN', (0, 0), (-1, -1), 'RIGHT' if self.rtl else 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, -1), font or 'Helvetica'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+            ('BACKGROUND', (value_column, 0), (value_column, -1), colors.white),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ])
+
+        # Static flowables: identical on every certificate of this template
+        self.header = [
+            Paragraph(self._text(self.text["country"]), self.title_style),
+            Paragraph(self._text(self.text["ministry"]), self.subtitle_style),
+            Spacer(1, 20),
+            Paragraph(self._text(self.text["title"]), self.title_style),
+            # The Arabic template already has the Arabic title
+            *([] if self.rtl else [Paragraph(shape_arabic(ARABIC_TITLE), arabic_style)]),
+            Spacer(1, 30)
+        ]
+        self.scan_caption = Paragraph(self._text(self.text["scan"]), self.content_style)
+        self.footer = [
+            Spacer(1, 20),
+            Paragraph(self._text(self.text["authority"]), self.content_style),
+            Paragraph(self._text(self.text["validity"]), self.content_style)
+        ]
+
+    def _text(self, text: str) -> str:
+        return shape_arabic(text) if self.rtl else text
+
+    def flowables(self, certificate_data: dict) -> list:
+        """Full content of one certificate: static layout plus its variable fields"""
+        date_format = self.text["date_format"]
+        labels = self.text["labels"]
+        details_data = [
+            [labels[0], certificate_data['certificate_number']],
+            [labels[1], certificate_data['issue_date'].strftime(date_format)],
+            [labels[2], certificate_data['expiry_date'].strftime(date_format)],
+            [labels[3], certificate_data['student_id']],
+            [labels[4], certificate_data['school_location']]
+        ]
+        col_widths = [2*inch, 3*inch]
+        if self.rtl:
+            details_data = [[self._text(value), self._text(label)] for label, value in details_data]
+            col_widths.reverse()
+        details_table = Table(details_data, colWidths=col_widths)
+        details_table.setStyle(self.table_style)
+
+        qr_code = qr_drawing(verification_payload(certificate_data), 100)
+        qr_code.hAlign = 'CENTER'
+
+        return [
+            *self.header,
+            Paragraph(self._text(self.text["certifies"].format(student_name=certificate_data['student_name'])), self.content_style),
+            Paragraph(self._text(self.text["program"].format(school_name=certificate_data['school_name'])), self.content_style),
+            Spacer(1, 20),
+            details_table,
+            Spacer(1, 30),
+            self.scan_caption,
+            qr_code,
+            *self.footer
+        ]
+
+# Templates compiled in this process, keyed by (language, accent color)
+_templates: Dict[tuple, CertificateTemplate] = {}
+
+def get_certificate_template(language: str = "en", accent_color: Optional[str] = None) -> CertificateTemplate:
+    # Schools saved before validation may hold anything; Arabic needs the registered font
+    if language not in TEMPLATE_TEXT or (language == "ar" and not UNICODE_FONT):
+        language = "en"
+    if accent_color:
+        try:
+            colors.HexColor(accent_color)
+        except ValueError:
+            accent_color = None
+    key = (language, accent_color)
+    template = _templates.get(key)
+    if template is None:
+        template = _templates[key] = CertificateTemplate(language, accent_color)
+    return template
+
+def render_certificate_pdf(certificate_data: dict) -> bytes:
+    """Generate a professional PDF certificate"""
+    template = get_certificate_template(
+        certificate_data.get("template", "en"),
+        certificate_data.get("accent_color")
+    )
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
+    doc.build(template.flowables(certificate_data))
+    return buffer.getvalue()
+
+def render_certificate_file(certificate_data: dict, output_path: str) -> Dict:
+    """Render a certificate and write it atomically to disk (runs in a worker process)"""
+    pdf_bytes = render_certificate_pdf(certificate_data)
+    temp_path = f"{output_path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(pdf_bytes)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, output_path)
+
+    return {
+        "file_size": len(pdf_bytes),
+        "qr_code": render_qr_svg(verification_payload(certificate_data))
+    }
+
+class CertificateRenderer:
+    def __init__(self, uploads_dir: Path, url_prefix: str = "/demo-uploads", max_workers: Optional[int] = None):
+        self.uploads_dir = Path(uploads_dir)
+        self.url_prefix = url_prefix
+        self.max_workers = max_workers or int(os.environ.get('CERTIFICATE_WORKERS', str(os.cpu_count() or 2)))
+        self._executor = None
+        self._tasks = set()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    async def render(self, certificate_id: str, certificate_data: dict) -> Dict:
+        """Render a certificate PDF into the uploads folder and return its URL, size and QR code"""
+        output_dir = self.uploads_dir / CERTIFICATE_FOLDER
+        output_dir.mkdir(parents=True, exist_ok=True)
+        file_name = f"{certificate_id}.pdf"
+
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            self.executor, render_certificate_file, certificate_data, str(output_dir / file_name)
+        )
+        return {"file_url": f"{self.url_prefix}/{CERTIFICATE_FOLDER}/{file_name}", **result}
+
+    def schedule(self, certificate_id: str, certificate_data: dict, on_complete) -> None:
+        """Render a certificate in the background and hand the result to `on_complete`"""
+        async def run():
+            try:
+                result = await self.render(certificate_id, certificate_data)
+                await on_complete(certificate_id, result)
+            except Exception as e:
+                logger.error(f"Certificate rendering failed for {certificate_id}: {str(e)}")
+
+        task = asyncio.create_task(run())
+        # Keep a reference so the task is not garbage-collected mid-flight
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,120 @@
+# Certificate Signing for Driving School Platform
+import os
+import time
+import base64
+import hashlib
+import logging
+from datetime import datetime
+from typing import Optional, Dict, Any
+from collections import OrderedDict
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+
+logger = logging.getLogger(__name__)
+
+PAYLOAD_PREFIX = "DZC1"
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def load_signing_key(secret_key: str) -> Ed25519PrivateKey:
+    """Ed25519 key from CERTIFICATE_SIGNING_KEY (base64 seed), else derived from SECRET_KEY"""
+    seed = os.environ.get('CERTIFICATE_SIGNING_KEY')
+    if seed:
+        return Ed25519PrivateKey.from_private_bytes(_b64decode(seed))
+    # Deterministic so every worker process signs with the same key
+    return Ed25519PrivateKey.from_private_bytes(hashlib.sha256(f"certificate-signing:{secret_key}".encode()).digest())
+
+class CertificateSigner:
+    """Signs a certificate's key fields into a compact payload verifiable offline with the public key.
+
+    Payload: DZC1.<base64url fields>.<base64url signature>, fields being
+    id|certificate_number|student_name|issue_date|expiry_date.
+    """
+
+    def __init__(self, private_key: Ed25519PrivateKey):
+        self.private_key = private_key
+        self.public_key = private_key.public_key()
+
+    @property
+    def public_key_b64(self) -> str:
+        return _b64encode(self.public_key.public_bytes(
+            encoding=serialization.Encoding.Raw,
+            format=serialization.PublicFormat.Raw
+        ))
+
+    @property
+    def public_key_pem(self) -> str:
+        return self.public_key.public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode()
+
+    def sign(self, certificate: dict, student_name: str) -> str:
+        expiry_date = certificate.get("expiry_date")
+        fields = "|".join([
+            certificate["id"],
+            certificate["certificate_number"],
+            student_name.replace("|", " "),
+            certificate["issue_date"].strftime('%Y-%m-%d'),
+            expiry_date.strftime('%Y-%m-%d') if expiry_date else ""
+        ]).encode()
+        return f"{PAYLOAD_PREFIX}.{_b64encode(fields)}.{_b64encode(self.private_key.sign(fields))}"
+
+    @staticmethod
+    def verify(payload: str, public_key: Ed25519PublicKey) -> Optional[Dict[str, Any]]:
+        """Fields of a signed payload, or None if it is malformed or the signature does not match"""
+        try:
+            prefix, encoded_fields, encoded_signature = payload.split(".")
+            if prefix != PAYLOAD_PREFIX:
+                return None
+            fields = _b64decode(encoded_fields)
+            public_key.verify(_b64decode(encoded_signature), fields)
+        except (ValueError, InvalidSignature):
+            return None
+
+        cert_id, certificate_number, student_name, issue_date, expiry_date = fields.decode().split("|")
+        return {
+            "id": cert_id,
+            "certificate_number": certificate_number,
+            "student_name": student_name,
+            "issue_date": issue_date,
+            "expiry_date": expiry_date or None,
+            "is_within_validity": not expiry_date or datetime.utcnow().strftime('%Y-%m-%d') <= expiry_date
+        }
+
+class VerificationCache:
+    """Small TTL + LRU cache for certificate verification lookups.
+
+    Revocations invalidate entries in this process; the TTL bounds how long
+    other workers can keep serving a revoked certificate.
+    """
+
+    def __init__(self, ttl_seconds: Optional[int] = None, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds or int(os.environ.get('CERTIFICATE_VERIFY_CACHE_SECONDS', '60'))
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: dict):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: str):
+        self._entries.pop(key, None)
@@ -1,17 +1,22 @@
 # Enhanced Notification System for Driving School Platform
-import smtplib
 import os
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import html
+import time
 from email.mime.base import MIMEBase
 from email import encoders
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict
 import json
+import base64
 import asyncio
 import logging
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, ReplaceOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from enum import Enum
+from smtp_transport import get_smtp_pool, SMTPError
+from notification_outbox import NotificationOutbox
+from notification_templates import EmailRenderer, build_message, DEFAULT_LANGUAGE
 
 logger = logging.getLogger(__name__)
 
@@ -27,16 +32,71 @@ class NotificationChannel(str, Enum):
     PUSH = "push"
     IN_APP = "in_app"
 
+# A counter rebuild that keeps losing to concurrent updates gives up storing after this many tries
+COUNTER_REBUILD_ATTEMPTS = 5
+
+# Fields a feed shows; delivery bookkeeping stays in the database
+FEED_PROJECTION = {
+    "_id": 0, "id": 1, "type": 1, "title": 1, "message": 1, "priority": 1,
+    "is_read": 1, "read_at": 1, "metadata": 1, "created_at": 1
+}
+
+def encode_feed_cursor(notification: dict) -> str:
+    value = f"{notification['created_at'].isoformat()}|{notification['id']}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+def decode_feed_cursor(cursor: str) -> tuple:
+    """(created_at, id) of the last notification of the previous page; ValueError if malformed"""
+    try:
+        created_at, notification_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), notification_id
+    except Exception:
+        raise ValueError("Invalid feed cursor")
+
 class EnhancedNotificationService:
-    def __init__(self, db_client):
+    def __init__(self, db_client, hub=None):
         self.db = db_client.driving_school_platform
+        # NotificationHub pushing new notifications to connected clients, if any
+        self.hub = hub
         self.smtp_server = os.environ.get('SMTP_SERVER', 'smtp.gmail.com')
         self.smtp_port = int(os.environ.get('SMTP_PORT', '587'))
         self.smtp_username = os.environ.get('SMTP_USERNAME')
         self.smtp_password = os.environ.get('SMTP_PASSWORD')
         self.from_email = os.environ.get('FROM_EMAIL', self.smtp_username)
+        # Plain SMTP (SMTP_STARTTLS=false) lets a local debugging server stand in for the relay
+        self.smtp_starttls = os.environ.get('SMTP_STARTTLS', 'true').lower() == 'true'
+        self.smtp_pool_size = int(os.environ.get('SMTP_POOL_SIZE', '4'))
+        self.email_renderer = EmailRenderer()
+        self.outbox = NotificationOutbox(
+            self.db,
+            self._deliver_job,
+            self._record_dead_letter,
+            deliver_digest=self._deliver_digest,
+            deliver_batch=self._deliver_jobs
+        )
+        self.expiry_sweep_seconds = float(os.environ.get('NOTIFICATION_EXPIRY_SWEEP_SECONDS', '60'))
+        # Read notifications older than this move to enhanced_notifications_archive
+        self.read_retention_days = int(os.environ.get('NOTIFICATION_READ_RETENTION_DAYS', '90'))
+        self._sweeper = None
 
-    async def create_notification(
+    @property
+    def smtp_configured(self) -> bool:
+        # An explicitly configured server may accept mail without authentication
+        has_credentials = bool(self.smtp_username and self.smtp_password)
+        return bool(self.from_email) and (has_credentials or 'SMTP_SERVER' in os.environ)
+
+    @property
+    def smtp_pool(self):
+        return get_smtp_pool(
+            self.smtp_server,
+            self.smtp_port,
+            self.smtp_username,
+            self.smtp_password,
+            starttls=self.smtp_starttls,
+            size=self.smtp_pool_size
+        )
+
+    def build_notification(
         self,
         user_id: str,
         notification_type: str,
@@ -47,12 +107,15 @@ class EnhancedNotificationService:
         metadata: Optional[Dict] = None,
         scheduled_at: Optional[datetime] = None,
         expires_at: Optional[datetime] = None
-    ) -> str:
-        """Create an enhanced notification with multiple delivery channels"""
-        
-        notification_id = str(__import__('uuid').uuid4())
-        notification_doc = {
-            "id": notification_id,
+    ) -> dict:
+        """Notification document, ready to be stored with `create_notifications`"""
+        now = datetime.utcnow()
+        # In-app notifications are delivered by being stored; other channels go through the outbox
+        delivery_status = {}
+        if NotificationChannel.IN_APP in channels:
+            delivery_status[NotificationChannel.IN_APP.value] = {"success": True, "delivered_at": now}
+        return {
+            "id": str(__import__('uuid').uuid4()),
             "user_id": user_id,
             "type": notification_type,
             "title": title,
@@ -61,176 +124,323 @@ class EnhancedNotificationService:
             "channels": channels,
             "metadata": metadata or {},
             "is_read": False,
-            "is_delivered": False,
-            "delivery_status": {},
-            "scheduled_at": scheduled_at or datetime.utcnow(),
+            "is_delivered": bool(delivery_status),
+            "delivery_status": delivery_status,
+            "scheduled_at": scheduled_at or now,
             "expires_at": expires_at,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
+            "created_at": now,
+            "updated_at": now
         }
-        
+
+    def from_legacy(self, notification: dict) -> dict:
+        """A notification in the old `notifications` shape, as an in-app notification of this service"""
+        created_at = notification.get("created_at") or datetime.utcnow()
+        converted = self.build_notification(
+            user_id=notification["user_id"],
+            notification_type=notification.get("type", "general"),
+            title=notification.get("title", ""),
+            message=notification.get("message", ""),
+            metadata=notification.get("metadata")
+        )
+        converted.update({
+            "id": notification.get("id") or converted["id"],
+            "is_read": notification.get("is_read", False),
+            "scheduled_at": created_at,
+            "created_at": created_at,
+            "updated_at": created_at
+        })
+        return converted
+
+    def _outbox_jobs(self, notification: dict) -> List[dict]:
+        # Scheduled notifications stay in the outbox until they are due
+        scheduled_at = notification["scheduled_at"]
+        # Low and medium priority wait to be coalesced per user and channel; high and urgent go out alone
+        digest = notification["priority"] in (NotificationPriority.LOW, NotificationPriority.MEDIUM)
+        return self.outbox.build_jobs(
+            notification["id"],
+            [channel for channel in notification["channels"] if channel != NotificationChannel.IN_APP],
+            deliver_at=scheduled_at if scheduled_at > notification["created_at"] else None,
+            digest_key=notification["user_id"] if digest else None
+        )
+
+    def start(self):
+        """Start outbox delivery and the expiry and archive sweep"""
+        self.outbox.start()
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._expiry_loop())
+
+    async def stop(self):
+        await self.outbox.stop()
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+
+    async def _expiry_loop(self):
+        while True:
+            try:
+                await asyncio.sleep(self.expiry_sweep_seconds)
+                await self.expire_notifications()
+                await self.archive_read_notifications()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Notification expiry sweep error: {str(e)}")
+
+    async def create_notification(
+        self,
+        user_id: str,
+        notification_type: str,
+        title: str,
+        message: str,
+        priority: NotificationPriority = NotificationPriority.MEDIUM,
+        channels: List[NotificationChannel] = [NotificationChannel.IN_APP],
+        metadata: Optional[Dict] = None,
+        scheduled_at: Optional[datetime] = None,
+        expires_at: Optional[datetime] = None
+    ) -> str:
+        """Create an enhanced notification with multiple delivery channels"""
+        notification_doc = self.build_notification(
+            user_id, notification_type, title, message, priority, channels, metadata, scheduled_at, expires_at
+        )
         await self.db.enhanced_notifications.insert_one(notification_doc)
-        
-        # If not scheduled for later, send immediately
-        if not scheduled_at or scheduled_at <= datetime.utcnow():
-            await self._deliver_notification(notification_doc)
-        
-        return notification_id
+        await self._adjust_unread({(user_id, notification_doc["priority"]): 1})
+        await self.outbox.enqueue_jobs(self._outbox_jobs(notification_doc))
+        await self._push([notification_doc])
+        return notification_doc["id"]
 
-    async def _deliver_notification(self, notification: dict):
-        """Deliver notification through specified channels"""
-        delivery_status = {}
+    async def create_notifications(self, notifications: List[dict]) -> int:
+        """Store many built notifications and queue their delivery in two writes"""
+        if not notifications:
+            return 0
+        await self.db.enhanced_notifications.insert_many(notifications, ordered=False)
+        increments = {}
+        for notification in notifications:
+            if not notification["is_read"]:
+                key = (notification["user_id"], notification["priority"])
+                increments[key] = increments.get(key, 0) + 1
+        await self._adjust_unread(increments)
+        await self.outbox.enqueue_jobs([job for notification in notifications for job in self._outbox_jobs(notification)])
+        await self._push(notifications)
+        return len(notifications)
+
+    async def resolve_school_audience(self, school_id: str, audience: str = "all") -> List[str]:
+        """User ids of a school's enrolled students and/or approved teachers, in one query"""
+        students = [
+            {"$match": {"driving_school_id": school_id, "enrollment_status": "approved"}},
+            {"$project": {"_id": 0, "user_id": "$student_id"}}
+        ]
+        teachers = [
+            {"$match": {"driving_school_id": school_id, "is_approved": True}},
+            {"$project": {"_id": 0, "user_id": 1}}
+        ]
+        if audience == "students":
+            collection, pipeline = self.db.enrollments, students
+        elif audience == "teachers":
+            collection, pipeline = self.db.teachers, teachers
+        else:
+            collection, pipeline = self.db.enrollments, students + [{"$unionWith": {"coll": "teachers", "pipeline": teachers}}]
+
+        # A student enrolled twice is notified once
+        groups = await collection.aggregate(pipeline + [{"$group": {"_id": "$user_id"}}]).to_list(length=None)
+        return [group["_id"] for group in groups if group["_id"]]
+
+    async def broadcast(
+        self,
+        user_ids: List[str],
+        notification_type: str,
+        title: str,
+        message: str,
+        priority: NotificationPriority = NotificationPriority.MEDIUM,
+        channels: List[NotificationChannel] = [NotificationChannel.IN_APP],
+        metadata: Optional[Dict] = None,
+        chunk_size: int = 1000
+    ) -> dict:
+        """Send the same notification to many users, stored and queued one chunk at a time"""
+        broadcast_id = str(__import__('uuid').uuid4())
+        metadata = {**(metadata or {}), "broadcast_id": broadcast_id}
+        started = time.perf_counter()
+        for start in range(0, len(user_ids), chunk_size):
+            await self.create_notifications([
+                self.build_notification(user_id, notification_type, title, message, priority, channels, metadata)
+                for user_id in user_ids[start:start + chunk_size]
+            ])
+        elapsed = time.perf_counter() - started
+        logger.info(f"Broadcast {broadcast_id} to {len(user_ids)} users in {elapsed:.2f}s")
+        return {"broadcast_id": broadcast_id, "recipients": len(user_ids), "elapsed_seconds": round(elapsed, 3)}
+
+    async def _push(self, notifications: List[dict]):
+        """Stream stored notifications to connected clients"""
+        if self.hub is not None:
+            await self.hub.publish_many(notifications)
+
+    async def _deliver_job(self, job: dict) -> bool:
+        """Deliver one outbox job (a notification on one channel); raises to have it retried"""
+        notification = await self.db.enhanced_notifications.find_one({"id": job["notification_id"]})
+        if not notification:
+            return False
         
-        # Get user details
         user = await self.db.users.find_one({"id": notification["user_id"]})
         if not user:
             logger.error(f"User not found for notification {notification['id']}")
-            return
+            return False
+        
+        success = await self._send_via(job["channel"], user, notification)
+        await self._record_delivery(job["channel"], [notification["id"]], {"success": success, "delivered_at": datetime.utcnow()})
+        return success
+
+    async def _deliver_jobs(self, jobs: List[dict]) -> List[object]:
+        """Deliver a batch of single jobs: one lookup for their notifications and one for their users,
+        emails spread over the SMTP pool. Returns True/False or the exception to retry, per job."""
+        notifications = {
+            notification["id"]: notification
+            for notification in await self.db.enhanced_notifications.find(
+                {"id": {"$in": list({job["notification_id"] for job in jobs})}}
+            ).to_list(length=None)
+        }
+        users = {
+            user["id"]: user
+            for user in await self.db.users.find(
+                {"id": {"$in": list({notification["user_id"] for notification in notifications.values()})}},
+                {"_id": 0, "id": 1, "email": 1, "phone": 1, "first_name": 1, "last_name": 1, "language": 1}
+            ).to_list(length=None)
+        }
         
-        # Deliver through each channel
-        for channel in notification["channels"]:
+        results: List[object] = [False] * len(jobs)
+        emails = []
+        for index, job in enumerate(jobs):
+            notification = notifications.get(job["notification_id"])
+            user = users.get(notification["user_id"]) if notification else None
+            if not user:
+                continue
+            if job["channel"] == NotificationChannel.EMAIL and user.get("email") and self.smtp_configured:
+                emails.append((index, user, notification))
+                continue
             try:
-                if channel == NotificationChannel.EMAIL and user.get("email"):
-                    success = await self._send_email(user, notification)
-                    delivery_status[channel] = {"success": success, "delivered_at": datetime.utcnow()}
-                
-                elif channel == NotificationChannel.SMS and user.get("phone"):
-                    success = await self._send_sms(user, notification)
-                    delivery_status[channel] = {"success": success, "delivered_at": datetime.utcnow()}
-                
-                elif channel == NotificationChannel.PUSH:
-                    success = await self._send_push_notification(user, notification)
-                    delivery_status[channel] = {"success": success, "delivered_at": datetime.utcnow()}
-                
-                elif channel == NotificationChannel.IN_APP:
-                    # In-app notifications are stored in database (already done)
-                    delivery_status[channel] = {"success": True, "delivered_at": datetime.utcnow()}
-                
+                results[index] = await self._send_via(job["channel"], user, notification)
             except Exception as e:
-                logger.error(f"Failed to deliver notification via {channel}: {str(e)}")
-                delivery_status[channel] = {"success": False, "error": str(e)}
+                results[index] = e
         
-        # Update notification with delivery status
-        await self.db.enhanced_notifications.update_one(
-            {"id": notification["id"]},
-            {
-                "$set": {
-                    "is_delivered": any(status.get("success", False) for status in delivery_status.values()),
-                    "delivery_status": delivery_status,
-                    "updated_at": datetime.utcnow()
-                }
-            }
-        )
+        messages = []
+        for index, user, notification in emails:
+            try:
+                messages.append((index, user, self._build_email(user, notification)))
+            except SMTPError as e:
+                logger.error(f"Email to {user['email']!r} not sent: {str(e)}")
+        if messages:
+            errors = await self.smtp_pool.send_batch([
+                (self.from_email, [user["email"]], message)
+                for _, user, message in messages
+            ])
+            for (index, user, _), error in zip(messages, errors):
+                if isinstance(error, SMTPError) and error.permanent:
+                    # Rejected by the server: final, unlike 4xx replies and transport errors
+                    logger.error(f"Email to {user['email']} rejected: {str(error)}")
+                    results[index] = False
+                else:
+                    results[index] = error or True
+        
+        # Failures to retry are recorded when they are dead-lettered
+        now = datetime.utcnow()
+        outcomes: Dict[tuple, List[str]] = {}
+        for job, result in zip(jobs, results):
+            if not isinstance(result, Exception) and job["notification_id"] in notifications:
+                outcomes.setdefault((job["channel"], result), []).append(job["notification_id"])
+        for (channel, success), notification_ids in outcomes.items():
+            await self._record_delivery(channel, notification_ids, {"success": success, "delivered_at": now})
+        return results
 
-    async def _send_email(self, user: dict, notification: dict) -> bool:
-        """Send email notification"""
-        if not self.smtp_username or not self.smtp_password:
-            logger.warning("SMTP credentials not configured")
+    async def _deliver_digest(self, jobs: List[dict]) -> bool:
+        """Deliver the jobs of one user and channel as a single digest message"""
+        notifications = await self.db.enhanced_notifications.find(
+            {"id": {"$in": [job["notification_id"] for job in jobs]}}
+        ).sort("created_at", 1).to_list(length=None)
+        if not notifications:
             return False
         
-        try:
-            msg = MIMEMultipart()
-            msg['From'] = self.from_email
-            msg['To'] = user["email"]
-            msg['Subject'] = f"🚗 {notification['title']} - Driving School Platform"
-            
-            # Create HTML email body
-            html_body = self._create_email_template(user, notification)
-            msg.attach(MIMEText(html_body, 'html'))
-            
-            # Connect and send email
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.starttls()
-            server.login(self.smtp_username, self.smtp_password)
-            text = msg.as_string()
-            server.sendmail(self.from_email, user["email"], text)
-            server.quit()
-            
-            logger.info(f"Email sent successfully to {user['email']}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Failed to send email: {str(e)}")
+        user = await self.db.users.find_one({"id": notifications[0]["user_id"]})
+        if not user:
+            logger.error(f"User not found for notification {notifications[0]['id']}")
             return False
+        
+        channel = jobs[0]["channel"]
+        digest = notifications[0] if len(notifications) == 1 else self._build_digest(notifications)
+        success = await self._send_via(channel, user, digest)
+        await self._record_delivery(
+            channel,
+            [notification["id"] for notification in notifications],
+            {"success": success, "delivered_at": datetime.utcnow(), "digest_size": len(notifications)}
+        )
+        return success
 
-    def _create_email_template(self, user: dict, notification: dict) -> str:
-        """Create HTML email template"""
-        priority_colors = {
-            "low": "#28a745",
-            "medium": "#ffc107", 
-            "high": "#fd7e14",
-            "urgent": "#dc3545"
+    def _build_digest(self, notifications: List[dict]) -> dict:
+        """One notification standing for several, rendered by the usual templates"""
+        priority = NotificationPriority.MEDIUM if any(
+            notification["priority"] == NotificationPriority.MEDIUM for notification in notifications
+        ) else NotificationPriority.LOW
+        return {
+            "id": notifications[-1]["id"],
+            "user_id": notifications[0]["user_id"],
+            "type": "digest",
+            "title": f"You have {len(notifications)} new notifications",
+            "message": "\n".join(f"{notification['title']}: {notification['message']}" for notification in notifications),
+            # Markup for the email body, built from escaped parts
+            "message_html": "<br>".join(
+                f"<strong>{html.escape(notification['title'])}</strong>: {html.escape(notification['message'])}"
+                for notification in notifications
+            ),
+            "priority": priority.value,
+            "metadata": {}
         }
-        
-        priority_color = priority_colors.get(notification["priority"], "#007bff")
-        
-        template = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>{notification['title']}</title>
-        </head>
-        <body style="font-family: Arial, sans-serif; margin: 0; padding: 20px; background-color: #f4f4f4;">
-            <div style="max-width: 600px; margin: 0 auto; background-color: white; border-radius: 8px; overflow: hidden; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-                
-                <!-- Header -->
-                <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center;">
-                    <h1 style="margin: 0; font-size: 28px;">🚗 Driving School Platform</h1>
-                    <p style="margin: 10px 0 0 0; opacity: 0.9;">مدرسة تعليم القيادة الجزائرية</p>
-                </div>
-                
-                <!-- Priority Badge -->
-                <div style="padding: 20px; border-left: 4px solid {priority_color}; background-color: #f8f9fa;">
-                    <div style="display: inline-block; background-color: {priority_color}; color: white; padding: 4px 12px; border-radius: 12px; font-size: 12px; font-weight: bold; text-transform: uppercase;">
-                        {notification['priority']} Priority
-                    </div>
-                </div>
-                
-                <!-- Content -->
-                <div style="padding: 30px;">
-                    <h2 style="color: #333; margin-top: 0;">{notification['title']}</h2>
-                    <p style="color: #666; line-height: 1.6; font-size: 16px;">{notification['message']}</p>
-                    
-                    <!-- Metadata -->
-                    {self._format_metadata_for_email(notification.get('metadata', {}))}
-                </div>
-                
-                <!-- CTA Button -->
-                <div style="padding: 0 30px 30px;">
-                    <a href="{os.environ.get('FRONTEND_URL', 'http://localhost:3000')}/dashboard" 
-                       style="display: inline-block; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 12px 30px; text-decoration: none; border-radius: 25px; font-weight: bold;">
-                        Open Dashboard
-                    </a>
-                </div>
-                
-                <!-- Footer -->
-                <div style="background-color: #f8f9fa; padding: 20px; text-align: center; color: #666; font-size: 14px;">
-                    <p style="margin: 0;">This is an automated message from the Driving School Platform</p>
-                    <p style="margin: 5px 0 0 0;">🇩🇿 Algeria Driving Education System</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        return template
 
-    def _format_metadata_for_email(self, metadata: dict) -> str:
-        """Format metadata for email display"""
-        if not metadata:
-            return ""
-        
-        html = "<div style='background-color: #f8f9fa; padding: 15px; border-radius: 6px; margin-top: 20px;'>"
-        html += "<h4 style='margin: 0 0 10px 0; color: #495057;'>Additional Information:</h4>"
+    async def _send_via(self, channel: str, user: dict, notification: dict) -> bool:
+        if channel == NotificationChannel.EMAIL and user.get("email"):
+            return await self._send_email(user, notification)
+        if channel == NotificationChannel.SMS and user.get("phone"):
+            return await self._send_sms(user, notification)
+        if channel == NotificationChannel.PUSH:
+            return await self._send_push_notification(user, notification)
+        return False
+
+    async def _record_dead_letter(self, job: dict, error: str):
+        await self._record_delivery(job["channel"], [job["notification_id"]], {"success": False, "error": error})
+
+    async def _record_delivery(self, channel: str, notification_ids: List[str], status: dict):
+        """Store one channel's outcome on its notifications"""
+        update = {
+            "$set": {
+                f"delivery_status.{channel}": status,
+                "updated_at": datetime.utcnow()
+            }
+        }
+        if status["success"]:
+            update["$set"]["is_delivered"] = True
+        await self.db.enhanced_notifications.update_many({"id": {"$in": notification_ids}}, update)
+
+    def _build_email(self, user: dict, notification: dict) -> bytes:
+        rendered = self.email_renderer.render(notification, user.get("language") or DEFAULT_LANGUAGE)
+        return build_message(self.from_email, user["email"], rendered)
+
+    async def _send_email(self, user: dict, notification: dict) -> bool:
+        """Send email notification over a pooled SMTP session; 4xx replies and transport errors propagate for retry"""
+        if not self.smtp_configured:
+            logger.warning("SMTP credentials not configured")
+            return False
         
-        for key, value in metadata.items():
-            if key not in ['internal_id', 'system_data']:  # Skip internal keys
-                formatted_key = key.replace('_', ' ').title()
-                html += f"<p style='margin: 5px 0; color: #6c757d;'><strong>{formatted_key}:</strong> {value}</p>"
+        started = time.perf_counter()
+        try:
+            refused = await self.smtp_pool.send(self.from_email, [user["email"]], self._build_email(user, notification))
+        except SMTPError as e:
+            if not e.permanent:
+                raise
+            logger.error(f"Email to {user['email']} rejected: {str(e)}")
+            return False
+        if refused:
+            logger.error(f"Email to {user['email']} refused: {refused[user['email']]}")
+            return False
         
-        html += "</div>"
-        return html
+        logger.info(f"Email sent successfully to {user['email']} in {(time.perf_counter() - started) * 1000:.1f}ms")
+        return True
 
     async def _send_sms(self, user: dict, notification: dict) -> bool:
         """Send SMS notification (placeholder for SMS service integration)"""
@@ -244,30 +454,41 @@ class EnhancedNotificationService:
         logger.info(f"Push notification would be sent to user {user['id']}: {notification['title']}")
         return True  # Simulated success
 
-    async def schedule_reminders(self):
-        """Schedule automatic reminders for various events"""
+    async def schedule_reminders(self) -> dict:
+        """Schedule automatic reminders for various events.
+
+        Works set-wise, one batch of sessions or enrollments at a time: a single
+        query finds the ones already reminded, and the new reminders are stored
+        and queued with one insert_many each.
+        """
         now = datetime.utcnow()
+        batch_size = 5000
         
         # Session reminders (24 hours before)
         tomorrow = now + timedelta(days=1)
-        sessions_cursor = self.db.sessions.find({
-            "scheduled_at": {
-                "$gte": tomorrow.replace(hour=0, minute=0, second=0),
-                "$lt": tomorrow.replace(hour=23, minute=59, second=59)
+        sessions_cursor = self.db.sessions.find(
+            {
+                "scheduled_at": {
+                    "$gte": tomorrow.replace(hour=0, minute=0, second=0),
+                    "$lt": tomorrow.replace(hour=23, minute=59, second=59)
+                },
+                "status": "scheduled"
             },
-            "status": "scheduled"
-        })
+            {"_id": 0, "id": 1, "student_id": 1, "session_type": 1, "scheduled_at": 1}
+        ).batch_size(batch_size)
         
-        async for session in sessions_cursor:
-            # Check if reminder already sent
-            existing_reminder = await self.db.enhanced_notifications.find_one({
-                "user_id": session["student_id"],
-                "type": "session_reminder",
-                "metadata.session_id": session["id"]
-            })
+        session_reminders = 0
+        while True:
+            sessions = await sessions_cursor.to_list(length=batch_size)
+            if not sessions:
+                break
             
-            if not existing_reminder:
-                await self.create_notification(
+            reminded = set(await self.db.enhanced_notifications.distinct("metadata.session_id", {
+                "type": "session_reminder",
+                "metadata.session_id": {"$in": [session["id"] for session in sessions]}
+            }))
+            session_reminders += await self.create_notifications([
+                self.build_notification(
                     user_id=session["student_id"],
                     notification_type="session_reminder",
                     title="Session Reminder",
@@ -276,44 +497,178 @@ class EnhancedNotificationService:
                     channels=[NotificationChannel.EMAIL, NotificationChannel.IN_APP],
                     metadata={"session_id": session["id"], "session_type": session["session_type"]}
                 )
+                for session in sessions
+                if session["id"] not in reminded
+            ])
         
         # Payment reminders (for pending payments older than 3 days)
         three_days_ago = now - timedelta(days=3)
-        enrollments_cursor = self.db.enrollments.find({
-            "payment_status": "pending",
-            "created_at": {"$lt": three_days_ago}
-        })
+        enrollments_cursor = self.db.enrollments.find(
+            {
+                "payment_status": "pending",
+                "created_at": {"$lt": three_days_ago}
+            },
+            {"_id": 0, "id": 1, "student_id": 1, "driving_school_id": 1, "amount": 1}
+        ).batch_size(batch_size)
         
-        async for enrollment in enrollments_cursor:
-            # Check if reminder already sent in last 24 hours
-            recent_reminder = await self.db.enhanced_notifications.find_one({
-                "user_id": enrollment["student_id"],
+        payment_reminders = 0
+        school_names = {}
+        while True:
+            enrollments = await enrollments_cursor.to_list(length=batch_size)
+            if not enrollments:
+                break
+            
+            # Skip enrollments reminded in the last 24 hours
+            reminded = set(await self.db.enhanced_notifications.distinct("metadata.enrollment_id", {
                 "type": "payment_reminder",
-                "metadata.enrollment_id": enrollment["id"],
+                "metadata.enrollment_id": {"$in": [enrollment["id"] for enrollment in enrollments]},
                 "created_at": {"$gte": now - timedelta(hours=24)}
-            })
+            }))
+            enrollments = [enrollment for enrollment in enrollments if enrollment["id"] not in reminded]
             
-            if not recent_reminder:
-                school = await self.db.driving_schools.find_one({"id": enrollment["driving_school_id"]})
-                await self.create_notification(
+            missing_schools = {enrollment["driving_school_id"] for enrollment in enrollments} - school_names.keys()
+            if missing_schools:
+                async for school in self.db.driving_schools.find({"id": {"$in": list(missing_schools)}}, {"_id": 0, "id": 1, "name": 1}):
+                    school_names[school["id"]] = school["name"]
+            
+            payment_reminders += await self.create_notifications([
+                self.build_notification(
                     user_id=enrollment["student_id"],
                     notification_type="payment_reminder",
                     title="Payment Reminder",
-                    message=f"Your enrollment payment for {school['name'] if school else 'driving school'} is still pending. Please complete your payment to continue.",
+                    message=f"Your enrollment payment for {school_names.get(enrollment['driving_school_id'], 'driving school')} is still pending. Please complete your payment to continue.",
                     priority=NotificationPriority.MEDIUM,
                     channels=[NotificationChannel.EMAIL, NotificationChannel.IN_APP],
                     metadata={"enrollment_id": enrollment["id"], "amount": enrollment["amount"]}
                 )
+                for enrollment in enrollments
+            ])
+        
+        return {"session_reminders": session_reminders, "payment_reminders": payment_reminders}
+
+    async def _adjust_unread(self, deltas: Dict[tuple, int]):
+        """Apply unread count changes, keyed by (user_id, priority), to the per-user counters"""
+        per_user = {}
+        for (user_id, priority), delta in deltas.items():
+            if delta:
+                increments = per_user.setdefault(user_id, {"unread": 0, "version": 1})
+                increments["unread"] += delta
+                field = f"unread_by_priority.{getattr(priority, 'value', priority)}"
+                increments[field] = increments.get(field, 0) + delta
+        if not per_user:
+            return
+        now = datetime.utcnow()
+        await self.db.notification_counters.bulk_write([
+            UpdateOne({"user_id": user_id}, {"$inc": increments, "$set": {"updated_at": now}}, upsert=True)
+            for user_id, increments in per_user.items()
+        ], ordered=False)
+
+    async def rebuild_unread_counter(self, user_id: str) -> dict:
+        """Recompute a user's counter from their notifications (users who predate counters).
+
+        Every adjustment bumps the counter's `version`, so the recount is only
+        stored if nothing changed the counter while it was being computed;
+        otherwise it is redone.
+        """
+        for _ in range(COUNTER_REBUILD_ATTEMPTS):
+            current = await self.db.notification_counters.find_one({"user_id": user_id}, {"_id": 0, "version": 1})
+            # Counters written before versioning have no version yet
+            version = (current or {}).get("version", {"$exists": False})
+            groups = await self.db.enhanced_notifications.aggregate([
+                {"$match": {"user_id": user_id, "is_read": False}},
+                {"$group": {"_id": "$priority", "count": {"$sum": 1}}}
+            ]).to_list(length=None)
+            by_priority = {getattr(group["_id"], "value", group["_id"]): group["count"] for group in groups}
+            counter = {
+                "user_id": user_id,
+                "unread": sum(by_priority.values()),
+                "unread_by_priority": by_priority,
+                "initialized": True,
+                "updated_at": datetime.utcnow()
+            }
+            try:
+                # A counter created meanwhile makes the upsert collide on the unique user_id
+                result = await self.db.notification_counters.update_one(
+                    {"user_id": user_id, "version": version},
+                    {"$set": counter, "$inc": {"version": 1}},
+                    upsert=True
+                )
+            except DuplicateKeyError:
+                continue
+            if result.matched_count or result.upserted_id is not None:
+                return counter
+        logger.warning(f"Unread counter of user {user_id} kept changing during rebuild; will retry on next read")
+        return counter
+
+    async def get_unread_counts(self, user_id: str) -> dict:
+        """Unread total and per-priority counts for badges: a single point lookup"""
+        counter = await self.db.notification_counters.find_one({"user_id": user_id}, {"_id": 0})
+        if not counter or not counter.get("initialized"):
+            counter = await self.rebuild_unread_counter(user_id)
+        by_priority = counter.get("unread_by_priority", {})
+        return {
+            "unread": max(counter.get("unread", 0), 0),
+            "unread_by_priority": {priority.value: max(by_priority.get(priority.value, 0), 0) for priority in NotificationPriority}
+        }
+
+    async def expire_notifications(self) -> int:
+        """Purge notifications past their expiry, taking unread ones out of the counters.
+
+        This sweep, rather than a TTL index, does the purge: a TTL delete would
+        bypass the unread counters. Reads no longer filter on `expires_at`, so
+        an expired notification stays visible until the next sweep.
+        """
+        now = datetime.utcnow()
+        counted = {"expires_at": {"$lt": now}, "is_read": False}
+        unread_groups = await self.db.enhanced_notifications.aggregate([
+            {"$match": counted},
+            {"$group": {"_id": {"user_id": "$user_id", "priority": "$priority"}}}
+        ]).to_list(length=None)
+        
+        deltas = {}
+        purged = 0
+        for group in unread_groups:
+            user_id, priority = group["_id"]["user_id"], group["_id"]["priority"]
+            # Each notification is deleted once, so deleted_count is exactly what to decrement
+            result = await self.db.enhanced_notifications.delete_many({"user_id": user_id, "priority": priority, **counted})
+            deltas[(user_id, priority)] = -result.deleted_count
+            purged += result.deleted_count
+        await self._adjust_unread(deltas)
+        
+        # Read ones no longer count anywhere
+        result = await self.db.enhanced_notifications.delete_many({"expires_at": {"$lt": now}})
+        return purged + result.deleted_count
+
+    async def archive_read_notifications(self, batch_size: int = 1000) -> int:
+        """Move read notifications older than the retention window to the archive collection"""
+        cutoff = datetime.utcnow() - timedelta(days=self.read_retention_days)
+        archived = 0
+        while True:
+            notifications = await self.db.enhanced_notifications.find(
+                {"is_read": True, "created_at": {"$lt": cutoff}}, {"_id": 0}
+            ).limit(batch_size).to_list(length=batch_size)
+            if not notifications:
+                return archived
+            now = datetime.utcnow()
+            # Upserts keep a batch interrupted before its delete safe to copy again
+            await self.db.enhanced_notifications_archive.bulk_write([
+                ReplaceOne({"id": notification["id"]}, {**notification, "archived_at": now}, upsert=True)
+                for notification in notifications
+            ], ordered=False)
+            await self.db.enhanced_notifications.delete_many(
+                {"id": {"$in": [notification["id"] for notification in notifications]}, "is_read": True}
+            )
+            archived += len(notifications)
 
     async def get_user_notifications(
         self,
         user_id: str,
         limit: int = 50,
-        skip: int = 0,
+        cursor: Optional[str] = None,
         only_unread: bool = False,
         priority_filter: Optional[NotificationPriority] = None
     ) -> dict:
-        """Get enhanced notifications for a user"""
+        """One page of a user's feed, newest first; `next_cursor` fetches the following page"""
         query = {"user_id": user_id}
         
         if only_unread:
@@ -322,30 +677,26 @@ class EnhancedNotificationService:
         if priority_filter:
             query["priority"] = priority_filter
         
-        # Filter out expired notifications
-        now = datetime.utcnow()
-        query["$or"] = [
-            {"expires_at": None},
-            {"expires_at": {"$gte": now}}
-        ]
+        # Keyset pagination: resumes after the last notification seen, however deep the page
+        if cursor:
+            created_at, notification_id = decode_feed_cursor(cursor)
+            query["$or"] = [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "id": {"$lt": notification_id}}
+            ]
         
-        notifications_cursor = self.db.enhanced_notifications.find(query).sort("created_at", -1).skip(skip).limit(limit)
-        notifications = await notifications_cursor.to_list(length=limit)
+        # Expired notifications are purged by the sweep, so no expiry filter: (user_id, created_at, id) serves this
+        notifications = await self.db.enhanced_notifications.find(query, FEED_PROJECTION).sort(
+            [("created_at", -1), ("id", -1)]
+        ).limit(limit).to_list(length=limit)
         
-        total_unread = await self.db.enhanced_notifications.count_documents({
-            "user_id": user_id,
-            "is_read": False,
-            "$or": [
-                {"expires_at": None},
-                {"expires_at": {"$gte": now}}
-            ]
-        })
+        unread_counts = await self.get_unread_counts(user_id)
         
         return {
             "notifications": self._serialize_notifications(notifications),
-            "total_unread": total_unread,
-            "limit": limit,
-            "skip": skip
+            "next_cursor": encode_feed_cursor(notifications[-1]) if len(notifications) == limit else None,
+            "total_unread": unread_counts["unread"],
+            "limit": limit
         }
 
     def _serialize_notifications(self, notifications: list) -> list:
@@ -365,62 +716,66 @@ class EnhancedNotificationService:
 
     async def mark_as_read(self, notification_id: str, user_id: str) -> bool:
         """Mark notification as read"""
-        result = await self.db.enhanced_notifications.update_one(
-            {"id": notification_id, "user_id": user_id},
-            {"$set": {"is_read": True, "read_at": datetime.utcnow()}}
+        notification = await self.db.enhanced_notifications.find_one_and_update(
+            {"id": notification_id, "user_id": user_id, "is_read": False},
+            {"$set": {"is_read": True, "read_at": datetime.utcnow()}},
+            projection={"priority": 1},
+            return_document=ReturnDocument.BEFORE
         )
-        return result.modified_count > 0
+        if not notification:
+            return False
+        await self._adjust_unread({(user_id, notification["priority"]): -1})
+        return True
 
     async def mark_all_as_read(self, user_id: str) -> int:
         """Mark all notifications as read for a user"""
-        result = await self.db.enhanced_notifications.update_many(
-            {"user_id": user_id, "is_read": False},
-            {"$set": {"is_read": True, "read_at": datetime.utcnow()}}
-        )
-        return result.modified_count
+        now = datetime.utcnow()
+        deltas = {}
+        marked = 0
+        # One update per priority, so each modified_count is exactly what that counter loses
+        for priority in NotificationPriority:
+            result = await self.db.enhanced_notifications.update_many(
+                {"user_id": user_id, "is_read": False, "priority": priority.value},
+                {"$set": {"is_read": True, "read_at": now}}
+            )
+            deltas[(user_id, priority)] = -result.modified_count
+            marked += result.modified_count
+        await self._adjust_unread(deltas)
+        return marked
 
     async def delete_notification(self, notification_id: str, user_id: str) -> bool:
         """Delete a notification"""
-        result = await self.db.enhanced_notifications.delete_one({
-            "id": notification_id,
-            "user_id": user_id
-        })
-        return result.deleted_count > 0
+        notification = await self.db.enhanced_notifications.find_one_and_delete(
+            {"id": notification_id, "user_id": user_id},
+            projection={"priority": 1, "is_read": 1}
+        )
+        if not notification:
+            return False
+        if not notification.get("is_read"):
+            await self._adjust_unread({(user_id, notification["priority"]): -1})
+        return True
 
     async def get_notification_stats(self, user_id: str) -> dict:
-        """Get notification statistics for a user"""
-        now = datetime.utcnow()
-        
-        total_notifications = await self.db.enhanced_notifications.count_documents({
-            "user_id": user_id,
-            "$or": [
-                {"expires_at": None},
-                {"expires_at": {"$gte": now}}
-            ]
-        })
-        
-        unread_notifications = await self.db.enhanced_notifications.count_documents({
-            "user_id": user_id,
-            "is_read": False,
-            "$or": [
-                {"expires_at": None},
-                {"expires_at": {"$gte": now}}
-            ]
-        })
+        """Get notification statistics for a user in a single aggregation"""
+        # Covered by the (user_id, is_read, priority) index
+        groups = await self.db.enhanced_notifications.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$group": {
+                "_id": {"is_read": "$is_read", "priority": "$priority"},
+                "count": {"$sum": 1}
+            }}
+        ]).to_list(length=None)
         
-        # Count by priority
-        priority_counts = {}
-        for priority in NotificationPriority:
-            count = await self.db.enhanced_notifications.count_documents({
-                "user_id": user_id,
-                "priority": priority,
-                "is_read": False,
-                "$or": [
-                    {"expires_at": None},
-                    {"expires_at": {"$gte": now}}
-                ]
-            })
-            priority_counts[priority] = count
+        total_notifications = 0
+        unread_notifications = 0
+        priority_counts = {priority: 0 for priority in NotificationPriority}
+        for group in groups:
+            total_notifications += group["count"]
+            if not group["_id"].get("is_read"):
+                unread_notifications += group["count"]
+                priority = group["_id"].get("priority")
+                if priority in priority_counts:
+                    priority_counts[NotificationPriority(priority)] += group["count"]
         
         return {
             "total_notifications": total_notifications,
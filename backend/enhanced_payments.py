@@ -3,13 +3,13 @@ import os
 import json
 import hmac
 import hashlib
-import requests
 from datetime import datetime, timedelta
 from typing import Optional, Dict, List
 from enum import Enum
 import uuid
 import logging
 from motor.motor_asyncio import AsyncIOMotorClient
+from payment_gateway import get_gateway_client
 
 logger = logging.getLogger(__name__)
 
@@ -36,14 +36,17 @@ class RefundStatus(str, Enum):
     DENIED = "denied"
 
 class EnhancedPaymentService:
-    def __init__(self, db_client):
+    def __init__(self, db_client, notification_service=None):
         self.db = db_client.driving_school_platform
+        # The application's shared service, so payment notifications also reach open streams
+        self.notification_service = notification_service
         
         # BaridiMob Configuration
         self.baridimob_api_key = os.environ.get('BARIDIMOB_API_KEY')
         self.baridimob_secret = os.environ.get('BARIDIMOB_SECRET')
         self.baridimob_merchant_id = os.environ.get('BARIDIMOB_MERCHANT_ID')
         self.baridimob_base_url = os.environ.get('BARIDIMOB_BASE_URL', 'https://api.baridimob.dz')
+        self.baridimob = get_gateway_client("baridimob", self.baridimob_base_url)
         
         # CCP Configuration  
         self.ccp_api_key = os.environ.get('CCP_API_KEY')
@@ -159,28 +162,18 @@ class EnhancedPaymentService:
                 "Content-Type": "application/json"
             }
             
-            response = requests.post(
-                f"{self.baridimob_base_url}/v1/payments",
-                json=payload,
-                headers=headers,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                return {
-                    "payment_id": data.get("payment_id"),
-                    "payment_url": data.get("payment_url"),
-                    "reference": data.get("reference"),
-                    "expires_at": data.get("expires_at")
-                }
-            else:
-                logger.error(f"BaridiMob payment creation failed: {response.text}")
-                raise Exception("Failed to create BaridiMob payment")
+            # The order id doubles as idempotency key, so a retried attempt cannot create a second payment
+            data = await self.baridimob.post("/v1/payments", payload, headers, idempotency_key=payment_doc["id"])
+            return {
+                "payment_id": data.get("payment_id"),
+                "payment_url": data.get("payment_url"),
+                "reference": data.get("reference"),
+                "expires_at": data.get("expires_at")
+            }
                 
         except Exception as e:
             logger.error(f"BaridiMob API error: {str(e)}")
-            # Fallback to simulation
+            # Fallback to simulation, immediately while the circuit is open
             return {
                 "error": "BaridiMob service unavailable",
                 "simulation": True,
@@ -327,7 +320,9 @@ class EnhancedPaymentService:
         """Send payment-related notifications"""
         from enhanced_notifications import EnhancedNotificationService, NotificationPriority, NotificationChannel
         
-        notification_service = EnhancedNotificationService(self.db._client)
+        if self.notification_service is None:
+            self.notification_service = EnhancedNotificationService(self.db._client)
+        notification_service = self.notification_service
         
         if notification_type == "payment_completed":
             await notification_service.create_notification(
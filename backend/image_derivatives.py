@@ -0,0 +1,142 @@
+# Image Derivative Pipeline for Driving School Platform
+import os
+import asyncio
+import logging
+from pathlib import Path
+from urllib.parse import urlsplit
+from typing import Optional, Dict
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels for each variant, smallest first
+DERIVATIVE_SIZES = {
+    "thumbnail": 160,
+    "card": 480,
+    "full": 1600
+}
+
+IMAGE_EXTENSIONS = {"jpg", "jpeg", "png", "webp", "gif", "bmp", "tif", "tiff"}
+
+JPEG_QUALITY = int(os.environ.get('IMAGE_DERIVATIVE_QUALITY', '82'))
+
+def is_image_url(file_url: str) -> bool:
+    """Check if a stored file URL points at an image we can derive variants from"""
+    if not file_url or '.' not in file_url:
+        return False
+    return file_url.split('?')[0].rsplit('.', 1)[-1].lower() in IMAGE_EXTENSIONS
+
+def is_cloudinary_url(file_url: str) -> bool:
+    """Check if a URL is an https delivery URL of our Cloudinary account (not merely one mentioning it)"""
+    parts = urlsplit(file_url or "")
+    if parts.scheme != "https" or parts.netloc != "res.cloudinary.com":
+        return False
+    cloud_name = os.environ.get('CLOUDINARY_CLOUD_NAME')
+    return not cloud_name or parts.path.startswith(f"/{cloud_name}/")
+
+def derivative_url(file_url: str, variant: str) -> str:
+    """URL of a variant stored next to a local original (photo.jpg -> photo.card.jpg)"""
+    base = file_url.rsplit('.', 1)[0]
+    return f"{base}.{variant}.jpg"
+
+def cloudinary_derivative_url(file_url: str, variant: str) -> str:
+    """Cloudinary delivery URL resized and compressed on the fly for a variant"""
+    size = DERIVATIVE_SIZES[variant]
+    return file_url.replace("/upload/", f"/upload/w_{size},h_{size},c_limit,q_auto,f_auto/", 1)
+
+def select_variant(derivatives: Optional[Dict], width: int) -> Optional[str]:
+    """Pick the smallest variant covering the requested display width"""
+    if not derivatives:
+        return None
+    for variant, size in DERIVATIVE_SIZES.items():
+        if size >= width and derivatives.get(variant):
+            return derivatives[variant]
+    return derivatives.get("full")
+
+def render_derivatives(source_path: str) -> Dict[str, str]:
+    """Resize and compress an image into every variant (runs in a worker process)"""
+    written = {}
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "L"):
+            # Flatten transparency onto white for JPEG output
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            rgba = image.convert("RGBA")
+            background.paste(rgba, mask=rgba.split()[-1])
+            image = background
+
+        # Largest first so each smaller variant resamples fewer pixels
+        for variant, size in sorted(DERIVATIVE_SIZES.items(), key=lambda item: -item[1]):
+            image.thumbnail((size, size), Image.LANCZOS)
+            target_path = derivative_url(source_path, variant)
+            temp_path = f"{target_path}.tmp"
+            image.save(temp_path, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+            os.replace(temp_path, target_path)
+            written[variant] = target_path
+    return written
+
+class ImageDerivativePipeline:
+    def __init__(self, uploads_dir: Path, url_prefix: str = "/demo-uploads", max_workers: Optional[int] = None):
+        self.uploads_dir = Path(uploads_dir)
+        self.url_prefix = url_prefix
+        self.max_workers = max_workers or int(os.environ.get('IMAGE_WORKERS', str(os.cpu_count() or 2)))
+        self._executor = None
+        self._tasks = set()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def local_path(self, file_url: str) -> Optional[Path]:
+        """Map a /demo-uploads URL to its file on disk"""
+        if not file_url.startswith(f"{self.url_prefix}/"):
+            return None
+        return self.uploads_dir / file_url[len(self.url_prefix) + 1:].split('?')[0]
+
+    async def generate(self, file_url: str) -> Optional[Dict[str, str]]:
+        """Generate all variants of an uploaded image and return their URLs"""
+        if not is_image_url(file_url):
+            return None
+
+        if is_cloudinary_url(file_url):
+            # Cloudinary derives variants itself from transformation URLs
+            return {variant: cloudinary_derivative_url(file_url, variant) for variant in DERIVATIVE_SIZES}
+
+        source_path = self.local_path(file_url)
+        if source_path is None or not source_path.exists():
+            logger.warning(f"Cannot derive variants, original not found: {file_url}")
+            return None
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, render_derivatives, str(source_path.resolve()))
+        return {variant: derivative_url(file_url, variant) for variant in DERIVATIVE_SIZES}
+
+    def schedule(self, file_url: str, on_complete) -> None:
+        """Generate variants in the background and hand their URLs to `on_complete`"""
+        if not is_image_url(file_url):
+            return
+
+        async def run():
+            try:
+                derivatives = await self.generate(file_url)
+                if derivatives:
+                    await on_complete(file_url, derivatives)
+            except Exception as e:
+                logger.error(f"Image derivative generation failed for {file_url}: {str(e)}")
+
+        self.submit(run())
+
+    def submit(self, coroutine) -> None:
+        """Run a derivative job in the background"""
+        task = asyncio.create_task(coroutine)
+        # Keep a reference so the task is not garbage-collected mid-flight
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,351 @@
+# Notification Outbox for Driving School Platform
+import os
+import time
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Callable, Awaitable
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+class OutboxStatus:
+    PENDING = "pending"
+    PROCESSING = "processing"
+    DELIVERED = "delivered"
+    DEAD = "dead"
+
+def parse_rate_limits(value: str) -> Dict[str, float]:
+    """`email=10,sms=5` -> messages per second per channel"""
+    limits = {}
+    for item in value.split(','):
+        channel, _, rate = item.partition('=')
+        if channel.strip() and rate.strip():
+            limits[channel.strip()] = float(rate)
+    return limits
+
+class ChannelRateLimiter:
+    """Token bucket per channel, shared by every outbox worker of this process"""
+
+    def __init__(self, rates: Dict[str, float]):
+        self.rates = rates
+        self._tokens: Dict[str, float] = {}
+        self._updated: Dict[str, float] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def acquire(self, channel: str):
+        rate = self.rates.get(channel)
+        if not rate:
+            return
+        async with self._locks.setdefault(channel, asyncio.Lock()):
+            while True:
+                now = time.monotonic()
+                tokens = self._tokens.get(channel, rate)
+                tokens = min(rate, tokens + (now - self._updated.get(channel, now)) * rate)
+                self._updated[channel] = now
+                if tokens >= 1:
+                    self._tokens[channel] = tokens - 1
+                    return
+                self._tokens[channel] = tokens
+                await asyncio.sleep((1 - tokens) / rate)
+
+class NotificationOutbox:
+    """Durable delivery queue for notification channels.
+
+    Request handlers only insert jobs into `notification_outbox`, one per
+    notification channel; background workers claim them with a lease, deliver
+    channels concurrently under per-channel rate limits, and retry failures
+    with exponential backoff until they are dead-lettered.
+
+    Workers claim due jobs in batches; plain jobs of a batch go to
+    `deliver_batch` together, so lookups and SMTP sends are shared.
+
+    Jobs given a digest key wait out the digest window; the worker that claims
+    one also claims every other job of the same key that is due within the
+    window and hands them to `deliver_digest` together, as one message.
+    """
+
+    def __init__(
+        self,
+        db,
+        deliver: Callable[[dict], Awaitable[bool]],
+        on_dead_letter: Optional[Callable[[dict, str], Awaitable[None]]] = None,
+        deliver_digest: Optional[Callable[[List[dict]], Awaitable[bool]]] = None,
+        deliver_batch: Optional[Callable[[List[dict]], Awaitable[List[object]]]] = None
+    ):
+        self.db = db
+        self.deliver = deliver
+        self.on_dead_letter = on_dead_letter
+        self.deliver_digest = deliver_digest
+        self.deliver_batch = deliver_batch
+        self.concurrency = int(os.environ.get('NOTIFICATION_WORKERS', '8'))
+        self.poll_interval = float(os.environ.get('NOTIFICATION_POLL_SECONDS', '2'))
+        self.max_attempts = int(os.environ.get('NOTIFICATION_MAX_ATTEMPTS', '6'))
+        self.lease_seconds = 120
+        self.claim_batch = int(os.environ.get('NOTIFICATION_CLAIM_BATCH', '50'))
+        # 0 turns digesting off
+        self.digest_window = float(os.environ.get('NOTIFICATION_DIGEST_SECONDS', '300'))
+        self.rate_limiter = ChannelRateLimiter(
+            parse_rate_limits(os.environ.get('NOTIFICATION_RATE_LIMITS', 'email=10,sms=5,push=50'))
+        )
+        self._workers = []
+        self._wakeup = asyncio.Event()
+        self._stats = {"delivered_total": 0, "retried_total": 0, "dead_total": 0, "digested_total": 0}
+
+    @property
+    def digesting(self) -> bool:
+        return self.digest_window > 0 and self.deliver_digest is not None
+
+    def build_jobs(
+        self,
+        notification_id: str,
+        channels: List[str],
+        deliver_at: Optional[datetime] = None,
+        digest_key: Optional[str] = None
+    ) -> List[dict]:
+        """One job per channel; jobs with a `digest_key` (e.g. the user id) are coalesced per channel"""
+        now = datetime.utcnow()
+        digest = digest_key is not None and self.digesting
+        next_attempt_at = deliver_at or now
+        if digest:
+            next_attempt_at += timedelta(seconds=self.digest_window)
+        jobs = []
+        for channel in channels:
+            # Plain value: channels may arrive as str enums
+            channel = getattr(channel, "value", channel)
+            jobs.append({
+                "id": str(uuid.uuid4()),
+                "notification_id": notification_id,
+                "channel": channel,
+                "digest_key": f"{digest_key}:{channel}" if digest else None,
+                "status": OutboxStatus.PENDING,
+                "attempts": 0,
+                "last_error": None,
+                "enqueued_at": now,
+                "next_attempt_at": next_attempt_at,
+                "locked_until": None
+            })
+        return jobs
+
+    async def enqueue(
+        self,
+        notification_id: str,
+        channels: List[str],
+        deliver_at: Optional[datetime] = None,
+        digest_key: Optional[str] = None
+    ):
+        """Queue delivery of a notification; `deliver_at` defers it (scheduled notifications)"""
+        await self.enqueue_jobs(self.build_jobs(notification_id, channels, deliver_at, digest_key))
+
+    async def enqueue_jobs(self, jobs: List[dict]):
+        if not jobs:
+            return
+        await self.db.notification_outbox.insert_many(jobs, ordered=False)
+        self._wakeup.set()
+
+    def start(self):
+        if self._workers:
+            return
+        self._workers = [asyncio.create_task(self._worker_loop()) for _ in range(self.concurrency)]
+        logger.info(f"Notification outbox started with {self.concurrency} workers")
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _claim_jobs(self) -> List[dict]:
+        """Claim up to `claim_batch` due jobs in three round trips, whatever the batch size"""
+        now = datetime.utcnow()
+        due = {
+            "$or": [
+                {"status": OutboxStatus.PENDING, "next_attempt_at": {"$lte": now}},
+                # Jobs held by a worker that died
+                {"status": OutboxStatus.PROCESSING, "locked_until": {"$lt": now}}
+            ]
+        }
+        candidates = await self.db.notification_outbox.find(due, {"_id": 0, "id": 1}).sort(
+            "next_attempt_at", 1
+        ).limit(self.claim_batch).to_list(length=self.claim_batch)
+        if not candidates:
+            return []
+        
+        # The due filter again: jobs another worker claimed meanwhile are left alone
+        claim = str(uuid.uuid4())
+        await self.db.notification_outbox.update_many(
+            {"id": {"$in": [candidate["id"] for candidate in candidates]}, **due},
+            {"$set": {
+                "status": OutboxStatus.PROCESSING,
+                "locked_until": now + timedelta(seconds=self.lease_seconds),
+                "claim": claim
+            }}
+        )
+        return await self.db.notification_outbox.find({"claim": claim}).to_list(length=None)
+
+    async def _claim_digest(self, job: dict) -> List[dict]:
+        """Claim the other jobs of a digest, up to those due one window from now"""
+        now = datetime.utcnow()
+        # A fresh claim id, so jobs left over from an earlier attempt of this digest are not picked up
+        claim = str(uuid.uuid4())
+        await self.db.notification_outbox.update_many(
+            {
+                "digest_key": job["digest_key"],
+                "status": OutboxStatus.PENDING,
+                "next_attempt_at": {"$lte": now + timedelta(seconds=self.digest_window)},
+                "id": {"$ne": job["id"]}
+            },
+            {"$set": {
+                "status": OutboxStatus.PROCESSING,
+                "locked_until": now + timedelta(seconds=self.lease_seconds),
+                "claim": claim
+            }}
+        )
+        return await self.db.notification_outbox.find({"claim": claim}).to_list(length=None)
+
+    async def _worker_loop(self):
+        while True:
+            try:
+                jobs = await self._claim_jobs()
+                if not jobs:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._process_jobs(jobs)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Notification outbox worker error: {str(e)}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _process_jobs(self, jobs: List[dict]):
+        digests: Dict[str, List[dict]] = {}
+        plain = []
+        for job in jobs:
+            if job.get("digest_key") and self.digesting:
+                digests.setdefault(job["digest_key"], []).append(job)
+            else:
+                plain.append(job)
+        
+        if len(plain) > 1 and self.deliver_batch is not None:
+            await self._process_batch(plain)
+        else:
+            for job in plain:
+                await self._process_job(job)
+        # Jobs of one digest claimed in the same batch travel together
+        for digest_jobs in digests.values():
+            await self._process_job(digest_jobs[0], digest_jobs[1:])
+
+    async def _process_batch(self, jobs: List[dict]):
+        for job in jobs:
+            await self.rate_limiter.acquire(job["channel"])
+        try:
+            # One result per job: True/False are final, exceptions are retried
+            results = await self.deliver_batch(jobs)
+        except Exception as e:
+            results = [e] * len(jobs)
+        
+        now = datetime.utcnow()
+        updates = []
+        dead_letters = []
+        for job, result in zip(jobs, results):
+            if isinstance(result, Exception):
+                fields = self._failure_fields(job, result)
+                if fields["status"] == OutboxStatus.DEAD:
+                    dead_letters.append((job, str(result)))
+            else:
+                fields = {"status": OutboxStatus.DELIVERED, "delivered": result, "delivered_at": now, "locked_until": None}
+                self._stats["delivered_total"] += 1
+            updates.append(UpdateOne({"id": job["id"]}, {"$set": fields}))
+        await self.db.notification_outbox.bulk_write(updates, ordered=False)
+        
+        if self.on_dead_letter:
+            for job, error in dead_letters:
+                await self.on_dead_letter(job, error)
+
+    def _failure_fields(self, job: dict, error: Exception, count: int = 1) -> dict:
+        """Retry with exponential backoff, or dead-letter once attempts run out"""
+        attempts = job["attempts"] + 1
+        dead = attempts >= self.max_attempts
+        if dead:
+            self._stats["dead_total"] += count
+            logger.error(f"Notification {job['notification_id']} via {job['channel']} dead-lettered: {str(error)}")
+        else:
+            self._stats["retried_total"] += count
+            logger.warning(f"Notification {job['notification_id']} via {job['channel']} failed (attempt {attempts}): {str(error)}")
+        return {
+            "status": OutboxStatus.DEAD if dead else OutboxStatus.PENDING,
+            "attempts": attempts,
+            "last_error": str(error),
+            "next_attempt_at": datetime.utcnow() + timedelta(seconds=min(2 ** attempts * 5, 3600)),
+            "locked_until": None
+        }
+
+    async def _process_job(self, job: dict, siblings: Optional[List[dict]] = None):
+        jobs = [job, *(siblings or [])]
+        if job.get("digest_key") and self.digesting:
+            jobs += await self._claim_digest(job)
+        job_ids = [claimed["id"] for claimed in jobs]
+
+        # A digest is one message, so it takes one token
+        await self.rate_limiter.acquire(job["channel"])
+        try:
+            # False is a final outcome (recorded by `deliver`); exceptions are retried
+            delivered = await (self.deliver(job) if len(jobs) == 1 else self.deliver_digest(jobs))
+        except Exception as e:
+            # A digest is retried as a whole, on the schedule of the job that led it
+            fields = self._failure_fields(job, e, len(jobs))
+            await self.db.notification_outbox.update_many({"id": {"$in": job_ids}}, {"$set": fields})
+            if fields["status"] == OutboxStatus.DEAD and self.on_dead_letter:
+                for dead_job in jobs:
+                    await self.on_dead_letter(dead_job, str(e))
+            return
+
+        await self.db.notification_outbox.update_many(
+            {"id": {"$in": job_ids}},
+            {"$set": {
+                "status": OutboxStatus.DELIVERED,
+                "delivered": delivered,
+                "delivered_at": datetime.utcnow(),
+                "locked_until": None
+            }}
+        )
+        self._stats["delivered_total"] += len(jobs)
+        if len(jobs) > 1:
+            self._stats["digested_total"] += len(jobs)
+
+    async def requeue_dead_letters(self, channel: Optional[str] = None) -> int:
+        """Give dead-lettered jobs a fresh set of attempts"""
+        query = {"status": OutboxStatus.DEAD}
+        if channel:
+            query["channel"] = channel
+        result = await self.db.notification_outbox.update_many(
+            query,
+            {"$set": {"status": OutboxStatus.PENDING, "attempts": 0, "next_attempt_at": datetime.utcnow()}}
+        )
+        self._wakeup.set()
+        return result.modified_count
+
+    async def get_metrics(self) -> Dict:
+        """Outbox backlog, dead letters and delivery lag"""
+        now = datetime.utcnow()
+        due = await self.db.notification_outbox.count_documents(
+            {"status": {"$in": [OutboxStatus.PENDING, OutboxStatus.PROCESSING]}, "next_attempt_at": {"$lte": now}}
+        )
+        dead = await self.db.notification_outbox.count_documents({"status": OutboxStatus.DEAD})
+        oldest = await self.db.notification_outbox.find_one(
+            {"status": OutboxStatus.PENDING, "next_attempt_at": {"$lte": now}},
+            sort=[("next_attempt_at", 1)]
+        )
+        return {
+            "workers": len(self._workers),
+            "digest_window_seconds": self.digest_window if self.digesting else 0,
+            "due_jobs": due,
+            "dead_letters": dead,
+            "oldest_due_seconds": (now - oldest["next_attempt_at"]).total_seconds() if oldest else 0,
+            **self._stats
+        }
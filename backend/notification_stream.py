@@ -0,0 +1,186 @@
+# Notification Streaming for Driving School Platform
+import os
+import json
+import asyncio
+import logging
+from enum import Enum
+from datetime import datetime
+from typing import Dict, Set, Callable, AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    return str(value)
+
+class LocalBroker:
+    """Fan-out within this process; enough for a single worker"""
+
+    def __init__(self):
+        # Nobody is connected before the hub starts
+        self.on_message = lambda message: None
+
+    async def start(self, on_message: Callable[[dict], None]):
+        self.on_message = on_message
+
+    async def publish(self, message: dict):
+        self.on_message(message)
+
+    async def publish_many(self, messages: list):
+        for message in messages:
+            self.on_message(message)
+
+    async def stop(self):
+        pass
+
+class RedisBroker:
+    """Fan-out across workers through Redis pub/sub (needs the `redis` package)"""
+
+    def __init__(self, url: str, channel: str = "notifications"):
+        self.url = url
+        self.channel = channel
+        self.client = None
+        self._reader = None
+
+    async def start(self, on_message: Callable[[dict], None]):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(self.url)
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        await self.pubsub.subscribe(self.channel)
+        self._reader = asyncio.create_task(self._read(on_message))
+
+    async def _read(self, on_message: Callable[[dict], None]):
+        while True:
+            try:
+                async for message in self.pubsub.listen():
+                    if message["type"] == "message":
+                        on_message(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Notification broker read error: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def publish(self, message: dict):
+        await self.client.publish(self.channel, json.dumps(message))
+
+    async def publish_many(self, messages: list):
+        # One round trip for the whole batch
+        async with self.client.pipeline(transaction=False) as pipe:
+            for message in messages:
+                pipe.publish(self.channel, json.dumps(message))
+            await pipe.execute()
+
+    async def stop(self):
+        if self._reader is not None:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+            await self.pubsub.close()
+            await self.client.close()
+            self._reader = None
+
+class NotificationHub:
+    """Pushes notifications to the connected clients of each user.
+
+    Every worker keeps its own connections; publishing goes through the
+    broker so a notification created on one worker reaches a user connected
+    to another. Each connection has a bounded queue: a client that stops
+    reading loses its oldest events instead of growing memory.
+    """
+
+    def __init__(self, broker=None, queue_size: int = 100):
+        self.broker = broker or LocalBroker()
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._stats = {"published_total": 0, "dropped_total": 0, "failed_total": 0}
+
+    async def start(self):
+        await self.broker.start(self._dispatch)
+
+    async def stop(self):
+        await self.broker.stop()
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def _message(self, user_id: str, payload: dict, event: str) -> dict:
+        payload = {key: value for key, value in payload.items() if key != "_id"}
+        # Serialised once, whatever the number of connections
+        return {
+            "user_id": user_id,
+            "event": event,
+            "id": payload.get("id"),
+            "data": json.dumps(payload, default=_json_default)
+        }
+
+    async def publish(self, user_id: str, payload: dict, event: str = "notification"):
+        """Send an event to every connection of a user, on any worker"""
+        await self._publish([self._message(user_id, payload, event)])
+
+    async def publish_many(self, notifications: list, event: str = "notification"):
+        """Publish stored notifications, each to its own user"""
+        if notifications:
+            await self._publish([
+                self._message(notification["user_id"], notification, event) for notification in notifications
+            ])
+
+    async def _publish(self, messages: list):
+        # The notification is already stored: a broker outage only costs the live push
+        try:
+            await self.broker.publish_many(messages)
+            self._stats["published_total"] += len(messages)
+        except Exception as e:
+            self._stats["failed_total"] += len(messages)
+            logger.error(f"Failed to publish notifications: {str(e)}")
+
+    def _dispatch(self, message: dict):
+        for queue in self._subscribers.get(message["user_id"], ()):
+            if queue.full():
+                queue.get_nowait()
+                self._stats["dropped_total"] += 1
+            queue.put_nowait(message)
+
+    async def stream(self, user_id: str, heartbeat_seconds: float = 15) -> AsyncIterator[str]:
+        """Server-Sent Events for one connection, with keep-alive comments"""
+        queue = self.subscribe(user_id)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                event_id = f"id: {message['id']}\n" if message.get("id") else ""
+                yield f"{event_id}event: {message['event']}\ndata: {message['data']}\n\n"
+        finally:
+            self.unsubscribe(user_id, queue)
+
+    def get_metrics(self) -> Dict:
+        return {
+            "broker": type(self.broker).__name__,
+            "connected_users": len(self._subscribers),
+            "connections": sum(len(queues) for queues in self._subscribers.values()),
+            **self._stats
+        }
+
+def create_notification_hub() -> NotificationHub:
+    """Redis fan-out when NOTIFICATION_BROKER_URL is set, otherwise in-process only.
+
+    Redis is optional: deployments running several workers install `redis>=5.0.1`.
+    """
+    broker_url = os.environ.get('NOTIFICATION_BROKER_URL')
+    return NotificationHub(RedisBroker(broker_url) if broker_url else LocalBroker())
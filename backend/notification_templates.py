@@ -0,0 +1,267 @@
+# Notification Email Templates for Driving School Platform
+import os
+import html
+import base64
+from string import Formatter
+from collections import OrderedDict
+from email.header import Header
+from functools import lru_cache
+from typing import Dict, List, Optional, NamedTuple
+from smtp_transport import check_address
+
+DEFAULT_LANGUAGE = os.environ.get('NOTIFICATION_LANGUAGE', 'en')
+
+PRIORITY_COLORS = {
+    "low": "#28a745",
+    "medium": "#ffc107",
+    "high": "#fd7e14",
+    "urgent": "#dc3545"
+}
+
+# Metadata keys that mean nothing to the recipient
+HIDDEN_METADATA = {"internal_id", "system_data", "broadcast_id"}
+
+# Wording of the email layout; the Arabic subtitle is shared
+EMAIL_TEXT = {
+    "en": {
+        "direction": "ltr",
+        "subject": "🚗 {title} - Driving School Platform",
+        "platform": "🚗 Driving School Platform",
+        "priority": {"low": "Low Priority", "medium": "Medium Priority", "high": "High Priority", "urgent": "Urgent Priority"},
+        "details": "Additional Information:",
+        "open_dashboard": "Open Dashboard",
+        "view_notifications": "View Notifications",
+        "automated": "This is an automated message from the Driving School Platform",
+        "system": "🇩🇿 Algeria Driving Education System"
+    },
+    "fr": {
+        "direction": "ltr",
+        "subject": "🚗 {title} - Plateforme Auto-École",
+        "platform": "🚗 Plateforme Auto-École",
+        "priority": {"low": "Priorité basse", "medium": "Priorité moyenne", "high": "Priorité haute", "urgent": "Urgent"},
+        "details": "Informations complémentaires :",
+        "open_dashboard": "Ouvrir le tableau de bord",
+        "view_notifications": "Voir les notifications",
+        "automated": "Ceci est un message automatique de la Plateforme Auto-École",
+        "system": "🇩🇿 Système algérien de formation à la conduite"
+    },
+    "ar": {
+        "direction": "rtl",
+        "subject": "🚗 {title} - منصة مدارس تعليم القيادة",
+        "platform": "🚗 منصة مدارس تعليم القيادة",
+        "priority": {"low": "أولوية منخفضة", "medium": "أولوية متوسطة", "high": "أولوية عالية", "urgent": "عاجل"},
+        "details": "معلومات إضافية:",
+        "open_dashboard": "فتح لوحة التحكم",
+        "view_notifications": "عرض الإشعارات",
+        "automated": "هذه رسالة آلية من منصة مدارس تعليم القيادة",
+        "system": "🇩🇿 نظام تعليم القيادة في الجزائر"
+    }
+}
+
+# Call to action per notification type: (label key, dashboard path)
+TYPE_ACTIONS = {
+    "digest": ("view_notifications", "/dashboard"),
+}
+DEFAULT_ACTION = ("open_dashboard", "/dashboard")
+
+EMAIL_LAYOUT = """
+<!DOCTYPE html>
+<html dir="{direction}">
+<head>
+    <meta charset="utf-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{title}</title>
+</head>
+<body style="font-family: Arial, sans-serif; margin: 0; padding: 20px; background-color: #f4f4f4;">
+    <div style="max-width: 600px; margin: 0 auto; background-color: white; border-radius: 8px; overflow: hidden; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
+
+        <!-- Header -->
+        <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center;">
+            <h1 style="margin: 0; font-size: 28px;">{platform}</h1>
+            <p style="margin: 10px 0 0 0; opacity: 0.9;">مدرسة تعليم القيادة الجزائرية</p>
+        </div>
+
+        <!-- Priority Badge -->
+        <div style="padding: 20px; border-left: 4px solid {priority_color}; background-color: #f8f9fa;">
+            <div style="display: inline-block; background-color: {priority_color}; color: white; padding: 4px 12px; border-radius: 12px; font-size: 12px; font-weight: bold; text-transform: uppercase;">
+                {priority_label}
+            </div>
+        </div>
+
+        <!-- Content -->
+        <div style="padding: 30px;">
+            <h2 style="color: #333; margin-top: 0;">{title}</h2>
+            <p style="color: #666; line-height: 1.6; font-size: 16px;">{message}</p>
+
+            <!-- Metadata -->
+            {metadata}
+        </div>
+
+        <!-- CTA Button -->
+        <div style="padding: 0 30px 30px;">
+            <a href="{action_url}"
+               style="display: inline-block; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 12px 30px; text-decoration: none; border-radius: 25px; font-weight: bold;">
+                {action_label}
+            </a>
+        </div>
+
+        <!-- Footer -->
+        <div style="background-color: #f8f9fa; padding: 20px; text-align: center; color: #666; font-size: 14px;">
+            <p style="margin: 0;">{automated}</p>
+            <p style="margin: 5px 0 0 0;">{system}</p>
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+class CompiledTemplate:
+    """A template parsed once into literal text and slots; rendering is a single join"""
+
+    def __init__(self, parts: List[tuple]):
+        # (literal, slot or None) pairs, adjacent literals merged
+        self.parts = parts
+
+    @classmethod
+    def compile(cls, source: str) -> "CompiledTemplate":
+        return cls([(literal, slot or None) for literal, slot, _, _ in Formatter().parse(source)])
+
+    def bind(self, **values) -> "CompiledTemplate":
+        """Fill some slots now, leaving a smaller template for the values that vary"""
+        parts = []
+        pending = ""
+        for literal, slot in self.parts:
+            pending += literal
+            if slot in values:
+                pending += str(values[slot])
+            else:
+                parts.append((pending, slot))
+                pending = ""
+        if pending:
+            parts.append((pending, None))
+        return CompiledTemplate(parts)
+
+    def render(self, values: Dict[str, str]) -> str:
+        return "".join([literal + values[slot] if slot else literal for literal, slot in self.parts])
+
+_layout = CompiledTemplate.compile(EMAIL_LAYOUT)
+
+class RenderedEmail(NamedTuple):
+    subject: str  # RFC 2047 encoded header value
+    body: bytes  # base64 encoded HTML, CRLF line endings
+
+@lru_cache(maxsize=None)
+def email_template(notification_type: str, language: str, priority: str) -> CompiledTemplate:
+    """The layout of a type, language and priority, with everything but the content filled in"""
+    text = EMAIL_TEXT.get(language) or EMAIL_TEXT["en"]
+    label_key, path = TYPE_ACTIONS.get(notification_type, DEFAULT_ACTION)
+    return _layout.bind(
+        direction=text["direction"],
+        platform=text["platform"],
+        priority_color=PRIORITY_COLORS.get(priority, "#007bff"),
+        priority_label=text["priority"].get(priority, priority),
+        action_url=f"{os.environ.get('FRONTEND_URL', 'http://localhost:3000')}{path}",
+        action_label=text[label_key],
+        automated=text["automated"],
+        system=text["system"]
+    )
+
+@lru_cache(maxsize=1024)
+def encode_subject(language: str, title: str) -> str:
+    """Subject header of an email; titles repeat across messages whose bodies differ"""
+    text = EMAIL_TEXT.get(language) or EMAIL_TEXT["en"]
+    # A line break in a title must not end the header and start another
+    title = " ".join(title.splitlines())
+    return Header(text["subject"].format(title=title), "utf-8").encode(linesep="\r\n")
+
+@lru_cache(maxsize=256)
+def _metadata_label(key: str) -> str:
+    return key.replace('_', ' ').title()
+
+def render_metadata(metadata: Optional[dict], language: str) -> str:
+    """Metadata block of an email, values escaped; empty when there is nothing to show"""
+    rows = [
+        f"<p style='margin: 5px 0; color: #6c757d;'><strong>{html.escape(_metadata_label(key))}:</strong> {html.escape(str(value))}</p>"
+        for key, value in (metadata or {}).items()
+        if key not in HIDDEN_METADATA
+    ]
+    if not rows:
+        return ""
+    heading = (EMAIL_TEXT.get(language) or EMAIL_TEXT["en"])["details"]
+    return (
+        "<div style='background-color: #f8f9fa; padding: 15px; border-radius: 6px; margin-top: 20px;'>"
+        f"<h4 style='margin: 0 0 10px 0; color: #495057;'>{heading}</h4>"
+        + "".join(rows)
+        + "</div>"
+    )
+
+class EmailRenderer:
+    """Renders notification emails, caching them by content.
+
+    The same content in the same language renders to the same bytes, so a
+    broadcast or a wave of identical reminders is rendered and encoded once;
+    only the envelope headers differ per recipient.
+    """
+
+    def __init__(self, cache_size: int = 1024):
+        self.cache_size = cache_size
+        self._cache: OrderedDict = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def render_html(self, notification: dict, language: str = DEFAULT_LANGUAGE) -> str:
+        """HTML body of a notification; its text comes from users, so it is escaped.
+
+        Only `message_html`, markup the service builds itself from escaped
+        parts (digests), is used as is.
+        """
+        priority = getattr(notification["priority"], "value", notification["priority"])
+        return email_template(notification.get("type", ""), language, priority).render({
+            "title": html.escape(notification["title"]),
+            "message": notification.get("message_html") or html.escape(notification["message"]),
+            "metadata": render_metadata(notification.get("metadata"), language)
+        })
+
+    def render(self, notification: dict, language: str = DEFAULT_LANGUAGE) -> RenderedEmail:
+        metadata = notification.get("metadata") or {}
+        key = (
+            notification.get("type", ""),
+            language,
+            getattr(notification["priority"], "value", notification["priority"]),
+            notification["title"],
+            notification["message"],
+            tuple((name, str(value)) for name, value in metadata.items() if name not in HIDDEN_METADATA)
+        )
+        rendered = self._cache.get(key)
+        if rendered is not None:
+            self._cache.move_to_end(key)
+            self.stats["hits"] += 1
+            return rendered
+
+        self.stats["misses"] += 1
+        html = self.render_html(notification, language)
+        rendered = RenderedEmail(
+            subject=encode_subject(language, notification["title"]),
+            body=base64.encodebytes(html.encode("utf-8")).replace(b"\n", b"\r\n")
+        )
+        self._cache[key] = rendered
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return rendered
+
+def build_message(from_email: str, to_email: str, rendered: RenderedEmail) -> bytes:
+    """Complete message around a rendered email: only the addresses are new.
+
+    The addresses are checked like envelope addresses, so neither can end its
+    header line and add another (an SMTPError 501 otherwise).
+    """
+    check_address(from_email)
+    check_address(to_email)
+    return (
+        f"From: {from_email}\r\n"
+        f"To: {to_email}\r\n"
+        f"Subject: {rendered.subject}\r\n"
+        "MIME-Version: 1.0\r\n"
+        'Content-Type: text/html; charset="utf-8"\r\n'
+        "Content-Transfer-Encoding: base64\r\n"
+        "\r\n"
+    ).encode("utf-8") + rendered.body
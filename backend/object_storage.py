@@ -0,0 +1,345 @@
+# Object Storage Integration for Driving School Platform
+import os
+import uuid
+import asyncio
+import logging
+import mimetypes
+from pathlib import Path
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Callable, Awaitable
+import boto3
+import botocore.exceptions
+import cloudinary
+import cloudinary.uploader
+import cloudinary.utils
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+# S3-compatible store (AWS S3, MinIO, ...)
+S3_BUCKET = os.environ.get('S3_BUCKET')
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')  # e.g. http://localhost:9000 for MinIO
+S3_REGION = os.environ.get('S3_REGION', 'us-east-1')
+S3_PUBLIC_URL = os.environ.get('S3_PUBLIC_URL')  # public base URL of the bucket, if different
+
+_s3_client = None
+
+def s3_configured() -> bool:
+    return bool(S3_BUCKET)
+
+def cloudinary_configured() -> bool:
+    """Check if Cloudinary is properly configured"""
+    return bool(
+        os.environ.get('CLOUDINARY_CLOUD_NAME') and
+        os.environ.get('CLOUDINARY_API_KEY') and
+        os.environ.get('CLOUDINARY_API_SECRET') and
+        os.environ.get('CLOUDINARY_CLOUD_NAME') != 'your-cloud-name'
+    )
+
+def get_s3_client():
+    """Shared boto3 client (credentials come from the standard AWS environment variables)"""
+    global _s3_client
+    if _s3_client is None:
+        _s3_client = boto3.client('s3', endpoint_url=S3_ENDPOINT_URL, region_name=S3_REGION)
+    return _s3_client
+
+def s3_object_url(key: str) -> str:
+    """Public URL of an object in the configured bucket"""
+    if S3_PUBLIC_URL:
+        return f"{S3_PUBLIC_URL.rstrip('/')}/{key}"
+    if S3_ENDPOINT_URL:
+        return f"{S3_ENDPOINT_URL.rstrip('/')}/{S3_BUCKET}/{key}"
+    return f"https://{S3_BUCKET}.s3.{S3_REGION}.amazonaws.com/{key}"
+
+# Replicated copies of private uploads are recorded under this scheme, never as a
+# public URL; presign_private_url turns one into a short-lived link when served
+PRIVATE_URL_PREFIX = "private://"
+
+def private_object_url(storage: str, public_id: str, resource_type: str = "raw", file_format: str = "") -> str:
+    """Reference to a private object, resolvable only through presign_private_url"""
+    if storage == "cloudinary":
+        return f"{PRIVATE_URL_PREFIX}cloudinary/{resource_type}/{file_format}/{public_id}"
+    return f"{PRIVATE_URL_PREFIX}s3/{public_id}"
+
+def presign_private_url(url: str, expires_in: int) -> str:
+    """Expiring download URL of a private object (computed locally, no network call)"""
+    storage, _, rest = url[len(PRIVATE_URL_PREFIX):].partition('/')
+    if storage == "cloudinary":
+        resource_type, file_format, public_id = rest.split('/', 2)
+        return cloudinary.utils.private_download_url(
+            public_id, file_format,
+            type="authenticated",
+            resource_type=resource_type,
+            expires_at=int(datetime.utcnow().timestamp()) + expires_in
+        )
+    return get_s3_client().generate_presigned_url(
+        'get_object',
+        Params={"Bucket": S3_BUCKET, "Key": rest},
+        ExpiresIn=expires_in
+    )
+
+def presign_put_url(key: str, content_type: str, expires_in: int) -> str:
+    """Short-lived URL letting a client PUT an object straight into the bucket"""
+    return get_s3_client().generate_presigned_url(
+        'put_object',
+        Params={"Bucket": S3_BUCKET, "Key": key, "ContentType": content_type},
+        ExpiresIn=expires_in
+    )
+
+def head_object(key: str) -> Optional[Dict]:
+    """Size and content type of an object, or None if it does not exist"""
+    try:
+        response = get_s3_client().head_object(Bucket=S3_BUCKET, Key=key)
+    except botocore.exceptions.ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+    return {
+        "size": response["ContentLength"],
+        "content_type": response.get("ContentType"),
+        "etag": response.get("ETag", "").strip('"')
+    }
+
+def download_object(key: str, path: str):
+    """Copy an object of the bucket to a local file (blocking)"""
+    get_s3_client().download_file(S3_BUCKET, key, path)
+
+def upload_object(path: str, key: str, content_type: str):
+    """Store a local file in the bucket under `key` (blocking)"""
+    get_s3_client().upload_file(path, S3_BUCKET, key, ExtraArgs={"ContentType": content_type})
+
+def delete_remote_object(storage: str, public_id: str, resource_type: str = "image", private: bool = False):
+    """Delete a replicated object from the store it was pushed to (blocking)"""
+    if storage == "cloudinary":
+        cloudinary.uploader.destroy(public_id, resource_type=resource_type, type="authenticated" if private else "upload")
+    elif storage == "s3":
+        get_s3_client().delete_object(Bucket=S3_BUCKET, Key=public_id)
+
+class ReplicationStatus:
+    PENDING = "pending"
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+class StorageReplicator:
+    """Write-behind replication of locally stored uploads to Cloudinary or S3.
+
+    Uploads are acknowledged once written locally; jobs queued in
+    `replication_queue` are pushed to the cloud store by a background loop,
+    which then swaps the stored URLs through `on_replicated`. Only files for
+    which `is_public` holds get a public URL; the others are stored privately
+    and recorded as PRIVATE_URL_PREFIX references.
+    """
+
+    def __init__(
+        self,
+        db,
+        uploads_dir: Path,
+        on_replicated: Callable[[str, Dict], Awaitable[None]],
+        url_prefix: str = "/demo-uploads",
+        is_public: Callable[[str], bool] = lambda relative_path: False
+    ):
+        self.db = db
+        self.is_public = is_public
+        self.uploads_dir = Path(uploads_dir)
+        self.on_replicated = on_replicated
+        self.url_prefix = url_prefix
+        self.concurrency = int(os.environ.get('REPLICATION_CONCURRENCY', '4'))
+        self.poll_interval = float(os.environ.get('REPLICATION_POLL_SECONDS', '2'))
+        self.max_attempts = int(os.environ.get('REPLICATION_MAX_ATTEMPTS', '8'))
+        self.lease_seconds = 300
+        self._workers = []
+        self._wakeup = asyncio.Event()
+        self._stats = {
+            "replicated_total": 0,
+            "failed_total": 0,
+            "last_lag_seconds": None,
+            "avg_lag_seconds": None
+        }
+
+    @property
+    def target(self) -> Optional[str]:
+        if cloudinary_configured():
+            return "cloudinary"
+        if s3_configured():
+            return "s3"
+        return None
+
+    @property
+    def enabled(self) -> bool:
+        return self.target is not None
+
+    async def enqueue(self, file_url: str, resource_type: str = "auto") -> Optional[str]:
+        """Queue a locally stored file for replication"""
+        if not self.enabled:
+            return None
+
+        now = datetime.utcnow()
+        job_id = str(uuid.uuid4())
+        await self.db.replication_queue.insert_one({
+            "id": job_id,
+            "file_url": file_url,
+            "resource_type": resource_type,
+            "status": ReplicationStatus.PENDING,
+            "attempts": 0,
+            "last_error": None,
+            "enqueued_at": now,
+            "next_attempt_at": now,
+            "locked_until": None
+        })
+        self._wakeup.set()
+        return job_id
+
+    def start(self):
+        if not self.enabled or self._workers:
+            return
+        self._workers = [asyncio.create_task(self._worker_loop()) for _ in range(self.concurrency)]
+        logger.info(f"Storage replication to {self.target} started with {self.concurrency} workers")
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _claim_job(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await self.db.replication_queue.find_one_and_update(
+            {
+                "$or": [
+                    {"status": ReplicationStatus.PENDING, "next_attempt_at": {"$lte": now}},
+                    # Jobs held by a worker that died
+                    {"status": ReplicationStatus.PROCESSING, "locked_until": {"$lt": now}}
+                ]
+            },
+            {"$set": {
+                "status": ReplicationStatus.PROCESSING,
+                "locked_until": now + timedelta(seconds=self.lease_seconds)
+            }},
+            sort=[("enqueued_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _worker_loop(self):
+        while True:
+            try:
+                job = await self._claim_job()
+                if job is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._process_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Replication worker error: {str(e)}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _process_job(self, job: dict):
+        try:
+            remote = await asyncio.to_thread(self._push, job["file_url"], job["resource_type"])
+            # Recorded before the swap, so work keyed on the local URL can find the new one
+            await self.db.replication_queue.update_one({"id": job["id"]}, {"$set": {"remote_url": remote["file_url"]}})
+            await self.on_replicated(job["file_url"], remote)
+        except Exception as e:
+            attempts = job["attempts"] + 1
+            failed = attempts >= self.max_attempts
+            backoff = min(2 ** attempts, 3600)
+            await self.db.replication_queue.update_one(
+                {"id": job["id"]},
+                {"$set": {
+                    "status": ReplicationStatus.FAILED if failed else ReplicationStatus.PENDING,
+                    "attempts": attempts,
+                    "last_error": str(e),
+                    "next_attempt_at": datetime.utcnow() + timedelta(seconds=backoff),
+                    "locked_until": None
+                }}
+            )
+            if failed:
+                self._stats["failed_total"] += 1
+            logger.warning(f"Replication of {job['file_url']} failed (attempt {attempts}): {str(e)}")
+            return
+
+        replicated_at = datetime.utcnow()
+        lag = (replicated_at - job["enqueued_at"]).total_seconds()
+        await self.db.replication_queue.update_one(
+            {"id": job["id"]},
+            {"$set": {
+                "status": ReplicationStatus.COMPLETED,
+                "remote_url": remote["file_url"],
+                "replicated_at": replicated_at,
+                "lag_seconds": lag,
+                "locked_until": None
+            }}
+        )
+        self._stats["replicated_total"] += 1
+        self._stats["last_lag_seconds"] = lag
+        previous = self._stats["avg_lag_seconds"]
+        self._stats["avg_lag_seconds"] = lag if previous is None else 0.9 * previous + 0.1 * lag
+
+    def _push(self, file_url: str, resource_type: str) -> Dict:
+        """Upload a local file to the configured cloud store (blocking, runs in a thread)"""
+        relative_path = file_url[len(self.url_prefix) + 1:]
+        local_path = self.uploads_dir / relative_path
+        if not local_path.exists():
+            raise FileNotFoundError(f"Local file missing: {local_path}")
+        public = self.is_public(relative_path)
+
+        if self.target == "cloudinary":
+            folder, _, file_name = relative_path.rpartition('/')
+            result = cloudinary.uploader.upload(
+                str(local_path),
+                folder=folder,
+                public_id=file_name.rsplit('.', 1)[0],
+                resource_type=resource_type,
+                type="upload" if public else "authenticated",
+                overwrite=True
+            )
+            resource_type = result.get("resource_type", resource_type)
+            return {
+                "file_url": result["secure_url"] if public else private_object_url(
+                    "cloudinary", result["public_id"], resource_type, local_path.suffix.lstrip('.')
+                ),
+                "storage": "cloudinary",
+                "public_id": result["public_id"],
+                "resource_type": resource_type,
+                "private": not public
+            }
+
+        content_type = mimetypes.guess_type(local_path.name)[0] or "application/octet-stream"
+        get_s3_client().upload_file(
+            str(local_path), S3_BUCKET, relative_path,
+            ExtraArgs={"ContentType": content_type}
+        )
+        return {
+            "file_url": s3_object_url(relative_path) if public else private_object_url("s3", relative_path),
+            "storage": "s3",
+            "public_id": relative_path,
+            "resource_type": resource_type,
+            "private": not public
+        }
+
+    async def get_metrics(self) -> Dict:
+        """Replication backlog and lag"""
+        now = datetime.utcnow()
+        pending = await self.db.replication_queue.count_documents(
+            {"status": {"$in": [ReplicationStatus.PENDING, ReplicationStatus.PROCESSING]}}
+        )
+        oldest = await self.db.replication_queue.find_one(
+            {"status": {"$in": [ReplicationStatus.PENDING, ReplicationStatus.PROCESSING]}},
+            sort=[("enqueued_at", 1)]
+        )
+        failed = await self.db.replication_queue.count_documents({"status": ReplicationStatus.FAILED})
+
+        return {
+            "enabled": self.enabled,
+            "target": self.target,
+            "pending_jobs": pending,
+            "failed_jobs": failed,
+            # Current replication lag: age of the oldest file not yet replicated
+            "replication_lag_seconds": (now - oldest["enqueued_at"]).total_seconds() if oldest else 0,
+            **self._stats
+        }
@@ -0,0 +1,217 @@
+# Payment Gateway HTTP Client for Driving School Platform
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Optional, Dict
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Worth another attempt: the gateway is overloaded or briefly unreachable
+RETRYABLE_STATUS = {429, 502, 503, 504}
+
+class GatewayError(Exception):
+    def __init__(self, provider: str, message: str, status_code: Optional[int] = None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.status_code = status_code
+
+class CircuitOpenError(GatewayError):
+    """Raised without touching the network while the gateway is considered down"""
+
+class CircuitBreaker:
+    """Stops calling a gateway after consecutive failures.
+
+    Closed: requests go through. Open: requests fail immediately until
+    `reset_seconds` have passed. Half-open: a single probe goes through;
+    its outcome closes or reopens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self.state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def release(self):
+        """Give back a half-open probe that ended without an outcome, e.g. cancelled"""
+        self._probing = False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"Circuit opened after {self.failures} consecutive failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+class RetryBudget:
+    """Retries as a fraction of requests, so an outage cannot multiply the load.
+
+    Every request deposits `ratio` tokens, every retry spends one; `minimum`
+    tokens keep occasional retries possible at low traffic.
+    """
+
+    def __init__(self, ratio: float = 0.2, minimum: float = 3):
+        self.ratio = ratio
+        self.maximum = max(minimum, 10)
+        self.tokens = float(minimum)
+
+    def deposit(self):
+        self.tokens = min(self.maximum, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+class GatewayClient:
+    """Pooled async HTTP client for one payment provider.
+
+    Connections are kept alive between requests. Each attempt is bounded by
+    the provider's timeouts; transport errors and overload statuses are
+    retried with jittered backoff while the retry budget allows, and every
+    failed attempt counts towards the circuit breaker.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        base_url: str,
+        timeout: float = 10,
+        connect_timeout: float = 3,
+        max_retries: int = 2,
+        backoff: float = 0.2,
+        max_connections: int = 20,
+        breaker: Optional[CircuitBreaker] = None,
+        budget: Optional[RetryBudget] = None
+    ):
+        self.provider = provider
+        self.base_url = base_url
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.budget = budget or RetryBudget()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._stats = {"requests_total": 0, "retries_total": 0, "failures_total": 0, "rejected_total": 0}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+        return self._client
+
+    async def post(self, path: str, payload: dict, headers: Optional[Dict] = None, idempotency_key: Optional[str] = None) -> dict:
+        """POST a JSON payload and return the JSON reply.
+
+        With an idempotency key the provider can recognise a retried request,
+        so a payment created by an attempt whose reply was lost is not created twice.
+        """
+        headers = dict(headers or {})
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
+        self._stats["requests_total"] += 1
+        self.budget.deposit()
+
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self._stats["rejected_total"] += 1
+                raise CircuitOpenError(self.provider, "circuit open")
+            probe = self.breaker.state == CircuitBreaker.HALF_OPEN
+            try:
+                response = await self.client.post(path, json=payload, headers=headers)
+            except httpx.HTTPError as e:
+                error = GatewayError(self.provider, f"{type(e).__name__}: {str(e) or 'no response'}")
+            except BaseException:
+                # Cancelled or failed outside the transport: the probe slot must not stay taken
+                if probe:
+                    self.breaker.release()
+                raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS and response.status_code < 500:
+                    # The gateway answered: a rejected request says nothing about its health
+                    self.breaker.record_success()
+                    if response.status_code >= 400:
+                        raise GatewayError(self.provider, f"rejected: {response.text[:200]}", response.status_code)
+                    return response.json()
+                error = GatewayError(self.provider, f"HTTP {response.status_code}", response.status_code)
+
+            self._stats["failures_total"] += 1
+            self.breaker.record_failure()
+            if attempt >= self.max_retries or not self.budget.withdraw():
+                raise error
+            attempt += 1
+            self._stats["retries_total"] += 1
+            await asyncio.sleep(self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def get_metrics(self) -> Dict:
+        return {
+            "provider": self.provider,
+            "circuit": self.breaker.state,
+            "retry_tokens": round(self.budget.tokens, 2),
+            **self._stats
+        }
+
+_clients: Dict[str, GatewayClient] = {}
+
+def get_gateway_client(provider: str, base_url: str) -> GatewayClient:
+    """Shared client of a provider, configured from `<PROVIDER>_*` environment variables"""
+    client = _clients.get(provider)
+    if client is None:
+        prefix = provider.upper()
+        client = _clients[provider] = GatewayClient(
+            provider,
+            base_url,
+            timeout=float(os.environ.get(f'{prefix}_TIMEOUT_SECONDS', '10')),
+            connect_timeout=float(os.environ.get(f'{prefix}_CONNECT_TIMEOUT_SECONDS', '3')),
+            max_retries=int(os.environ.get(f'{prefix}_MAX_RETRIES', '2')),
+            max_connections=int(os.environ.get(f'{prefix}_MAX_CONNECTIONS', '20')),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.environ.get(f'{prefix}_CIRCUIT_FAILURES', '5')),
+                reset_seconds=float(os.environ.get(f'{prefix}_CIRCUIT_RESET_SECONDS', '30'))
+            )
+        )
+    return client
+
+def get_gateway_metrics() -> Dict:
+    return {provider: client.get_metrics() for provider, client in _clients.items()}
+
+async def close_gateway_clients():
+    clients = list(_clients.values())
+    _clients.clear()
+    await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
@@ -0,0 +1,302 @@
+# Reminder Scheduler for Driving School Platform
+import os
+import time
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Set, Tuple, Callable, Awaitable
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+
+class ReminderStatus:
+    PENDING = "pending"
+    FIRED = "fired"
+    CANCELLED = "cancelled"
+    EXPIRED = "expired"
+
+class TimingWheel:
+    """Hierarchical timing wheel: O(1) insert and cancel, O(1) amortised per tick.
+
+    Level n has 2**bits slots of (2**bits)**n ticks each. A timer sits in the
+    lowest level whose span covers its remaining delay and moves down a level
+    (cascades) when the clock reaches its slot, so every timer is touched at
+    most `levels` times. Delays beyond the top level wait in an overflow set
+    that is re-placed on each top-level cascade.
+    """
+
+    def __init__(self, current_tick: int, bits: int = 6, levels: int = 4):
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self.levels = levels
+        self.current_tick = current_tick
+        self._wheels = [[{} for _ in range(1 << bits)] for _ in range(levels)]
+        self._overflow: Dict[str, Tuple[int, object]] = {}
+        self._locations: Dict[str, dict] = {}
+
+    def __len__(self) -> int:
+        return len(self._locations)
+
+    def __contains__(self, timer_id: str) -> bool:
+        return timer_id in self._locations
+
+    def _place(self, timer_id: str, expiry: int, payload):
+        delay = expiry - self.current_tick
+        for level in range(self.levels):
+            if delay < 1 << (self.bits * (level + 1)):
+                slot = self._wheels[level][(expiry >> (self.bits * level)) & self.mask]
+                break
+        else:
+            slot = self._overflow
+        slot[timer_id] = (expiry, payload)
+        self._locations[timer_id] = slot
+
+    def add(self, timer_id: str, expiry: int, payload=None):
+        """Register a timer for tick `expiry`; overdue timers fire on the next tick"""
+        self.cancel(timer_id)
+        self._place(timer_id, max(expiry, self.current_tick + 1), payload)
+
+    def cancel(self, timer_id: str) -> bool:
+        slot = self._locations.pop(timer_id, None)
+        if slot is None:
+            return False
+        del slot[timer_id]
+        return True
+
+    def _cascade(self, slot: dict):
+        timers = list(slot.items())
+        slot.clear()
+        for timer_id, (expiry, payload) in timers:
+            self._place(timer_id, expiry, payload)
+
+    def advance(self, to_tick: int) -> List[Tuple[str, object]]:
+        """Move the clock forward to `to_tick`; returns the (id, payload) of timers that expired"""
+        expired = []
+        while self.current_tick < to_tick:
+            self.current_tick += 1
+            tick = self.current_tick
+
+            # Levels whose slot boundary was just crossed, cascaded from the top down
+            crossed = 0
+            while crossed + 1 < self.levels and tick & ((1 << (self.bits * (crossed + 1))) - 1) == 0:
+                crossed += 1
+            if crossed == self.levels - 1 and self._overflow:
+                self._cascade(self._overflow)
+            for level in range(crossed, 0, -1):
+                self._cascade(self._wheels[level][(tick >> (self.bits * level)) & self.mask])
+
+            slot = self._wheels[0][tick & self.mask]
+            for timer_id, (_, payload) in slot.items():
+                del self._locations[timer_id]
+                expired.append((timer_id, payload))
+            slot.clear()
+        return expired
+
+def parse_offsets(value: str) -> List[int]:
+    return sorted({int(item) for item in value.split(',') if item.strip()}, reverse=True)
+
+def format_offset(minutes: int) -> str:
+    if minutes % 1440 == 0 and minutes >= 1440:
+        days = minutes // 1440
+        return "tomorrow" if days == 1 else f"in {days} days"
+    if minutes % 60 == 0:
+        hours = minutes // 60
+        return f"in {hours} hour{'s' if hours > 1 else ''}"
+    return f"in {minutes} minutes"
+
+class ReminderScheduler:
+    """Fires reminders ahead of sessions, exams and video rooms at their exact due time.
+
+    Reminders are persisted in `scheduled_reminders` and kept in an in-process
+    timing wheel ticking every `tick_seconds`. On startup, and periodically,
+    pending reminders are loaded from the database, which recovers timers
+    after a crash and picks up ones registered by other processes. Firing
+    claims reminders with a conditional update, so only one process sends each.
+    """
+
+    def __init__(
+        self,
+        db,
+        on_due: Callable[[List[dict]], Awaitable[None]],
+        offsets_minutes: Optional[List[int]] = None,
+        tick_seconds: float = 1
+    ):
+        self.db = db
+        self.on_due = on_due
+        self.offsets_minutes = offsets_minutes or parse_offsets(os.environ.get('REMINDER_OFFSETS_MINUTES', '1440,60'))
+        self.tick_seconds = tick_seconds
+        self.sync_interval = float(os.environ.get('REMINDER_SYNC_SECONDS', '60'))
+        self.wheel = TimingWheel(self._tick_of(time.time()))
+        self._subjects: Dict[Tuple[str, str], Set[str]] = {}
+        self._runner = None
+        self._tasks = set()
+        self._stats = {"fired_total": 0, "cancelled_total": 0}
+
+    def _tick_of(self, timestamp: float) -> int:
+        return int(timestamp // self.tick_seconds)
+
+    def _tick_of_datetime(self, moment: datetime) -> int:
+        # Naive datetimes are UTC throughout the platform
+        return self._tick_of((moment - EPOCH).total_seconds())
+
+    def _track(self, reminder: dict):
+        key = (reminder["subject_type"], reminder["subject_id"])
+        self.wheel.add(reminder["id"], self._tick_of_datetime(reminder["fire_at"]), key)
+        self._subjects.setdefault(key, set()).add(reminder["id"])
+
+    def _untrack(self, reminder_id: str, key: Tuple[str, str]):
+        ids = self._subjects.get(key)
+        if ids is not None:
+            ids.discard(reminder_id)
+            if not ids:
+                del self._subjects[key]
+
+    async def schedule(
+        self,
+        subject_type: str,
+        subject_id: str,
+        user_ids: List[str],
+        event_at: datetime,
+        title: str,
+        message: str
+    ) -> int:
+        """Register reminders for an event; `{when}` in the message becomes e.g. "in 1 hour" """
+        now = datetime.utcnow()
+        reminders = [
+            {
+                "id": str(uuid.uuid4()),
+                "subject_type": subject_type,
+                "subject_id": subject_id,
+                "user_ids": user_ids,
+                "title": title,
+                "message": message.replace("{when}", format_offset(offset)),
+                "offset_minutes": offset,
+                "event_at": event_at,
+                "fire_at": event_at - timedelta(minutes=offset),
+                "status": ReminderStatus.PENDING,
+                "created_at": now
+            }
+            for offset in self.offsets_minutes
+            if event_at - timedelta(minutes=offset) > now
+        ]
+        if not reminders:
+            return 0
+
+        await self.db.scheduled_reminders.insert_many(reminders)
+        for reminder in reminders:
+            self._track(reminder)
+        return len(reminders)
+
+    async def cancel(self, subject_type: str, subject_id: str) -> int:
+        """Cancel the pending reminders of an event"""
+        key = (subject_type, subject_id)
+        for reminder_id in self._subjects.pop(key, set()):
+            self.wheel.cancel(reminder_id)
+
+        # Also covers reminders held by other processes: they will fail to claim them
+        result = await self.db.scheduled_reminders.update_many(
+            {"subject_type": subject_type, "subject_id": subject_id, "status": ReminderStatus.PENDING},
+            {"$set": {"status": ReminderStatus.CANCELLED, "cancelled_at": datetime.utcnow()}}
+        )
+        self._stats["cancelled_total"] += result.modified_count
+        return result.modified_count
+
+    async def reschedule(
+        self,
+        subject_type: str,
+        subject_id: str,
+        user_ids: List[str],
+        event_at: datetime,
+        title: str,
+        message: str
+    ) -> int:
+        await self.cancel(subject_type, subject_id)
+        return await self.schedule(subject_type, subject_id, user_ids, event_at, title, message)
+
+    def start(self):
+        if self._runner is None:
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+
+    async def sync(self, horizon: Optional[datetime] = None) -> int:
+        """Load pending reminders (due before `horizon`) that this process does not hold yet"""
+        query = {"status": ReminderStatus.PENDING}
+        if horizon is not None:
+            query["fire_at"] = {"$lte": horizon}
+        added = 0
+        async for reminder in self.db.scheduled_reminders.find(
+            query, {"_id": 0, "id": 1, "subject_type": 1, "subject_id": 1, "fire_at": 1}
+        ):
+            if reminder["id"] not in self.wheel:
+                self._track(reminder)
+                added += 1
+        return added
+
+    async def _run(self):
+        try:
+            loaded = await self.sync()
+            logger.info(f"Reminder scheduler started with {loaded} pending reminders")
+        except Exception as e:
+            logger.error(f"Reminder scheduler load error: {str(e)}")
+
+        next_sync = time.monotonic() + self.sync_interval
+        while True:
+            try:
+                now = time.time()
+                await asyncio.sleep((self._tick_of(now) + 1) * self.tick_seconds - now)
+                # Catch up on every tick elapsed if the loop was delayed
+                expired = self.wheel.advance(self._tick_of(time.time()))
+                if expired:
+                    for reminder_id, key in expired:
+                        self._untrack(reminder_id, key)
+                    self._spawn(self._fire([reminder_id for reminder_id, _ in expired]))
+
+                if time.monotonic() >= next_sync:
+                    next_sync = time.monotonic() + self.sync_interval
+                    await self.sync(datetime.utcnow() + timedelta(seconds=2 * self.sync_interval))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Reminder scheduler error: {str(e)}")
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        # Keep a reference so the task is not garbage-collected mid-flight
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fire(self, reminder_ids: List[str]):
+        """Claim due reminders in one update and hand the ones this process won to `on_due`"""
+        now = datetime.utcnow()
+        claim = str(uuid.uuid4())
+        try:
+            await self.db.scheduled_reminders.update_many(
+                {"id": {"$in": reminder_ids}, "status": ReminderStatus.PENDING, "event_at": {"$gt": now}},
+                {"$set": {"status": ReminderStatus.FIRED, "fired_at": now, "claim": claim}}
+            )
+            # Recovered reminders whose event has already started are not worth sending
+            await self.db.scheduled_reminders.update_many(
+                {"id": {"$in": reminder_ids}, "status": ReminderStatus.PENDING},
+                {"$set": {"status": ReminderStatus.EXPIRED}}
+            )
+            reminders = await self.db.scheduled_reminders.find({"claim": claim}, {"_id": 0}).to_list(length=None)
+            if reminders:
+                await self.on_due(reminders)
+                self._stats["fired_total"] += len(reminders)
+        except Exception as e:
+            logger.error(f"Failed to fire reminders: {str(e)}")
+
+    def get_metrics(self) -> Dict:
+        return {
+            "running": self._runner is not None,
+            "timers": len(self.wheel),
+            "offsets_minutes": self.offsets_minutes,
+            **self._stats
+        }
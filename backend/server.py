@@ -1,6 +1,8 @@
 import os
 import uuid
 import logging
+import asyncio
+import hashlib
 import smtplib
 from datetime import datetime, timedelta, timedelta
 from typing import List, Optional, Dict
@@ -10,9 +12,11 @@ from email.mime.multipart import MIMEMultipart
 from fastapi import FastAPI, HTTPException, status, Depends, UploadFile, File, Form, APIRouter, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel, EmailStr
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+from pydantic import BaseModel, EmailStr, Field
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, BulkWriteError
 from passlib.context import CryptContext
 import jwt
 from enum import Enum
@@ -22,13 +26,28 @@ import cloudinary.uploader
 import cloudinary.api
 import aiofiles
 import json
-import qrcode
 from io import BytesIO
 import base64
 import sys
 import os
+from functools import partial
 sys.path.append(os.path.dirname(__file__))
 
+from image_derivatives import ImageDerivativePipeline, DERIVATIVE_SIZES, is_image_url, is_cloudinary_url, derivative_url, cloudinary_derivative_url
+from certificate_rendering import CertificateRenderer, CERTIFICATE_FOLDER, render_qr_svg, verification_payload
+from certificate_numbers import CertificateNumberAllocator
+from smtp_transport import close_smtp_pools
+from payment_gateway import get_gateway_metrics, close_gateway_clients
+from enhanced_notifications import EnhancedNotificationService
+from notification_stream import create_notification_hub
+from reminder_scheduler import ReminderScheduler
+from certificate_signing import CertificateSigner, VerificationCache, load_signing_key
+from upload_serving import UploadUrlSigner, serve_file, stream_zip, PUBLIC_CACHE_CONTROL, PRIVATE_CACHE_CONTROL
+from object_storage import (
+    StorageReplicator, delete_remote_object, s3_configured, s3_object_url, presign_put_url, head_object,
+    download_object, upload_object, PRIVATE_URL_PREFIX, private_object_url, presign_private_url
+)
+
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -59,10 +78,15 @@ app = FastAPI(title="Driving School Platform API")
 # Initialize API Router with /api prefix
 api_router = APIRouter(prefix="/api")
 
-# Create demo uploads directory and mount static files
+# Create demo uploads directory (files are served by serve_upload below)
 demo_uploads_dir = Path("demo-uploads")
 demo_uploads_dir.mkdir(exist_ok=True)
-app.mount("/demo-uploads", StaticFiles(directory="demo-uploads"), name="demo-uploads")
+
+# Background pipeline producing resized variants of uploaded photos
+image_pipeline = ImageDerivativePipeline(demo_uploads_dir)
+
+# Worker pool rendering certificate PDFs once, when certificates are created
+certificate_renderer = CertificateRenderer(demo_uploads_dir)
 
 # CORS setup
 app.add_middleware(
@@ -80,10 +104,67 @@ db = client.driving_school_platform
 
 # Security setup
 security = HTTPBearer()
+# EventSource cannot send headers, so streams also accept ?token=
+optional_security = HTTPBearer(auto_error=False)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-here')
 ALGORITHM = "HS256"
 
+# Signed URLs for private uploads (documents, certificates)
+upload_signer = UploadUrlSigner(SECRET_KEY)
+
+# Ed25519 signatures embedded in certificate QR codes, and the cache behind public verification
+certificate_signer = CertificateSigner(load_signing_key(SECRET_KEY))
+verification_cache = VerificationCache()
+
+# Collision-free certificate numbers, reserved per state in blocks
+certificate_numbers = CertificateNumberAllocator(db)
+
+# Pushes new notifications to connected clients (SSE), fanned out across workers by the broker
+notification_hub = create_notification_hub()
+
+# Notification delivery runs from the outbox workers owned by this service
+notification_service = EnhancedNotificationService(client, hub=notification_hub)
+
+async def insert_notification(notification_doc: dict):
+    """Store an in-app notification in the single notification store, counted and pushed like any other"""
+    await notification_service.create_notifications([notification_service.from_legacy(notification_doc)])
+
+async def insert_notifications(notification_docs: List[dict]):
+    await notification_service.create_notifications([notification_service.from_legacy(doc) for doc in notification_docs])
+
+async def mark_user_notification_read(notification_id: str, user_id: str) -> bool:
+    """False when the user has no such notification; marking it again is not an error"""
+    if await notification_service.mark_as_read(notification_id, user_id):
+        return True
+    return await db.enhanced_notifications.find_one({"id": notification_id, "user_id": user_id}, {"_id": 1}) is not None
+
+async def notification_feed(user_id: str, limit: int, cursor: Optional[str] = None, only_unread: bool = False) -> dict:
+    """One page of a user's feed; a malformed cursor is the client's error"""
+    try:
+        return await notification_service.get_user_notifications(user_id, limit=limit, cursor=cursor, only_unread=only_unread)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def send_due_reminders(reminders: List[dict]):
+    """Turn fired reminders into notifications, stored and queued in one write"""
+    await notification_service.create_notifications([
+        notification_service.build_notification(
+            user_id=user_id,
+            notification_type=f"{reminder['subject_type']}_reminder",
+            title=reminder["title"],
+            message=reminder["message"],
+            priority=NotificationPriority.HIGH,
+            channels=[NotificationChannel.EMAIL, NotificationChannel.IN_APP],
+            metadata={f"{reminder['subject_type']}_id": reminder["subject_id"], "offset_minutes": reminder["offset_minutes"]}
+        )
+        for reminder in reminders
+        for user_id in reminder["user_ids"]
+    ])
+
+# Reminders ahead of sessions, exams and video rooms, fired from an in-process timing wheel
+reminder_scheduler = ReminderScheduler(db, on_due=send_due_reminders)
+
 # Daily.co API setup
 DAILY_API_KEY = os.environ.get('DAILY_API_KEY')
 DAILY_API_URL = os.environ.get('DAILY_API_URL', 'https://api.daily.co/v1')
@@ -100,6 +181,41 @@ cloudinary.config(
 async def health_check():
     return {"status": "healthy", "message": "Driving School Platform API is running"}
 
+@app.api_route("/demo-uploads/{file_path:path}", methods=["GET", "HEAD"])
+async def serve_upload(file_path: str, request: Request, expires: Optional[str] = None, signature: Optional[str] = None):
+    """Serve a locally stored upload; private files need a valid signed URL"""
+    uploads_root = demo_uploads_dir.resolve()
+    path = (uploads_root / file_path).resolve()
+    if uploads_root not in path.parents or not path.is_file():
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    # Access is decided on the file actually served: `public/../private` is the private file
+    relative_path = path.relative_to(uploads_root).as_posix()
+    if not upload_signer.verify(relative_path, expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired file link")
+    
+    cache_control = PUBLIC_CACHE_CONTROL if upload_signer.is_public(relative_path) else PRIVATE_CACHE_CONTROL
+    return serve_file(request, path, cache_control)
+
+@app.get("/health/replication")
+async def replication_health():
+    """Cloud replication backlog and lag"""
+    return await storage_replicator.get_metrics()
+
+@app.get("/health/notifications")
+async def notification_health():
+    """Notification outbox backlog, dead letters, reminder timers and open streams"""
+    return {
+        **await notification_service.outbox.get_metrics(),
+        "reminders": reminder_scheduler.get_metrics(),
+        "streams": notification_hub.get_metrics()
+    }
+
+@app.get("/health/payments")
+async def payment_health():
+    """Payment gateway circuits, retry budgets and failure counts"""
+    return get_gateway_metrics()
+
 # Enums
 class UserRole(str, Enum):
     GUEST = "guest"
@@ -173,6 +289,16 @@ class NotificationChannel(str, Enum):
     PUSH = "push"
     IN_APP = "in_app"
 
+class BroadcastAudience(str, Enum):
+    ALL = "all"
+    STUDENTS = "students"
+    TEACHERS = "teachers"
+
+class CertificateLanguage(str, Enum):
+    ENGLISH = "en"
+    FRENCH = "fr"
+    ARABIC = "ar"
+
 class SessionStatus(str, Enum):
     SCHEDULED = "scheduled"
     IN_PROGRESS = "in_progress"
@@ -185,6 +311,7 @@ class CertificateStatus(str, Enum):
     ELIGIBLE = "eligible"
     GENERATED = "generated"
     ISSUED = "issued"
+    REVOKED = "revoked"
 
 # Pydantic Models
 class UserBase(BaseModel):
@@ -225,6 +352,8 @@ class DrivingSchool(BaseModel):
     manager_id: str
     latitude: Optional[float] = None
     longitude: Optional[float] = None
+    certificate_language: CertificateLanguage = CertificateLanguage.ENGLISH
+    certificate_color: Optional[str] = None
     created_at: datetime
 
 class DrivingSchoolCreate(BaseModel):
@@ -237,6 +366,9 @@ class DrivingSchoolCreate(BaseModel):
     price: float
     latitude: Optional[float] = None
     longitude: Optional[float] = None
+    certificate_language: CertificateLanguage = CertificateLanguage.ENGLISH
+    # Hex accent color of the school's certificates, e.g. #1f3a93
+    certificate_color: Optional[str] = Field(None, pattern=r"^#[0-9a-fA-F]{6}$")
 
 class Teacher(BaseModel):
     id: str
@@ -301,6 +433,18 @@ class DocumentUpload(BaseModel):
     status: DocumentStatus = DocumentStatus.ACCEPTED
     refusal_reason: Optional[str] = None
 
+class DocumentUploadGrantCreate(BaseModel):
+    document_type: DocumentType
+    file_name: str
+    content_type: str
+    file_size: int
+
+class SchoolPhotoUploadGrantCreate(BaseModel):
+    photo_type: str  # 'logo' or 'photo'
+    file_name: str
+    content_type: str
+    file_size: int
+
 # New Models for Enhanced Functionality
 
 class Quiz(BaseModel):
@@ -437,6 +581,13 @@ class Notification(BaseModel):
     metadata: Optional[dict] = None
     created_at: datetime
 
+class BroadcastCreate(BaseModel):
+    title: str = Field(..., min_length=1, max_length=200)
+    message: str = Field(..., min_length=1, max_length=2000)
+    audience: BroadcastAudience = BroadcastAudience.ALL
+    priority: NotificationPriority = NotificationPriority.MEDIUM
+    channels: List[NotificationChannel] = [NotificationChannel.IN_APP, NotificationChannel.EMAIL]
+
 class ProgressAnalytics(BaseModel):
     id: str
     student_id: str
@@ -519,8 +670,16 @@ def serialize_doc(doc):
         return str(doc)  # Convert ObjectId to string
     if isinstance(doc, datetime):
         return doc.isoformat()  # Convert datetime to ISO string
+    if isinstance(doc, str) and doc.startswith(("/demo-uploads/", PRIVATE_URL_PREFIX)):
+        return signed_file_url(doc)  # Private uploads are only reachable through signed URLs
     return doc
 
+def signed_file_url(file_url: str) -> str:
+    """Link a client can open: signed for private local uploads, presigned for private replicated copies"""
+    if file_url.startswith(PRIVATE_URL_PREFIX):
+        return presign_private_url(file_url, upload_signer.ttl_seconds)
+    return upload_signer.sign(file_url)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -532,8 +691,11 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await user_from_token(credentials.credentials)
+
+async def user_from_token(token: str):
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
@@ -717,9 +879,11 @@ async def upload_to_local_storage(file: UploadFile, folder: str):
         unique_filename = f"{str(uuid.uuid4())}_{file.filename}"
         file_path = upload_dir / unique_filename
         
-        # Save file
+        # Save file and flush it to disk before acknowledging the upload
         async with aiofiles.open(file_path, 'wb') as f:
             await f.write(file_content)
+            await f.flush()
+            os.fsync(f.fileno())
         
         # Return consistent format
         return {
@@ -734,130 +898,269 @@ async def upload_to_local_storage(file: UploadFile, folder: str):
         raise HTTPException(status_code=500, detail=f"Failed to upload file locally: {str(e)}")
 
 async def upload_file_with_fallback(file: UploadFile, folder: str, resource_type: str = "auto"):
-    """Upload file with Cloudinary first, fallback to local storage"""
-    # Check if Cloudinary is properly configured
-    if (os.environ.get('CLOUDINARY_CLOUD_NAME') and 
-        os.environ.get('CLOUDINARY_API_KEY') and 
-        os.environ.get('CLOUDINARY_API_SECRET') and
-        os.environ.get('CLOUDINARY_CLOUD_NAME') != 'your-cloud-name'):
-        try:
-            return await upload_to_cloudinary(file, folder, resource_type)
-        except Exception as e:
-            logger.warning(f"Cloudinary upload failed, falling back to local storage: {str(e)}")
-    
-    # Fallback to local storage
-    logger.info(f"Using local storage for file upload: {file.filename}")
-    return await upload_to_local_storage(file, folder)
+    """Store file locally and replicate it to cloud storage in the background"""
+    upload_result = await upload_to_local_storage(file, folder)
+    try:
+        await storage_replicator.enqueue(upload_result["file_url"], resource_type)
+    except Exception as e:
+        # The local copy stays authoritative until a replication succeeds
+        logger.warning(f"Failed to queue replication for {upload_result['file_url']}: {str(e)}")
+    return upload_result
+
+# Content-addressed blob storage
+# Files are stored once per SHA-256 of their content; `file_blobs` records keep a
+# reference count of the documents pointing at each blob.
+BLOB_FOLDER = "blobs"
+# An upload waits this many 50ms rounds for a blob being garbage-collected to disappear
+BLOB_REFERENCE_ATTEMPTS = 100
+# A deletion mark older than this belongs to a collection that never finished
+BLOB_DELETE_LEASE_SECONDS = 300
+
+def local_blob_path(content_hash: str, extension: str) -> Path:
+    """Local path of a content-addressed blob, sharded by hash prefix"""
+    return demo_uploads_dir / BLOB_FOLDER / content_hash[:2] / f"{content_hash}.{extension}"
+
+async def write_local_blob(content: bytes, content_hash: str, extension: str) -> Path:
+    """Write blob content atomically (temp file + rename) unless it is already on disk"""
+    blob_path = local_blob_path(content_hash, extension)
+    if blob_path.exists():
+        return blob_path
+    
+    blob_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = blob_path.with_name(f".{blob_path.name}.{uuid.uuid4().hex}.tmp")
+    async with aiofiles.open(temp_path, 'wb') as f:
+        await f.write(content)
+        await f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, blob_path)
+    return blob_path
+
+async def store_content_addressed(file: UploadFile, resource_type: str = "auto") -> dict:
+    """Store an uploaded file by content hash, reusing the existing copy of identical files"""
+    try:
+        await file.seek(0)
+        file_content = await file.read()
+        content_hash = hashlib.sha256(file_content).hexdigest()
+        file_extension = file.filename.split('.')[-1].lower() if file.filename and '.' in file.filename else 'bin'
+        
+        blob_data = {
+            "file_url": f"/demo-uploads/{BLOB_FOLDER}/{content_hash[:2]}/{content_hash}.{file_extension}",
+            "public_id": f"{content_hash}.{file_extension}",
+            "resource_type": resource_type,
+            "storage": "local",
+            "sha256": content_hash,
+            "file_size": len(file_content),
+            "format": file_extension,
+            "created_at": datetime.utcnow()
+        }
+        
+        # A blob being garbage-collected takes no new references: wait for its record to go, then store it afresh
+        for _ in range(BLOB_REFERENCE_ATTEMPTS):
+            try:
+                blob = await db.file_blobs.find_one_and_update(
+                    {"sha256": content_hash, "deleting": {"$ne": True}},
+                    {
+                        "$inc": {"ref_count": 1},
+                        "$set": {"last_referenced_at": datetime.utcnow()},
+                        "$setOnInsert": blob_data
+                    },
+                    upsert=True,
+                    return_document=ReturnDocument.BEFORE
+                )
+                break
+            except DuplicateKeyError:
+                await reclaim_stale_blob(content_hash)
+                await asyncio.sleep(0.05)
+        else:
+            raise HTTPException(status_code=503, detail="File is being cleaned up, please retry")
+        
+        # No previous record: this upload created the blob
+        deduplicated = blob is not None
+        blob = blob or blob_data
+        # Written only once the reference is held, so a garbage collection cannot unlink it afterwards;
+        # this also restores the file of a local blob whose copy went missing
+        if blob["storage"] == "local":
+            await write_local_blob(file_content, content_hash, blob["format"])
+        if not deduplicated:
+            # Acknowledge once the blob is on local disk; cloud replication happens in the background
+            await storage_replicator.enqueue(blob["file_url"], resource_type)
+        
+        return {
+            "file_url": blob["file_url"],
+            "public_id": blob["public_id"],
+            "file_size": blob["file_size"],
+            "format": blob["format"],
+            "content_hash": content_hash,
+            "derivatives": blob.get("derivatives"),
+            "deduplicated": deduplicated
+        }
+    except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail=f"Failed to store file: {str(e)}")
+
+async def reclaim_stale_blob(content_hash: str):
+    """Drop the record of a blob whose garbage collection died half-way"""
+    await db.file_blobs.delete_one({
+        "sha256": content_hash,
+        "deleting": True,
+        "deleting_at": {"$lt": datetime.utcnow() - timedelta(seconds=BLOB_DELETE_LEASE_SECONDS)}
+    })
 
-# Enhanced Certificate Generation Functions
-async def generate_qr_code(data: str) -> str:
-    """Generate QR code and return base64 encoded image"""
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(data)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffered = BytesIO()
-    img.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
-    return img_str
-
-async def create_certificate_pdf(certificate_data: dict) -> bytes:
-    """Generate a professional PDF certificate"""
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
-    
-    # Define styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.darkblue,
-        alignment=1,  # Center alignment
-        spaceAfter=30
+async def release_content_blob(content_hash: str):
+    """Drop one reference to a blob and garbage-collect it once nothing points at it"""
+    try:
+        blob = await db.file_blobs.find_one_and_update(
+            {"sha256": content_hash},
+            {"$inc": {"ref_count": -1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not blob or blob["ref_count"] > 0:
+            return
+        
+        # Stop new references first, so nothing recreates the files while they are removed
+        blob = await db.file_blobs.find_one_and_update(
+            {"sha256": content_hash, "ref_count": {"$lte": 0}, "deleting": {"$ne": True}},
+            {"$set": {"deleting": True, "deleting_at": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not blob:
+            return
+        
+        # Replicated blobs keep their local copy, so always clean up the disk
+        blob_path = local_blob_path(content_hash, blob["format"])
+        blob_path.unlink(missing_ok=True)
+        for variant in DERIVATIVE_SIZES:
+            Path(derivative_url(str(blob_path), variant)).unlink(missing_ok=True)
+        if blob["storage"] != "local":
+            await asyncio.to_thread(
+                delete_remote_object, blob["storage"], blob["public_id"], blob.get("resource_type", "image"), blob.get("private", False)
+            )
+        
+        # Only now may an upload of the same content insert a new record
+        await db.file_blobs.delete_one({"sha256": content_hash, "deleting": True})
+        logger.info(f"Garbage-collected unreferenced blob {content_hash}")
+    except Exception as e:
+        logger.error(f"Failed to release blob {content_hash}: {str(e)}")
+
+async def swap_replicated_url(local_url: str, remote: dict):
+    """Point every record holding a local upload URL at its replicated copy"""
+    # Each update is conditional on the local URL so a record re-uploaded meanwhile is left alone
+    await db.file_blobs.update_one(
+        {"file_url": local_url},
+        {"$set": {
+            "file_url": remote["file_url"],
+            "storage": remote["storage"],
+            "public_id": remote["public_id"],
+            "resource_type": remote["resource_type"],
+            "private": remote["private"],
+            "replicated_at": datetime.utcnow()
+        }}
     )
-    
-    subtitle_style = ParagraphStyle(
-        'CustomSubtitle',
-        parent=styles['Heading2'],
-        fontSize=18,
-        textColor=colors.blue,
-        alignment=1,
-        spaceAfter=20
+    await db.documents.update_many({"file_url": local_url}, {"$set": {"file_url": remote["file_url"]}})
+    await db.users.update_many({"profile_photo_url": local_url}, {"$set": {"profile_photo_url": remote["file_url"]}})
+    await db.driving_schools.update_many({"logo_url": local_url}, {"$set": {"logo_url": remote["file_url"]}})
+    await db.driving_schools.update_many({"photos": local_url}, {"$set": {"photos.$": remote["file_url"]}})
+    await db.driving_schools.update_many(
+        {"photo_derivatives.file_url": local_url},
+        {"$set": {"photo_derivatives.$.file_url": remote["file_url"]}}
     )
-    
-    content_style = ParagraphStyle(
-        'CustomContent',
-        parent=styles['Normal'],
-        fontSize=12,
-        alignment=1,
-        spaceAfter=10
+    await db.certificates.update_many({"pdf_url": local_url}, {"$set": {"pdf_url": remote["file_url"]}})
+
+# Write-behind replication of local uploads to Cloudinary or S3
+# Private folders are stored privately and served through presigned links
+storage_replicator = StorageReplicator(
+    db, demo_uploads_dir, on_replicated=swap_replicated_url, is_public=upload_signer.is_public
+)
+
+async def current_upload_url(local_url: str) -> str:
+    """URL records hold for a local upload: its replicated copy once replication has swapped it"""
+    job = await db.replication_queue.find_one(
+        {"file_url": local_url, "remote_url": {"$ne": None}},
+        {"remote_url": 1}
     )
-    
-    # Build certificate content
-    content = []
-    
-    # Certificate Header
-    content.append(Paragraph("🇩🇿 REPUBLIC OF ALGERIA", title_style))
-    content.append(Paragraph("MINISTRY OF TRANSPORT", subtitle_style))
-    content.append(Spacer(1, 20))
-    
-    # Certificate Title
-    content.append(Paragraph("DRIVING LICENSE CERTIFICATE", title_style))
-    content.append(Paragraph("شهادة رخصة القيادة", subtitle_style))
-    content.append(Spacer(1, 30))
-    
-    # Certificate Body
-    content.append(Paragraph(
-        f"This certifies that <b>{certificate_data['student_name']}</b> has successfully completed",
-        content_style
-    ))
-    content.append(Paragraph(
-        f"the comprehensive driving education program at <b>{certificate_data['school_name']}</b>",
-        content_style
-    ))
-    content.append(Spacer(1, 20))
-    
-    # Certificate Details Table
-    details_data = [
-        ['Certificate Number:', certificate_data['certificate_number']],
-        ['Issue Date:', certificate_data['issue_date'].strftime('%B %d, %Y')],
-        ['Valid Until:', certificate_data['expiry_date'].strftime('%B %d, %Y')],
-        ['Student ID:', certificate_data['student_id']],
-        ['School Location:', certificate_data['school_location']]
+    return job["remote_url"] if job else local_url
+
+async def record_image_derivatives(file_url: str, derivatives: dict, owner: str):
+    """Attach generated image variants to the record that owns the original"""
+    try:
+        if owner == "document":
+            # Matched on the content hash (the blob's file name), which replication leaves alone;
+            # deduplicated documents share the blob, so they share its variants
+            content_hash = Path(file_url).stem
+            await db.file_blobs.update_one({"sha256": content_hash}, {"$set": {"derivatives": derivatives}})
+            await db.documents.update_many({"content_hash": content_hash}, {"$set": {"derivatives": derivatives}})
+            return
+        
+        # The other owners are matched on their URL, which replication may swap at any moment:
+        # if nothing matches, look the URL up again once
+        url = file_url
+        for _ in range(2):
+            if owner == "profile_photo":
+                result = await db.users.update_many(
+                    {"profile_photo_url": url},
+                    {"$set": {"profile_photo_derivatives": derivatives}}
+                )
+            elif owner == "school_logo":
+                result = await db.driving_schools.update_many(
+                    {"logo_url": url},
+                    {"$set": {"logo_derivatives": derivatives}}
+                )
+            elif owner == "school_photo":
+                result = await db.driving_schools.update_many(
+                    {"photos": url},
+                    {"$push": {"photo_derivatives": {"file_url": url, **derivatives}}}
+                )
+            else:
+                return
+            if result.matched_count:
+                return
+            url = await current_upload_url(file_url)
+    except Exception as e:
+        logger.error(f"Failed to record image derivatives for {file_url}: {str(e)}")
+
+def apply_school_image_variant(school: dict, variant: str) -> dict:
+    """Replace a school's logo and photo URLs with the requested variant where available"""
+    if school.get("logo_derivatives"):
+        school["logo_url"] = school["logo_derivatives"].get(variant, school.get("logo_url"))
+    photo_variants = {photo["file_url"]: photo for photo in school.get("photo_derivatives", [])}
+    school["photos"] = [
+        photo_variants.get(url, {}).get(variant, url) for url in school.get("photos", [])
     ]
-    
-    details_table = Table(details_data, colWidths=[2*inch, 3*inch])
-    details_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.lightblue),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ('BACKGROUND', (1, 0), (1, -1), colors.white),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    content.append(details_table)
-    content.append(Spacer(1, 30))
-    
-    # QR Code for verification
-    qr_code = await generate_qr_code(f"VERIFY:{certificate_data['certificate_number']}")
-    qr_image = Image(BytesIO(base64.b64decode(qr_code)), width=100, height=100)
-    content.append(Paragraph("Scan QR Code to Verify Certificate:", content_style))
-    content.append(qr_image)
-    content.append(Spacer(1, 20))
-    
-    # Signature section
-    content.append(Paragraph("Authorized by the Ministry of Transport, Algeria", content_style))
-    content.append(Paragraph("This certificate is valid for 5 years from the date of issue.", content_style))
-    
-    # Build PDF
-    doc.build(content)
-    buffer.seek(0)
-    return buffer.getvalue()
+    return school
+
+# Enhanced Certificate Generation Functions
+def certificate_render_data(certificate: dict, student: dict, school: dict) -> dict:
+    """Fields printed on a certificate PDF"""
+    return {
+        "student_name": f"{student['first_name']} {student['last_name']}",
+        "student_id": certificate["student_id"],
+        "school_name": school["name"],
+        "school_location": f"{school['address']}, {school['state']}",
+        "certificate_number": certificate["certificate_number"],
+        "issue_date": certificate["issue_date"],
+        "expiry_date": certificate["expiry_date"],
+        "qr_payload": certificate.get("qr_payload"),
+        # Per-school certificate template
+        "template": school.get("certificate_language", "en"),
+        "accent_color": school.get("certificate_color")
+    }
+
+async def record_certificate_pdf(cert_id: str, result: dict):
+    """Attach a rendered PDF to its certificate and queue it for cloud replication"""
+    await db.certificates.update_one(
+        {"id": cert_id},
+        {"$set": {
+            "pdf_url": result["file_url"],
+            "qr_code": result["qr_code"],
+            "pdf_size": result["file_size"],
+            "rendered_at": datetime.utcnow()
+        }}
+    )
+    try:
+        await storage_replicator.enqueue(result["file_url"], "raw")
+    except Exception as e:
+        logger.warning(f"Failed to queue replication for {result['file_url']}: {str(e)}")
 
 # Enhanced Analytics Functions
 async def generate_student_analytics_chart(student_data: dict) -> str:
@@ -1031,18 +1334,129 @@ async def get_user_courses(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail="Failed to retrieve courses")
 
 @api_router.get("/notifications")
-async def get_user_notifications(current_user: dict = Depends(get_current_user)):
-    """Get notifications for the current user"""
+async def get_user_notifications(
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    unread_only: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """One page of the current user's notifications; pass `next_cursor` back for the next page"""
     try:
-        notifications_cursor = db.notifications.find({"user_id": current_user["id"]}).sort("created_at", -1).limit(20)
-        notifications = await notifications_cursor.to_list(length=None)
-        
-        return {"notifications": serialize_doc(notifications)}
+        return await notification_feed(current_user["id"], min(max(limit, 1), 100), cursor, unread_only)
     
     except Exception as e:
         logger.error(f"Get notifications error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail="Failed to retrieve notifications")
 
+@api_router.get("/notifications/unread-count")
+async def get_unread_notification_count(current_user: dict = Depends(get_current_user)):
+    """Unread notification counts for the header badge"""
+    try:
+        return await notification_service.get_unread_counts(current_user["id"])
+    
+    except Exception as e:
+        logger.error(f"Get unread count error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to retrieve unread count")
+
+@api_router.get("/notifications/stats")
+async def get_notification_stats(current_user: dict = Depends(get_current_user)):
+    """Notification totals and unread counts by priority for the current user"""
+    try:
+        return await notification_service.get_notification_stats(current_user["id"])
+    
+    except Exception as e:
+        logger.error(f"Get notification stats error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to retrieve notification statistics")
+
+@api_router.get("/notifications/stream")
+async def stream_notifications(
+    token: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+):
+    """Server-Sent Events carrying new notifications as they are created"""
+    if credentials is None and token is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    current_user = await user_from_token(credentials.credentials if credentials else token)
+    
+    return StreamingResponse(
+        notification_hub.stream(current_user["id"]),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Broadcasts a school may send per clock hour; each one reaches every enrolled student and teacher
+BROADCASTS_PER_HOUR = int(os.environ.get('BROADCASTS_PER_HOUR', '10'))
+
+async def reserve_broadcast(school_id: str):
+    """Use up one of the school's broadcasts for this hour, or refuse with a 429 when none are left"""
+    now = datetime.utcnow()
+    window_start = now.replace(minute=0, second=0, microsecond=0)
+    try:
+        # Once the count reaches the limit the filter stops matching and the upsert collides
+        await db.broadcast_quotas.update_one(
+            {"driving_school_id": school_id, "window_start": window_start, "count": {"$lt": BROADCASTS_PER_HOUR}},
+            {"$inc": {"count": 1}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        retry_after = int((window_start + timedelta(hours=1) - now).total_seconds()) + 1
+        raise HTTPException(
+            status_code=429,
+            detail=f"A school can send at most {BROADCASTS_PER_HOUR} broadcasts per hour",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+@api_router.post("/notifications/broadcast")
+async def broadcast_notification(
+    broadcast_data: BroadcastCreate,
+    current_user: dict = Depends(get_current_user)
+):
+    """Announce something to every enrolled student and/or teacher of the manager's school"""
+    try:
+        if current_user["role"] != "manager":
+            raise HTTPException(status_code=403, detail="Only managers can broadcast notifications")
+        
+        school = await db.driving_schools.find_one({"manager_id": current_user["id"]}, {"_id": 0, "id": 1, "name": 1})
+        if not school:
+            raise HTTPException(status_code=404, detail="Manager has no driving school")
+        if not broadcast_data.title.strip() or not broadcast_data.message.strip():
+            raise HTTPException(status_code=400, detail="Title and message cannot be blank")
+        await reserve_broadcast(school["id"])
+        
+        user_ids = await notification_service.resolve_school_audience(school["id"], broadcast_data.audience.value)
+        result = await notification_service.broadcast(
+            user_ids,
+            notification_type="school_broadcast",
+            title=broadcast_data.title,
+            message=broadcast_data.message,
+            priority=broadcast_data.priority,
+            channels=broadcast_data.channels,
+            metadata={"driving_school_id": school["id"], "school_name": school["name"]}
+        )
+        
+        await db.notification_broadcasts.insert_one({
+            "id": result["broadcast_id"],
+            "driving_school_id": school["id"],
+            "sender_id": current_user["id"],
+            "audience": broadcast_data.audience,
+            "title": broadcast_data.title,
+            "message": broadcast_data.message,
+            "priority": broadcast_data.priority,
+            "channels": broadcast_data.channels,
+            "recipients": result["recipients"],
+            "created_at": datetime.utcnow()
+        })
+        
+        return result
+    
+    except Exception as e:
+        logger.error(f"Broadcast notification error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to broadcast notification")
+
 @api_router.post("/notifications/{notification_id}/mark-read")
 async def mark_notification_read(
     notification_id: str,
@@ -1050,13 +1464,7 @@ async def mark_notification_read(
 ):
     """Mark a notification as read"""
     try:
-        # Update notification
-        result = await db.notifications.update_one(
-            {"id": notification_id, "user_id": current_user["id"]},
-            {"$set": {"is_read": True}}
-        )
-        
-        if result.matched_count == 0:
+        if not await mark_user_notification_read(notification_id, current_user["id"]):
             raise HTTPException(status_code=404, detail="Notification not found")
         
         return {"message": "Notification marked as read"}
@@ -1084,6 +1492,32 @@ async def get_current_user_info(current_user: dict = Depends(get_current_user)):
 async def get_states():
     return {"states": ALGERIAN_STATES}
 
+@api_router.get("/media/variant")
+async def get_media_variant(url: str, width: int = DERIVATIVE_SIZES["card"]):
+    """Redirect to the smallest stored variant of an image covering the requested width"""
+    if not is_image_url(url):
+        raise HTTPException(status_code=400, detail="Not an image URL")
+    
+    variant = next((name for name, size in DERIVATIVE_SIZES.items() if size >= width), "full")
+    
+    if is_cloudinary_url(url):
+        return RedirectResponse(cloudinary_derivative_url(url, variant))
+    
+    if image_pipeline.local_path(url) is None:
+        raise HTTPException(status_code=400, detail="Only uploaded images have variants")
+    
+    # Private images: the caller must already hold a signed link to the original
+    if not upload_signer.verify_url(url):
+        raise HTTPException(status_code=403, detail="Invalid or expired file link")
+    
+    original_url = url.split('?')[0]
+    variant_url = derivative_url(original_url, variant)
+    if image_pipeline.local_path(variant_url).exists():
+        return RedirectResponse(upload_signer.sign(variant_url))
+    
+    # Variants not generated yet: serve the original
+    return RedirectResponse(upload_signer.sign(original_url))
+
 @api_router.post("/auth/register", response_model=dict)
 async def register_user(
     email: str = Form(...),
@@ -1127,6 +1561,7 @@ async def register_user(
                 # Upload with fallback (Cloudinary or local storage)
                 upload_result = await upload_file_with_fallback(profile_photo, "profile_photos", "image")
                 profile_photo_url = upload_result["file_url"]
+                image_pipeline.schedule(profile_photo_url, partial(record_image_derivatives, owner="profile_photo"))
             except Exception as e:
                 logger.warning(f"Failed to upload profile photo: {str(e)}")
                 profile_photo_url = None
@@ -1241,9 +1676,8 @@ async def get_dashboard_data(current_user: dict = Depends(get_current_user)):
         dashboard_data["documents"] = serialize_doc(documents)
         
         # Get user's notifications
-        notifications_cursor = db.notifications.find({"user_id": current_user["id"]}).sort("created_at", -1).limit(10)
-        notifications = await notifications_cursor.to_list(length=None)
-        dashboard_data["notifications"] = serialize_doc(notifications)
+        feed = await notification_service.get_user_notifications(current_user["id"], limit=10)
+        dashboard_data["notifications"] = feed["notifications"]
         
         return dashboard_data
     
@@ -1251,6 +1685,50 @@ async def get_dashboard_data(current_user: dict = Depends(get_current_user)):
         logger.error(f"Dashboard error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to load dashboard data")
 
+def build_stored_document(user_id: str, document_type: str, file_name: str, upload_result: dict) -> dict:
+    """Document record for a file stored through store_content_addressed"""
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "document_type": document_type,
+        "file_url": upload_result["file_url"],
+        "file_name": file_name,
+        "file_size": upload_result["file_size"],
+        "content_hash": upload_result["content_hash"],
+        "derivatives": upload_result["derivatives"],
+        "upload_date": datetime.utcnow(),
+        "is_verified": True,  # Auto-accept for simplified workflow
+        "status": "accepted",  # Auto-accept for simplified workflow
+        "refusal_reason": None
+    }
+
+async def release_replaced_document(existing_doc: dict, document_data: dict):
+    """Drop the stored file of a document record that has just been replaced"""
+    if existing_doc.get("content_hash"):
+        await release_content_blob(existing_doc["content_hash"])
+    elif existing_doc.get("storage_key") and existing_doc["storage_key"] != document_data.get("storage_key"):
+        try:
+            await asyncio.to_thread(delete_remote_object, "s3", existing_doc["storage_key"])
+        except Exception as e:
+            logger.error(f"Failed to delete replaced object {existing_doc['storage_key']}: {str(e)}")
+
+async def save_user_document(document_data: dict):
+    """Insert a user's document, replacing any existing one of the same type"""
+    existing_doc = await db.documents.find_one({
+        "user_id": document_data["user_id"],
+        "document_type": document_data["document_type"]
+    })
+    
+    if existing_doc:
+        await db.documents.update_one(
+            {"id": existing_doc["id"]},
+            {"$set": document_data}
+        )
+        # The replaced record no longer references its stored file
+        await release_replaced_document(existing_doc, document_data)
+    else:
+        await db.documents.insert_one(document_data)
+
 @api_router.post("/documents/upload")
 async def upload_document(
     document_type: str = Form(...),
@@ -1263,48 +1741,317 @@ async def upload_document(
         if document_type not in [doc.value for doc in DocumentType]:
             raise HTTPException(status_code=400, detail="Invalid document type")
         
-        # Upload with fallback
-        folder_name = f"documents/{document_type}"
-        upload_result = await upload_file_with_fallback(file, folder_name, "auto")
+        # Store by content hash so identical files are kept and transferred once
+        upload_result = await store_content_addressed(file, "auto")
         
         # Save document record with default status as accepted
-        document_data = {
-            "id": str(uuid.uuid4()),
-            "user_id": current_user["id"],
-            "document_type": document_type,
-            "file_url": upload_result["file_url"],
-            "file_name": file.filename,
-            "file_size": upload_result["file_size"],
-            "upload_date": datetime.utcnow(),
-            "is_verified": True,  # Auto-accept for simplified workflow
-            "status": "accepted",  # Auto-accept for simplified workflow
-            "refusal_reason": None
+        document_data = build_stored_document(current_user["id"], document_type, file.filename, upload_result)
+        try:
+            await save_user_document(document_data)
+        except Exception:
+            # No record points at the blob, so give back the reference this upload took
+            await release_content_blob(upload_result["content_hash"])
+            raise
+
+        # Newly stored images get resized variants in the background
+        if not upload_result["derivatives"]:
+            image_pipeline.schedule(upload_result["file_url"], partial(record_image_derivatives, owner="document"))
+        
+        return {
+            "message": "Document uploaded successfully",
+            "document": serialize_doc(document_data),
+            "deduplicated": upload_result["deduplicated"]
         }
+    
+    except Exception as e:
+        logger.error(f"Document upload error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to upload document")
+
+@api_router.post("/documents/upload-batch")
+async def upload_documents_batch(
+    document_types: List[str] = Form(...),
+    files: List[UploadFile] = File(...),
+    current_user: dict = Depends(get_current_user)
+):
+    """Upload several documents for the current user in one request"""
+    try:
+        if len(document_types) != len(files):
+            raise HTTPException(status_code=400, detail="Each file needs exactly one document type")
+        if len(files) > len(DocumentType):
+            raise HTTPException(status_code=400, detail="Too many files in one batch")
+        
+        valid_types = [doc.value for doc in DocumentType]
+        results = [
+            {"document_type": document_type, "file_name": file.filename, "success": False}
+            for document_type, file in zip(document_types, files)
+        ]
         
-        # Check if document already exists and update it
-        existing_doc = await db.documents.find_one({
-            "user_id": current_user["id"],
-            "document_type": document_type
-        })
+        # Reject invalid and repeated types per file, store the rest concurrently
+        pending = []
+        seen_types = set()
+        for index, document_type in enumerate(document_types):
+            if document_type not in valid_types:
+                results[index]["error"] = "Invalid document type"
+            elif document_type in seen_types:
+                results[index]["error"] = "Duplicate document type in batch"
+            else:
+                seen_types.add(document_type)
+                pending.append(index)
+        
+        stored = await asyncio.gather(
+            *(store_content_addressed(files[index], "auto") for index in pending),
+            return_exceptions=True
+        )
         
-        if existing_doc:
-            await db.documents.update_one(
-                {"id": existing_doc["id"]},
-                {"$set": document_data}
+        documents = {}
+        for index, upload_result in zip(pending, stored):
+            if isinstance(upload_result, Exception):
+                results[index]["error"] = upload_result.detail if isinstance(upload_result, HTTPException) else "Failed to store file"
+                continue
+            documents[index] = (
+                build_stored_document(current_user["id"], document_types[index], files[index].filename, upload_result),
+                upload_result
             )
-        else:
-            await db.documents.insert_one(document_data)
         
+        if documents:
+            existing_docs = await db.documents.find({
+                "user_id": current_user["id"],
+                "document_type": {"$in": [document_data["document_type"] for document_data, _ in documents.values()]}
+            }).to_list(length=None)
+            existing_by_type = {doc["document_type"]: doc for doc in existing_docs}
+            
+            # Operation i writes the document of batch index written[i]
+            written = list(documents)
+            try:
+                await db.documents.bulk_write([
+                    UpdateOne(
+                        {"user_id": current_user["id"], "document_type": documents[index][0]["document_type"]},
+                        {"$set": documents[index][0]},
+                        upsert=True
+                    )
+                    for index in written
+                ], ordered=False)
+            except BulkWriteError as e:
+                # The other operations went through: only the failed ones give back their blob reference
+                for error in e.details.get("writeErrors", []):
+                    index = written[error["index"]]
+                    document_data, _ = documents.pop(index)
+                    await release_content_blob(document_data["content_hash"])
+                    results[index]["error"] = "Failed to save document"
+            
+            for index, (document_data, upload_result) in documents.items():
+                existing_doc = existing_by_type.get(document_data["document_type"])
+                if existing_doc:
+                    await release_replaced_document(existing_doc, document_data)
+                if not upload_result["derivatives"]:
+                    image_pipeline.schedule(upload_result["file_url"], partial(record_image_derivatives, owner="document"))
+                results[index].update({
+                    "success": True,
+                    "document": serialize_doc(document_data),
+                    "deduplicated": upload_result["deduplicated"]
+                })
+        
+        uploaded = sum(1 for result in results if result["success"])
         return {
-            "message": "Document uploaded successfully",
-            "document": serialize_doc(document_data)
+            "message": f"{uploaded} of {len(results)} documents uploaded successfully",
+            "results": results
         }
     
     except Exception as e:
-        logger.error(f"Document upload error: {str(e)}")
+        logger.error(f"Batch document upload error: {str(e)}")
         if isinstance(e, HTTPException):
             raise e
-        raise HTTPException(status_code=500, detail="Failed to upload document")
+        raise HTTPException(status_code=500, detail="Failed to upload documents")
+
+# Direct-to-object-store uploads
+# The client PUTs the bytes to a presigned S3 URL and then calls the completion
+# endpoint, so file content never passes through the API workers.
+UPLOAD_GRANT_EXPIRE_SECONDS = int(os.environ.get('UPLOAD_GRANT_EXPIRE_SECONDS', '900'))
+MAX_DIRECT_UPLOAD_BYTES = int(os.environ.get('MAX_DIRECT_UPLOAD_BYTES', str(20 * 1024 * 1024)))
+# A completion that dies half-way gives its grant back once this lease runs out
+UPLOAD_COMPLETE_LEASE_SECONDS = int(os.environ.get('UPLOAD_COMPLETE_LEASE_SECONDS', '120'))
+# Local scratch space for rendering variants of images uploaded straight to the bucket
+DIRECT_UPLOAD_SCRATCH = "direct-uploads"
+
+def media_type(content_type: Optional[str]) -> str:
+    """`image/JPEG; charset=x` -> `image/jpeg`"""
+    return (content_type or "").split(";")[0].strip().lower()
+
+async def derive_direct_upload_variants(storage_key: str, file_url: str, owner: str):
+    """Variants of an image uploaded through a grant: rendered from a local copy, stored next to the original"""
+    local_url = f"{image_pipeline.url_prefix}/{DIRECT_UPLOAD_SCRATCH}/{storage_key}"
+    local_path = image_pipeline.local_path(local_url)
+    try:
+        local_path.parent.mkdir(parents=True, exist_ok=True)
+        await asyncio.to_thread(download_object, storage_key, str(local_path))
+        rendered = await image_pipeline.generate(local_url)
+        if not rendered:
+            return
+        derivatives = {}
+        for variant, variant_url in rendered.items():
+            variant_key = derivative_url(storage_key, variant)
+            await asyncio.to_thread(upload_object, str(image_pipeline.local_path(variant_url)), variant_key, "image/jpeg")
+            derivatives[variant] = s3_object_url(variant_key)
+        await record_image_derivatives(file_url, derivatives, owner)
+    except Exception as e:
+        logger.error(f"Failed to derive variants of {storage_key}: {str(e)}")
+    finally:
+        for variant in DERIVATIVE_SIZES:
+            Path(derivative_url(str(local_path), variant)).unlink(missing_ok=True)
+        local_path.unlink(missing_ok=True)
+
+async def issue_upload_grant(user_id: str, folder: str, file_name: str, content_type: str, file_size: int, target: dict) -> dict:
+    """Record an upload grant and return the presigned URL the client uploads to"""
+    if not s3_configured():
+        raise HTTPException(status_code=503, detail="Direct uploads are not configured")
+    if file_size <= 0 or file_size > MAX_DIRECT_UPLOAD_BYTES:
+        raise HTTPException(status_code=400, detail="Invalid file size")
+    
+    grant_id = str(uuid.uuid4())
+    safe_name = Path(file_name).name.replace(" ", "_") or "file"
+    storage_key = f"{folder}/{grant_id}_{safe_name}"
+    
+    grant = {
+        "id": grant_id,
+        "user_id": user_id,
+        "storage_key": storage_key,
+        "file_name": file_name,
+        "content_type": content_type,
+        "file_size": file_size,
+        "target": target,
+        "status": "issued",
+        "created_at": datetime.utcnow(),
+        "expires_at": datetime.utcnow() + timedelta(seconds=UPLOAD_GRANT_EXPIRE_SECONDS)
+    }
+    await db.upload_grants.insert_one(grant)
+    
+    return {
+        "grant_id": grant_id,
+        "upload_url": presign_put_url(storage_key, content_type, UPLOAD_GRANT_EXPIRE_SECONDS),
+        "method": "PUT",
+        "headers": {"Content-Type": content_type},
+        "expires_at": grant["expires_at"].isoformat()
+    }
+
+@api_router.post("/documents/upload-grant")
+async def create_document_upload_grant(
+    grant_data: DocumentUploadGrantCreate,
+    current_user: dict = Depends(get_current_user)
+):
+    """Issue a presigned URL for uploading a document directly to object storage"""
+    try:
+        return await issue_upload_grant(
+            current_user["id"],
+            f"documents/{grant_data.document_type.value}/{current_user['id']}",
+            grant_data.file_name,
+            grant_data.content_type,
+            grant_data.file_size,
+            {"kind": "document", "document_type": grant_data.document_type.value}
+        )
+    
+    except Exception as e:
+        logger.error(f"Document upload grant error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to create upload grant")
+
+@api_router.post("/uploads/{grant_id}/complete")
+async def complete_direct_upload(
+    grant_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Register a file uploaded through a presigned URL"""
+    try:
+        # Claim the grant atomically so a retried callback cannot register it twice;
+        # a claim held past its lease belongs to a completion that died
+        now = datetime.utcnow()
+        grant = await db.upload_grants.find_one_and_update(
+            {
+                "id": grant_id,
+                "user_id": current_user["id"],
+                "$or": [
+                    {"status": "issued"},
+                    {"status": "completing", "locked_until": {"$lt": now}}
+                ]
+            },
+            {"$set": {"status": "completing", "locked_until": now + timedelta(seconds=UPLOAD_COMPLETE_LEASE_SECONDS)}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not grant:
+            raise HTTPException(status_code=404, detail="Upload grant not found")
+        
+        try:
+            result = await register_direct_upload(grant, current_user)
+        except Exception:
+            # Let the client retry (re-uploading if needed) with the same grant
+            await db.upload_grants.update_one(
+                {"id": grant_id, "status": "completing"},
+                {"$set": {"status": "issued", "locked_until": None}}
+            )
+            raise
+        
+        await db.upload_grants.update_one(
+            {"id": grant_id},
+            {"$set": {"status": "completed", "completed_at": datetime.utcnow(), "locked_until": None}}
+        )
+        return result
+    
+    except Exception as e:
+        logger.error(f"Complete direct upload error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to complete upload")
+
+async def register_direct_upload(grant: dict, current_user: dict) -> dict:
+    """Check the object a claimed grant points at and attach it to its target record"""
+    if grant["expires_at"] < datetime.utcnow():
+        await db.upload_grants.update_one({"id": grant["id"]}, {"$set": {"status": "expired", "locked_until": None}})
+        raise HTTPException(status_code=410, detail="Upload grant has expired")
+    
+    stored = await asyncio.to_thread(head_object, grant["storage_key"])
+    if not stored:
+        raise HTTPException(status_code=400, detail="Uploaded file not found")
+    if stored["size"] != grant["file_size"] or media_type(stored["content_type"]) != media_type(grant["content_type"]):
+        # Not the file the grant was issued for: nothing will ever reference it
+        await asyncio.to_thread(delete_remote_object, "s3", grant["storage_key"])
+        raise HTTPException(status_code=400, detail="Uploaded file does not match the declared size and type")
+    
+    target = grant["target"]
+    
+    if target["kind"] == "document":
+        # Documents are private: the record keeps a reference to the key, presigned whenever it is served
+        file_url = private_object_url("s3", grant["storage_key"])
+        document_data = {
+            "id": str(uuid.uuid4()),
+            "user_id": current_user["id"],
+            "document_type": target["document_type"],
+            "file_url": file_url,
+            "file_name": grant["file_name"],
+            "file_size": stored["size"],
+            "storage_key": grant["storage_key"],
+            "content_hash": None,
+            "derivatives": None,
+            "upload_date": datetime.utcnow(),
+            "is_verified": True,  # Auto-accept for simplified workflow
+            "status": "accepted",  # Auto-accept for simplified workflow
+            "refusal_reason": None
+        }
+        await save_user_document(document_data)
+        result = {"message": "Document uploaded successfully", "document": serialize_doc(document_data)}
+    else:
+        file_url = s3_object_url(grant["storage_key"])
+        if target["photo_type"] == "logo":
+            await db.driving_schools.update_one({"id": target["school_id"]}, {"$set": {"logo_url": file_url}})
+        else:
+            await db.driving_schools.update_one({"id": target["school_id"]}, {"$push": {"photos": file_url}})
+        if is_image_url(file_url):
+            owner = "school_logo" if target["photo_type"] == "logo" else "school_photo"
+            image_pipeline.submit(derive_direct_upload_variants(grant["storage_key"], file_url, owner))
+        result = {"message": f"School {target['photo_type']} uploaded successfully", "file_url": file_url}
+    
+    return result
 
 @api_router.get("/documents")
 async def get_user_documents(current_user: dict = Depends(get_current_user)):
@@ -1382,7 +2129,8 @@ async def get_driving_schools(
     sort_by: str = "name",  # name, price, rating, newest
     sort_order: str = "asc",  # asc, desc
     page: int = 1,
-    limit: int = 20
+    limit: int = 20,
+    image_variant: str = None  # thumbnail, card, full
 ):
     try:
         # Build query
@@ -1440,6 +2188,10 @@ async def get_driving_schools(
         has_next = page < total_pages
         has_prev = page > 1
         
+        # Serve resized photos instead of camera originals when requested
+        if image_variant in DERIVATIVE_SIZES:
+            schools = [apply_school_image_variant(school, image_variant) for school in schools]
+        
         # Serialize the schools data
         schools_serialized = serialize_doc(schools)
         
@@ -1636,11 +2388,8 @@ async def create_enrollment(
                 dashboard_data["courses"] = serialize_doc(courses)
         
         # Get recent notifications
-        notifications_cursor = db.notifications.find(
-            {"user_id": current_user["id"]}
-        ).sort("created_at", -1).limit(10)
-        notifications = await notifications_cursor.to_list(length=None)
-        dashboard_data["notifications"] = serialize_doc(notifications)
+        feed = await notification_service.get_user_notifications(current_user["id"], limit=10)
+        dashboard_data["notifications"] = feed["notifications"]
         
         return dashboard_data
     
@@ -1923,7 +2672,7 @@ async def accept_student_enrollment(
             },
             "created_at": datetime.utcnow()
         }
-        await db.notifications.insert_one(notification_doc)
+        await insert_notification(notification_doc)
         
         return {
             "message": "Student enrollment accepted successfully",
@@ -1978,7 +2727,7 @@ async def reject_enrollment(
             "metadata": {"enrollment_id": enrollment_id, "school_name": school["name"], "reason": reason},
             "created_at": datetime.utcnow()
         }
-        await db.notifications.insert_one(notification_doc)
+        await insert_notification(notification_doc)
         
         return {"message": "Enrollment rejected"}
     
@@ -2113,7 +2862,7 @@ async def refuse_student_enrollment(
             },
             "created_at": datetime.utcnow()
         }
-        await db.notifications.insert_one(notification_doc)
+        await insert_notification(notification_doc)
         
         return {
             "message": "Student enrollment refused successfully",
@@ -2271,7 +3020,7 @@ async def reject_document(
             "metadata": {"document_type": document["document_type"], "reason": reason},
             "created_at": datetime.utcnow()
         }
-        await db.notifications.insert_one(notification_doc)
+        await insert_notification(notification_doc)
         
         return {"message": "Document rejected successfully"}
     
@@ -2316,6 +3065,8 @@ async def create_driving_school(
             "manager_id": current_user["id"],
             "latitude": school_data.latitude,
             "longitude": school_data.longitude,
+            "certificate_language": school_data.certificate_language.value,
+            "certificate_color": school_data.certificate_color,
             "created_at": datetime.utcnow()
         }
         
@@ -2372,7 +3123,9 @@ async def update_driving_school(
             "description": school_data.description,
             "price": school_data.price,
             "latitude": school_data.latitude,
-            "longitude": school_data.longitude
+            "longitude": school_data.longitude,
+            "certificate_language": school_data.certificate_language.value,
+            "certificate_color": school_data.certificate_color
         }
         
         await db.driving_schools.update_one(
@@ -2423,6 +3176,9 @@ async def upload_school_photo(
                 {"$push": {"photos": upload_result["file_url"]}}
             )
         
+        owner = "school_logo" if photo_type == "logo" else "school_photo"
+        image_pipeline.schedule(upload_result["file_url"], partial(record_image_derivatives, owner=owner))
+        
         return {
             "message": f"School {photo_type} uploaded successfully",
             "file_url": upload_result["file_url"]
@@ -2434,6 +3190,44 @@ async def upload_school_photo(
             raise e
         raise HTTPException(status_code=500, detail="Failed to upload photo")
 
+@api_router.post("/driving-schools/{school_id}/upload-photo-grant")
+async def create_school_photo_upload_grant(
+    school_id: str,
+    grant_data: SchoolPhotoUploadGrantCreate,
+    current_user = Depends(get_current_user)
+):
+    """Issue a presigned URL for uploading a school photo directly to object storage"""
+    try:
+        if current_user["role"] != "manager":
+            raise HTTPException(status_code=403, detail="Only managers can upload school photos")
+        
+        # Verify ownership
+        school = await db.driving_schools.find_one({
+            "id": school_id,
+            "manager_id": current_user["id"]
+        })
+        if not school:
+            raise HTTPException(status_code=404, detail="Driving school not found or unauthorized")
+        
+        if not media_type(grant_data.content_type).startswith("image/"):
+            raise HTTPException(status_code=400, detail="School photos must be images")
+        
+        photo_type = "logo" if grant_data.photo_type == "logo" else "photo"
+        return await issue_upload_grant(
+            current_user["id"],
+            f"driving_schools/{school_id}/{photo_type}",
+            grant_data.file_name,
+            grant_data.content_type,
+            grant_data.file_size,
+            {"kind": "school_photo", "school_id": school_id, "photo_type": photo_type}
+        )
+    
+    except Exception as e:
+        logger.error(f"School photo upload grant error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to create upload grant")
+
 # TEACHER MANAGEMENT ENDPOINTS
 
 @api_router.post("/teachers/add")
@@ -2823,6 +3617,18 @@ async def delete_daily_room(room_name: str) -> bool:
         logger.error(f"Error deleting Daily.co room: {str(e)}")
         return False
 
+def parse_event_time(value: str, event: str = "Session") -> datetime:
+    """Event start as naive UTC, the form reminders and stored times use; must be in the future"""
+    try:
+        scheduled_at = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+    if scheduled_at.tzinfo is not None:
+        raise HTTPException(status_code=400, detail=f"{event} time must be a UTC time without offset")
+    if scheduled_at <= datetime.utcnow():
+        raise HTTPException(status_code=400, detail=f"{event} time must be in the future")
+    return scheduled_at
+
 # VIDEO ROOM ENDPOINTS
 
 @api_router.post("/video-rooms")
@@ -2844,6 +3650,8 @@ async def create_video_room(
         if not student:
             raise HTTPException(status_code=404, detail="Student not found")
         
+        scheduled_at = parse_event_time(room_data.scheduled_at, "Video lesson")
+        
         # Create unique room name
         room_id = str(uuid.uuid4())
         room_name = f"driving-school-{course['id'][:8]}-{int(datetime.utcnow().timestamp())}"
@@ -2858,7 +3666,7 @@ async def create_video_room(
             "student_id": room_data.student_id,
             "room_url": daily_room["url"],
             "room_name": daily_room["name"],
-            "scheduled_at": datetime.fromisoformat(room_data.scheduled_at),
+            "scheduled_at": scheduled_at,
             "duration_minutes": room_data.duration_minutes,
             "is_active": True,
             "daily_room_id": daily_room["id"],
@@ -2868,6 +3676,14 @@ async def create_video_room(
         }
         
         await db.video_rooms.insert_one(room_doc)
+        await reminder_scheduler.schedule(
+            "video_room",
+            room_id,
+            [room_data.student_id, current_user["id"]],
+            room_doc["scheduled_at"],
+            "Video Lesson Reminder",
+            f"Your video lesson with {room_doc['teacher_name']} and {room_doc['student_name']} starts {{when}} ({room_doc['scheduled_at'].strftime('%H:%M')})"
+        )
         
         return {
             "id": room_id,
@@ -2908,6 +3724,37 @@ async def get_my_video_rooms(current_user = Depends(get_current_user)):
             raise e
         raise HTTPException(status_code=500, detail="Failed to retrieve video rooms")
 
+@api_router.post("/video-rooms/{room_id}/cancel")
+async def cancel_video_room(
+    room_id: str,
+    current_user = Depends(get_current_user)
+):
+    """Cancel a video lesson, closing its room and its pending reminders"""
+    try:
+        room = await db.video_rooms.find_one({"id": room_id})
+        if not room:
+            raise HTTPException(status_code=404, detail="Video room not found")
+        if current_user["id"] not in (room["teacher_id"], room["student_id"]):
+            raise HTTPException(status_code=403, detail="Not authorized to cancel this video room")
+
+        result = await db.video_rooms.update_one(
+            {"id": room_id, "is_active": True},
+            {"$set": {"is_active": False, "cancelled_at": datetime.utcnow()}}
+        )
+        if result.modified_count == 0:
+            raise HTTPException(status_code=400, detail="Video room is no longer active")
+
+        await reminder_scheduler.cancel("video_room", room_id)
+        await delete_daily_room(room["room_name"])
+
+        return {"message": "Video room cancelled successfully"}
+
+    except Exception as e:
+        logger.error(f"Cancel video room error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to cancel video room")
+
 # EXTERNAL EXPERT ENDPOINTS
 
 @api_router.post("/external-experts/register")
@@ -2995,6 +3842,8 @@ async def schedule_session(
         if not teacher:
             raise HTTPException(status_code=404, detail="Teacher not found or not approved")
         
+        scheduled_at = parse_event_time(session_data.scheduled_at)
+        
         # Create session
         session_id = str(uuid.uuid4())
         session_doc = {
@@ -3003,7 +3852,7 @@ async def schedule_session(
             "teacher_id": session_data.teacher_id,
             "student_id": current_user["id"],
             "session_type": course["course_type"],
-            "scheduled_at": datetime.fromisoformat(session_data.scheduled_at),
+            "scheduled_at": scheduled_at,
             "duration_minutes": session_data.duration_minutes,
             "location": session_data.location,
             "status": SessionStatus.SCHEDULED,
@@ -3013,6 +3862,14 @@ async def schedule_session(
         }
         
         await db.sessions.insert_one(session_doc)
+        await reminder_scheduler.schedule(
+            "session",
+            session_id,
+            [current_user["id"], teacher["user_id"]],
+            session_doc["scheduled_at"],
+            "Session Reminder",
+            f"Your {session_doc['session_type']} session starts {{when}} at {session_doc['scheduled_at'].strftime('%H:%M')}"
+        )
         
         return {"session_id": session_id, "message": "Session scheduled successfully"}
     
@@ -3070,6 +3927,7 @@ async def complete_session(
                 }
             }
         )
+        await reminder_scheduler.cancel("session", session_id)
         
         # Update course progress
         course = await db.courses.find_one({"id": session["course_id"]})
@@ -3106,6 +3964,91 @@ async def complete_session(
             raise e
         raise HTTPException(status_code=500, detail="Failed to complete session")
 
+async def get_changeable_session(session_id: str, current_user: dict) -> tuple:
+    """Scheduled session the current user may cancel or reschedule, with its teacher.
+    
+    Students change their own sessions, teachers the sessions they teach and
+    managers the sessions taught at their school.
+    """
+    if current_user["role"] not in ["student", "teacher", "manager"]:
+        raise HTTPException(status_code=403, detail="Not authorized to change sessions")
+    
+    session = await db.sessions.find_one({"id": session_id})
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    teacher = await db.teachers.find_one({"id": session["teacher_id"]}) or {}
+    if current_user["role"] == "student":
+        allowed = session["student_id"] == current_user["id"]
+    elif current_user["role"] == "teacher":
+        allowed = teacher.get("user_id") == current_user["id"]
+    else:
+        allowed = bool(teacher) and await db.driving_schools.find_one(
+            {"id": teacher.get("driving_school_id"), "manager_id": current_user["id"]}, {"_id": 0, "id": 1}
+        ) is not None
+    if not allowed:
+        raise HTTPException(status_code=403, detail="Not authorized to change this session")
+    
+    if session["status"] != SessionStatus.SCHEDULED:
+        raise HTTPException(status_code=400, detail="Only scheduled sessions can be changed")
+    
+    return session, teacher
+
+@api_router.post("/sessions/{session_id}/cancel")
+async def cancel_session(
+    session_id: str,
+    current_user = Depends(get_current_user)
+):
+    """Cancel a scheduled session and its pending reminders"""
+    try:
+        await get_changeable_session(session_id, current_user)
+        
+        await db.sessions.update_one(
+            {"id": session_id},
+            {"$set": {"status": SessionStatus.CANCELLED, "updated_at": datetime.utcnow()}}
+        )
+        await reminder_scheduler.cancel("session", session_id)
+        
+        return {"message": "Session cancelled successfully"}
+    
+    except Exception as e:
+        logger.error(f"Cancel session error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to cancel session")
+
+@api_router.post("/sessions/{session_id}/reschedule")
+async def reschedule_session(
+    session_id: str,
+    scheduled_at: str = Form(...),
+    current_user = Depends(get_current_user)
+):
+    """Move a scheduled session; its reminders move with it"""
+    try:
+        session, teacher = await get_changeable_session(session_id, current_user)
+        new_time = parse_event_time(scheduled_at)
+        
+        await db.sessions.update_one(
+            {"id": session_id},
+            {"$set": {"scheduled_at": new_time, "updated_at": datetime.utcnow()}}
+        )
+        await reminder_scheduler.reschedule(
+            "session",
+            session_id,
+            [session["student_id"], *([teacher["user_id"]] if teacher.get("user_id") else [])],
+            new_time,
+            "Session Reminder",
+            f"Your {session['session_type']} session starts {{when}} at {new_time.strftime('%H:%M')}"
+        )
+        
+        return {"message": "Session rescheduled successfully", "scheduled_at": new_time.isoformat()}
+    
+    except Exception as e:
+        logger.error(f"Reschedule session error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to reschedule session")
+
 # EXAM MANAGEMENT ENDPOINTS
 
 @api_router.post("/exams/schedule")
@@ -3135,6 +4078,10 @@ async def schedule_exam(
         if not experts:
             raise HTTPException(status_code=404, detail="No available external experts for this exam type")
         
+        if not exam_data.preferred_dates:
+            raise HTTPException(status_code=400, detail="At least one preferred date is required")
+        scheduled_at = parse_event_time(exam_data.preferred_dates[0], "Exam")  # Use first preferred date
+        
         # Select first available expert (in real app, would have better logic)
         expert = experts[0]
         
@@ -3146,7 +4093,7 @@ async def schedule_exam(
             "student_id": current_user["id"],
             "external_expert_id": expert["id"],
             "exam_type": exam_data.exam_type,
-            "scheduled_at": datetime.fromisoformat(exam_data.preferred_dates[0]),  # Use first preferred date
+            "scheduled_at": scheduled_at,
             "location": exam_data.location,
             "duration_minutes": 90,
             "status": ExamStatus.AVAILABLE,
@@ -3156,6 +4103,14 @@ async def schedule_exam(
         }
         
         await db.exam_schedules.insert_one(exam_doc)
+        await reminder_scheduler.schedule(
+            "exam",
+            exam_id,
+            [current_user["id"]],
+            exam_doc["scheduled_at"],
+            "Exam Reminder",
+            f"Your {exam_data.exam_type} exam starts {{when}} at {exam_doc['scheduled_at'].strftime('%H:%M')}"
+        )
         
         return {"exam_id": exam_id, "message": "Exam scheduled successfully"}
     
@@ -3253,6 +4208,7 @@ async def complete_exam(
                 }
             }
         )
+        await reminder_scheduler.cancel("exam", exam_id)
         
         # Update course exam status
         await db.courses.update_one(
@@ -3298,44 +4254,374 @@ async def get_my_certificates(current_user = Depends(get_current_user)):
             raise e
         raise HTTPException(status_code=500, detail="Failed to retrieve certificates")
 
+# Certificate batch jobs: a school graduates many students at once
+certificate_batch_tasks = set()
+
+async def find_eligible_enrollments(school_id: str) -> List[dict]:
+    """Enrollments of a school whose courses have all been passed"""
+    enrollments = await db.enrollments.find({"driving_school_id": school_id}).to_list(length=None)
+    if not enrollments:
+        return []
+    
+    completed = await db.courses.aggregate([
+        {"$match": {"enrollment_id": {"$in": [enrollment["id"] for enrollment in enrollments]}}},
+        {"$group": {
+            "_id": "$enrollment_id",
+            "total": {"$sum": 1},
+            "passed": {"$sum": {"$cond": [{"$eq": ["$exam_status", ExamStatus.PASSED.value]}, 1, 0]}}
+        }},
+        {"$match": {"$expr": {"$eq": ["$total", "$passed"]}}}
+    ]).to_list(length=None)
+    completed_ids = {group["_id"] for group in completed}
+    
+    return [enrollment for enrollment in enrollments if enrollment["id"] in completed_ids]
+
+async def run_certificate_batch(batch_id: str, school: dict):
+    """Issue certificates for every eligible enrollment and render their PDFs in parallel"""
+    try:
+        eligible = await find_eligible_enrollments(school["id"])
+        enrollment_ids = [enrollment["id"] for enrollment in eligible]
+        
+        existing = await db.certificates.find({"enrollment_id": {"$in": enrollment_ids}}).to_list(length=None)
+        existing_by_enrollment = {certificate["enrollment_id"]: certificate for certificate in existing}
+        students = await db.users.find({"id": {"$in": [enrollment["student_id"] for enrollment in eligible]}}).to_list(length=None)
+        students_by_id = {student["id"]: student for student in students}
+        
+        to_issue = [
+            enrollment for enrollment in eligible
+            if enrollment["id"] not in existing_by_enrollment and enrollment["student_id"] in students_by_id
+        ]
+        
+        # One number reservation per state for the whole batch
+        enrollments_by_state = {}
+        for enrollment in to_issue:
+            enrollments_by_state.setdefault(students_by_id[enrollment["student_id"]]["state"], []).append(enrollment)
+        new_certificates = []
+        for state, state_enrollments in enrollments_by_state.items():
+            numbers = await certificate_numbers.allocate_many(state, len(state_enrollments))
+            new_certificates.extend(
+                build_certificate(enrollment, students_by_id[enrollment["student_id"]], number)
+                for enrollment, number in zip(state_enrollments, numbers)
+            )
+        if new_certificates:
+            try:
+                await db.certificates.insert_many(new_certificates, ordered=False)
+            except BulkWriteError as e:
+                # A concurrent batch or exam completion certified these enrollments first: keep its certificates
+                failed = [new_certificates[error["index"]] for error in e.details.get("writeErrors", [])]
+                if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+                failed_ids = {certificate["id"] for certificate in failed}
+                new_certificates = [certificate for certificate in new_certificates if certificate["id"] not in failed_ids]
+                existing += await db.certificates.find(
+                    {"enrollment_id": {"$in": [certificate["enrollment_id"] for certificate in failed]}}
+                ).to_list(length=None)
+            if new_certificates:
+                await insert_notifications([certificate_ready_notification(certificate) for certificate in new_certificates])
+        
+        certificates = existing + new_certificates
+        pending = [certificate for certificate in certificates if not certificate.get("pdf_url")]
+        await db.certificate_batches.update_one(
+            {"id": batch_id},
+            {"$set": {
+                "total": len(certificates),
+                "completed": len(certificates) - len(pending),
+                "certificate_ids": [certificate["id"] for certificate in certificates]
+            }}
+        )
+        
+        async def render(certificate: dict):
+            try:
+                render_data = certificate_render_data(certificate, students_by_id[certificate["student_id"]], school)
+                result = await certificate_renderer.render(certificate["id"], render_data)
+                await record_certificate_pdf(certificate["id"], result)
+                await db.certificate_batches.update_one({"id": batch_id}, {"$inc": {"completed": 1}})
+            except Exception as e:
+                logger.error(f"Batch certificate rendering failed for {certificate['id']}: {str(e)}")
+                await db.certificate_batches.update_one({"id": batch_id}, {"$inc": {"failed": 1}})
+        
+        # The renderer's process pool spreads the PDFs across CPU cores
+        await asyncio.gather(*(render(certificate) for certificate in pending))
+        
+        await db.certificate_batches.update_one(
+            {"id": batch_id},
+            {"$set": {"status": "completed", "finished_at": datetime.utcnow()}}
+        )
+    except Exception as e:
+        logger.error(f"Certificate batch {batch_id} error: {str(e)}")
+        await db.certificate_batches.update_one(
+            {"id": batch_id},
+            {"$set": {"status": "failed", "error": str(e), "finished_at": datetime.utcnow()}}
+        )
+
+async def get_manager_batch(batch_id: str, current_user: dict) -> dict:
+    if current_user["role"] != "manager":
+        raise HTTPException(status_code=403, detail="Only managers can manage certificate batches")
+    batch = await db.certificate_batches.find_one({"id": batch_id, "manager_id": current_user["id"]})
+    if not batch:
+        raise HTTPException(status_code=404, detail="Certificate batch not found")
+    return batch
+
+@api_router.post("/certificates/batches")
+async def create_certificate_batch(current_user = Depends(get_current_user)):
+    """Start generating certificates for every student of the manager's school who passed all exams"""
+    try:
+        if current_user["role"] != "manager":
+            raise HTTPException(status_code=403, detail="Only managers can generate certificate batches")
+        
+        school = await db.driving_schools.find_one({"manager_id": current_user["id"]})
+        if not school:
+            raise HTTPException(status_code=404, detail="No driving school found for this manager")
+        
+        batch = {
+            "id": str(uuid.uuid4()),
+            "school_id": school["id"],
+            "manager_id": current_user["id"],
+            "status": "running",
+            "total": None,
+            "completed": 0,
+            "failed": 0,
+            "certificate_ids": [],
+            "created_at": datetime.utcnow(),
+            "finished_at": None
+        }
+        await db.certificate_batches.insert_one(batch)
+        
+        task = asyncio.create_task(run_certificate_batch(batch["id"], school))
+        certificate_batch_tasks.add(task)
+        task.add_done_callback(certificate_batch_tasks.discard)
+        
+        return serialize_doc(batch)
+    
+    except Exception as e:
+        logger.error(f"Create certificate batch error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to start certificate batch")
+
+@api_router.get("/certificates/batches/{batch_id}")
+async def get_certificate_batch(batch_id: str, current_user = Depends(get_current_user)):
+    """Progress of a certificate batch"""
+    try:
+        batch = await get_manager_batch(batch_id, current_user)
+        batch.pop("certificate_ids", None)
+        return serialize_doc(batch)
+    
+    except Exception as e:
+        logger.error(f"Get certificate batch error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to retrieve certificate batch")
+
+@api_router.get("/certificates/batches/{batch_id}/download")
+async def download_certificate_batch(batch_id: str, current_user = Depends(get_current_user)):
+    """Stream every rendered certificate of a batch as a ZIP archive"""
+    try:
+        batch = await get_manager_batch(batch_id, current_user)
+        if batch["status"] == "running":
+            raise HTTPException(status_code=409, detail="Certificate batch is still running")
+        
+        certificates = await db.certificates.find(
+            {"id": {"$in": batch["certificate_ids"]}, "pdf_url": {"$ne": None}},
+            {"id": 1, "certificate_number": 1}
+        ).to_list(length=None)
+        
+        # Rendered PDFs keep their local copy after cloud replication
+        certificate_dir = certificate_renderer.uploads_dir / CERTIFICATE_FOLDER
+        files = [
+            (f"{certificate['certificate_number']}.pdf", certificate_dir / f"{certificate['id']}.pdf")
+            for certificate in certificates
+            if (certificate_dir / f"{certificate['id']}.pdf").exists()
+        ]
+        
+        return StreamingResponse(
+            stream_zip(files),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="certificates-{batch_id}.zip"'}
+        )
+    
+    except Exception as e:
+        logger.error(f"Download certificate batch error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to download certificate batch")
+
+@api_router.get("/certificates/{cert_id}/qr.svg")
+async def get_certificate_qr(cert_id: str):
+    """Verification QR code of a certificate as SVG"""
+    try:
+        certificate = await db.certificates.find_one({"id": cert_id}, {"certificate_number": 1, "qr_payload": 1})
+        if not certificate:
+            raise HTTPException(status_code=404, detail="Certificate not found")
+        
+        return Response(
+            content=render_qr_svg(verification_payload(certificate)),
+            media_type="image/svg+xml",
+            headers={"Cache-Control": "public, max-age=86400"}
+        )
+    
+    except Exception as e:
+        logger.error(f"Certificate QR error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to render QR code")
+
+async def load_certificate_verification(cert_id: str) -> Optional[dict]:
+    """Verification record of a certificate, read through the in-process cache"""
+    record = verification_cache.get(cert_id)
+    if record is not None:
+        return record
+    
+    certificate = await db.certificates.find_one({"id": cert_id})
+    if not certificate:
+        return None
+    student = await db.users.find_one({"id": certificate["student_id"]}, {"first_name": 1, "last_name": 1})
+    
+    record = {
+        "certificate_number": certificate["certificate_number"],
+        "student_name": f"{student['first_name']} {student['last_name']}" if student else "Unknown",
+        "issue_date": certificate["issue_date"],
+        "expiry_date": certificate.get("expiry_date"),
+        "status": certificate["status"]
+    }
+    verification_cache.set(cert_id, record)
+    return record
+
+def certificate_verification_response(record: dict) -> dict:
+    return {
+        **record,
+        "is_valid": record["status"] == "issued" and 
+                   (not record.get("expiry_date") or 
+                    datetime.utcnow() < record["expiry_date"])
+    }
+
+@api_router.get("/certificates/public-key")
+async def get_certificate_public_key():
+    """Public key for verifying certificate QR payloads offline"""
+    return {
+        "algorithm": "Ed25519",
+        "public_key": certificate_signer.public_key_b64,
+        "public_key_pem": certificate_signer.public_key_pem
+    }
+
+@api_router.get("/certificates/verify-payload")
+async def verify_certificate_payload(payload: str):
+    """Check a scanned QR payload's signature, then its revocation status"""
+    try:
+        fields = CertificateSigner.verify(payload, certificate_signer.public_key)
+        if not fields:
+            return {"signature_valid": False, "is_valid": False}
+        
+        record = await load_certificate_verification(fields["id"])
+        if not record:
+            raise HTTPException(status_code=404, detail="Certificate not found")
+        
+        return {"signature_valid": True, **fields, **certificate_verification_response(record)}
+    
+    except Exception as e:
+        logger.error(f"Verify certificate payload error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to verify certificate")
+
 @api_router.get("/certificates/{cert_id}/verify")
 async def verify_certificate(cert_id: str):
     try:
+        record = await load_certificate_verification(cert_id)
+        if not record:
+            raise HTTPException(status_code=404, detail="Certificate not found")
+        
+        return certificate_verification_response(record)
+    
+    except Exception as e:
+        logger.error(f"Verify certificate error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to verify certificate")
+
+@api_router.post("/certificates/{cert_id}/revoke")
+async def revoke_certificate(
+    cert_id: str,
+    reason: str = Form(""),
+    current_user = Depends(get_current_user)
+):
+    """Revoke a certificate issued by the manager's school"""
+    try:
+        if current_user["role"] != "manager":
+            raise HTTPException(status_code=403, detail="Only managers can revoke certificates")
+        
         certificate = await db.certificates.find_one({"id": cert_id})
         if not certificate:
             raise HTTPException(status_code=404, detail="Certificate not found")
         
-        # Get student details
-        student = await db.users.find_one({"id": certificate["student_id"]})
-        
-        verification_data = {
-            "certificate_number": certificate["certificate_number"],
-            "student_name": f"{student['first_name']} {student['last_name']}" if student else "Unknown",
-            "issue_date": certificate["issue_date"],
-            "expiry_date": certificate.get("expiry_date"),
-            "status": certificate["status"],
-            "is_valid": certificate["status"] == "issued" and 
-                       (not certificate.get("expiry_date") or 
-                        datetime.utcnow() < certificate["expiry_date"])
-        }
+        enrollment = await db.enrollments.find_one({"id": certificate["enrollment_id"]})
+        school = await db.driving_schools.find_one({"id": enrollment["driving_school_id"]}) if enrollment else None
+        if not school or school["manager_id"] != current_user["id"]:
+            raise HTTPException(status_code=403, detail="Not authorized to revoke this certificate")
         
-        return verification_data
+        await db.certificates.update_one(
+            {"id": cert_id},
+            {"$set": {
+                "status": CertificateStatus.REVOKED,
+                "revoked_at": datetime.utcnow(),
+                "revocation_reason": reason
+            }}
+        )
+        verification_cache.invalidate(cert_id)
+        
+        return {"message": "Certificate revoked successfully"}
     
     except Exception as e:
-        logger.error(f"Verify certificate error: {str(e)}")
+        logger.error(f"Revoke certificate error: {str(e)}")
         if isinstance(e, HTTPException):
             raise e
-        raise HTTPException(status_code=500, detail="Failed to verify certificate")
+        raise HTTPException(status_code=500, detail="Failed to revoke certificate")
+
+@api_router.get("/certificates/{cert_id}/download")
+async def download_certificate(cert_id: str, current_user = Depends(get_current_user)):
+    """Redirect to the stored PDF of a certificate"""
+    try:
+        certificate = await db.certificates.find_one({"id": cert_id})
+        if not certificate:
+            raise HTTPException(status_code=404, detail="Certificate not found")
+        
+        if current_user["role"] == "manager":
+            enrollment = await db.enrollments.find_one({"id": certificate["enrollment_id"]})
+            school = await db.driving_schools.find_one({"id": enrollment["driving_school_id"]}) if enrollment else None
+            if not school or school["manager_id"] != current_user["id"]:
+                raise HTTPException(status_code=403, detail="Not authorized to download this certificate")
+        elif certificate["student_id"] != current_user["id"]:
+            raise HTTPException(status_code=403, detail="Not authorized to download this certificate")
+        
+        pdf_url = certificate.get("pdf_url")
+        if not pdf_url:
+            # Background rendering has not finished (or failed): render now
+            enrollment = await db.enrollments.find_one({"id": certificate["enrollment_id"]})
+            student = await db.users.find_one({"id": certificate["student_id"]})
+            school = await db.driving_schools.find_one({"id": enrollment["driving_school_id"]})
+            result = await certificate_renderer.render(cert_id, certificate_render_data(certificate, student, school))
+            await record_certificate_pdf(cert_id, result)
+            pdf_url = result["file_url"]
+        
+        return RedirectResponse(signed_file_url(pdf_url))
+    
+    except Exception as e:
+        logger.error(f"Download certificate error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to download certificate")
 
 # NOTIFICATION ENDPOINTS
 
 @api_router.get("/notifications/my")
-async def get_my_notifications(current_user = Depends(get_current_user)):
+async def get_my_notifications(
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    current_user = Depends(get_current_user)
+):
+    """Same page as /notifications; `next_cursor` fetches the notifications past the first 100"""
     try:
-        notifications_cursor = db.notifications.find({"user_id": current_user["id"]}).sort("created_at", -1)
-        notifications = await notifications_cursor.to_list(length=None)
-        
-        return serialize_doc(notifications)
+        return await notification_feed(current_user["id"], min(max(limit, 1), 100), cursor)
     
     except Exception as e:
         logger.error(f"Get notifications error: {str(e)}")
@@ -3349,20 +4635,9 @@ async def mark_notification_read(
     current_user = Depends(get_current_user)
 ):
     try:
-        # Verify notification ownership
-        notification = await db.notifications.find_one({
-            "id": notification_id,
-            "user_id": current_user["id"]
-        })
-        if not notification:
+        if not await mark_user_notification_read(notification_id, current_user["id"]):
             raise HTTPException(status_code=404, detail="Notification not found")
         
-        # Mark as read
-        await db.notifications.update_one(
-            {"id": notification_id},
-            {"$set": {"is_read": True}}
-        )
-        
         return {"message": "Notification marked as read"}
     
     except Exception as e:
@@ -3374,10 +4649,7 @@ async def mark_notification_read(
 @api_router.post("/notifications/mark-all-read")
 async def mark_all_notifications_read(current_user = Depends(get_current_user)):
     try:
-        await db.notifications.update_many(
-            {"user_id": current_user["id"], "is_read": False},
-            {"$set": {"is_read": True}}
-        )
+        await notification_service.mark_all_as_read(current_user["id"])
         
         return {"message": "All notifications marked as read"}
     
@@ -3803,7 +5075,7 @@ async def complete_payment(
                 "metadata": {"enrollment_id": enrollment_id},
                 "created_at": datetime.utcnow()
             }
-            await db.notifications.insert_one(notification_doc)
+            await insert_notification(notification_doc)
         
         return {"message": "Payment completed successfully"}
     
@@ -3985,7 +5257,7 @@ async def accept_document(
                         "is_read": False,
                         "created_at": datetime.utcnow()
                     }
-                    await db.notifications.insert_one(notification_doc)
+                    await insert_notification(notification_doc)
                     logger.info(f"Notification sent to student {document['user_id']}")
             else:
                 logger.info(f"Documents not yet complete for student {document['user_id']}")
@@ -4054,7 +5326,7 @@ async def refuse_document(
             "metadata": {"document_id": document_id, "document_type": document['document_type'], "reason": reason},
             "created_at": datetime.utcnow()
         }
-        await db.notifications.insert_one(notification_doc)
+        await insert_notification(notification_doc)
         
         return {"message": "Document refused successfully"}
     
@@ -4177,6 +5449,38 @@ async def get_student_progress_fixed(
         raise HTTPException(status_code=500, detail="Failed to retrieve student progress")
 
 # AUTO-GENERATE CERTIFICATE FOR COMPLETED STUDENTS
+def build_certificate(enrollment: dict, student: dict, cert_number: str) -> dict:
+    """New certificate record for a student who passed every course of an enrollment"""
+    certificate_doc = {
+        "id": str(uuid.uuid4()),
+        "student_id": enrollment["student_id"],
+        "enrollment_id": enrollment["id"],
+        "certificate_number": cert_number,
+        "issue_date": datetime.utcnow(),
+        "expiry_date": datetime.utcnow() + timedelta(days=5*365),  # 5 years
+        "status": CertificateStatus.GENERATED,
+        "pdf_url": None,
+        "qr_code": None,
+        "created_at": datetime.utcnow()
+    }
+    # Signed key fields, verifiable offline from the QR code
+    certificate_doc["qr_payload"] = certificate_signer.sign(
+        certificate_doc, f"{student['first_name']} {student['last_name']}"
+    )
+    return certificate_doc
+
+def certificate_ready_notification(certificate_doc: dict) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": certificate_doc["student_id"],
+        "type": NotificationType.CERTIFICATE_READY,
+        "title": "Certificate Ready!",
+        "message": f"Congratulations! Your driving certificate is ready for download.",
+        "is_read": False,
+        "metadata": {"certificate_id": certificate_doc["id"], "certificate_number": certificate_doc["certificate_number"]},
+        "created_at": datetime.utcnow()
+    }
+
 async def check_and_generate_certificate(enrollment_id: str):
     """Check if student has completed all courses and generate certificate"""
     try:
@@ -4201,38 +5505,26 @@ async def check_and_generate_certificate(enrollment_id: str):
             existing_cert = await db.certificates.find_one({"enrollment_id": enrollment_id})
             if not existing_cert:
                 # Generate certificate
-                cert_id = str(uuid.uuid4())
-                cert_number = f"DZ-{student['state'][:3].upper()}-{int(datetime.utcnow().timestamp())}"
-                
-                certificate_doc = {
-                    "id": cert_id,
-                    "student_id": enrollment["student_id"],
-                    "enrollment_id": enrollment_id,
-                    "certificate_number": cert_number,
-                    "issue_date": datetime.utcnow(),
-                    "expiry_date": datetime.utcnow() + timedelta(days=5*365),  # 5 years
-                    "status": CertificateStatus.GENERATED,
-                    "pdf_url": None,
-                    "qr_code": None,
-                    "created_at": datetime.utcnow()
-                }
+                cert_number = await certificate_numbers.allocate(student["state"])
+                certificate_doc = build_certificate(enrollment, student, cert_number)
+                try:
+                    await db.certificates.insert_one(certificate_doc)
+                except DuplicateKeyError:
+                    # Issued concurrently (by a batch or another exam completion)
+                    existing_cert = await db.certificates.find_one({"enrollment_id": enrollment_id})
+                    return existing_cert["id"] if existing_cert else None
                 
-                await db.certificates.insert_one(certificate_doc)
+                # Render the PDF once in the background; downloads then serve the stored file
+                certificate_renderer.schedule(
+                    certificate_doc["id"],
+                    certificate_render_data(certificate_doc, student, school),
+                    record_certificate_pdf
+                )
                 
                 # Send notification
-                notification_doc = {
-                    "id": str(uuid.uuid4()),
-                    "user_id": enrollment["student_id"],
-                    "type": NotificationType.CERTIFICATE_READY,
-                    "title": "Certificate Ready!",
-                    "message": f"Congratulations! Your driving certificate is ready for download.",
-                    "is_read": False,
-                    "metadata": {"certificate_id": cert_id, "certificate_number": cert_number},
-                    "created_at": datetime.utcnow()
-                }
-                await db.notifications.insert_one(notification_doc)
+                await insert_notification(certificate_ready_notification(certificate_doc))
                 
-                return cert_id
+                return certificate_doc["id"]
         
         return None
     
@@ -4713,6 +6005,80 @@ async def get_student_enrollment_status(
             raise e
         raise HTTPException(status_code=500, detail="Failed to get enrollment status")
 
+# Every index the application relies on: (collection, keys, options)
+APP_INDEXES = [
+    ("file_blobs", "sha256", {"unique": True}),
+    ("documents", [("user_id", 1), ("document_type", 1)], {}),
+    ("documents", "content_hash", {}),
+    ("documents", "file_url", {}),
+    ("replication_queue", [("status", 1), ("enqueued_at", 1)], {}),
+    ("upload_grants", "id", {"unique": True}),
+    # Drop grants a day after they expire
+    ("upload_grants", "expires_at", {"expireAfterSeconds": 86400}),
+    ("certificate_sequences", "id", {"unique": True}),
+    ("certificates", "certificate_number", {"unique": True}),
+    # One certificate per enrollment, however many issuers race
+    ("certificates", "enrollment_id", {"unique": True}),
+    ("notification_outbox", [("status", 1), ("next_attempt_at", 1)], {}),
+    ("notification_outbox", "notification_id", {}),
+    ("notification_outbox", [("digest_key", 1), ("status", 1), ("next_attempt_at", 1)], {}),
+    ("notification_outbox", "claim", {}),
+    ("enrollments", [("driving_school_id", 1), ("enrollment_status", 1)], {}),
+    ("teachers", "driving_school_id", {}),
+    ("enhanced_notifications", [("type", 1), ("metadata.session_id", 1)], {}),
+    ("enhanced_notifications", [("user_id", 1), ("is_read", 1), ("priority", 1)], {}),
+    ("enhanced_notifications", [("user_id", 1), ("created_at", -1), ("id", -1)], {}),
+    ("enhanced_notifications", "id", {"unique": True}),
+    ("enhanced_notifications", [("expires_at", 1), ("is_read", 1)], {}),
+    ("enhanced_notifications", [("is_read", 1), ("created_at", 1)], {}),
+    # Archived notifications have no counters to keep in step, so a TTL index can purge them
+    ("enhanced_notifications_archive", "id", {"unique": True}),
+    ("enhanced_notifications_archive", "archived_at", {"expireAfterSeconds": int(os.environ.get('NOTIFICATION_ARCHIVE_TTL_DAYS', '365')) * 86400}),
+    ("notification_counters", "user_id", {"unique": True}),
+    ("enhanced_notifications", [("type", 1), ("metadata.enrollment_id", 1), ("created_at", -1)], {}),
+    ("scheduled_reminders", "id", {"unique": True}),
+    ("scheduled_reminders", [("status", 1), ("fire_at", 1)], {}),
+    ("scheduled_reminders", [("subject_type", 1), ("subject_id", 1)], {}),
+    ("scheduled_reminders", "claim", {}),
+    ("broadcast_quotas", [("driving_school_id", 1), ("window_start", 1)], {"unique": True}),
+    ("broadcast_quotas", "window_start", {"expireAfterSeconds": 7200}),
+]
+
+async def ensure_indexes() -> List[tuple]:
+    """Create every index in APP_INDEXES and return the (collection, keys) that failed"""
+    failed = []
+    # One at a time: an index that existing data prevents (e.g. a unique one over legacy
+    # duplicates) is logged without keeping the others from being built
+    for collection, keys, options in APP_INDEXES:
+        try:
+            await db[collection].create_index(keys, **options)
+        except Exception as e:
+            logger.error(f"Index creation error on {collection} {keys}: {str(e)}")
+            failed.append((collection, keys))
+    return failed
+
+@app.on_event("startup")
+async def on_startup():
+    """Create indexes required by the application and start the background workers"""
+    await ensure_indexes()
+
+    storage_replicator.start()
+    await notification_hub.start()
+    notification_service.start()
+    reminder_scheduler.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Release background worker pools"""
+    await storage_replicator.stop()
+    await notification_service.stop()
+    await reminder_scheduler.stop()
+    await notification_hub.stop()
+    image_pipeline.shutdown()
+    certificate_renderer.shutdown()
+    await close_smtp_pools()
+    await close_gateway_clients()
+
 app.include_router(api_router)
 
 if __name__ == "__main__":
@@ -0,0 +1,354 @@
+# Async SMTP Transport for Driving School Platform
+import re
+import ssl
+import time
+import base64
+import socket
+import asyncio
+import logging
+from typing import Optional, List, Dict, Tuple
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+class SMTPError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+        self.message = message
+
+    @property
+    def permanent(self) -> bool:
+        """5xx replies will not change on retry; 4xx replies are temporary"""
+        return self.code >= 500
+
+# local@domain, with nothing that could end the command or start another one (CR, LF, <, >, spaces)
+ADDRESS_PATTERN = re.compile(r'[^\s<>()\[\],;:"\\@]+@[^\s<>()\[\],;:"\\@]+')
+
+def check_address(address: str) -> str:
+    """Reject an envelope address before it is written into MAIL FROM / RCPT TO"""
+    if not isinstance(address, str) or not ADDRESS_PATTERN.fullmatch(address):
+        raise SMTPError(501, f"Invalid address: {address!r}")
+    return address
+
+class SMTPConnection:
+    """A single SMTP session: EHLO, STARTTLS, AUTH PLAIN, then any number of messages.
+
+    When the server advertises PIPELINING (RFC 2920) the envelope commands of a
+    message are written in one go and their replies read afterwards, so a
+    message costs two round trips instead of 4 + recipients.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        starttls: bool = True,
+        implicit_tls: bool = False,
+        timeout: float = 30
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.implicit_tls = implicit_tls
+        self.timeout = timeout
+        self.extensions: Dict[str, str] = {}
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.messages_sent = 0
+        # Set once the current message's content has been written: from then on it may have been delivered
+        self.data_sent = False
+
+    @property
+    def is_connected(self) -> bool:
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                self.host, self.port,
+                ssl=ssl.create_default_context() if self.implicit_tls else None
+            ),
+            timeout=self.timeout
+        )
+        await self._expect(220)
+        await self._ehlo()
+
+        if self.starttls and not self.implicit_tls:
+            if "starttls" not in self.extensions:
+                raise SMTPError(503, "Server does not support STARTTLS")
+            await self.command("STARTTLS", expect=220)
+            await self.writer.start_tls(ssl.create_default_context(), server_hostname=self.host)
+            await self._ehlo()
+
+        if self.username and self.password:
+            await self._authenticate()
+
+    async def _authenticate(self):
+        """AUTH PLAIN, or AUTH LOGIN for servers that only offer that"""
+        mechanisms = self.extensions.get("auth", "").upper().split()
+        if "PLAIN" in mechanisms or not mechanisms:
+            credentials = base64.b64encode(f"\0{self.username}\0{self.password}".encode()).decode()
+            await self.command(f"AUTH PLAIN {credentials}", expect=235)
+        elif "LOGIN" in mechanisms:
+            await self.command("AUTH LOGIN", expect=334)
+            await self.command(base64.b64encode(self.username.encode()).decode(), expect=334)
+            await self.command(base64.b64encode(self.password.encode()).decode(), expect=235)
+        else:
+            raise SMTPError(504, f"No supported authentication mechanism in {' '.join(mechanisms)}")
+
+    async def _ehlo(self):
+        code, lines = await self.command(f"EHLO {socket.getfqdn()}", expect=250)
+        self.extensions = {}
+        for line in lines[1:]:
+            keyword, _, params = line.partition(" ")
+            self.extensions[keyword.lower()] = params
+
+    async def _read_reply(self) -> Tuple[int, List[str]]:
+        lines = []
+        while True:
+            raw = await asyncio.wait_for(self.reader.readline(), timeout=self.timeout)
+            if not raw:
+                raise ConnectionError("SMTP server closed the connection")
+            line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+            lines.append(line[4:])
+            if len(line) < 4 or line[3] != "-":
+                return int(line[:3]), lines
+
+    async def _expect(self, expected: int) -> Tuple[int, List[str]]:
+        code, lines = await self._read_reply()
+        if code != expected:
+            raise SMTPError(code, " ".join(lines))
+        return code, lines
+
+    async def command(self, line: str, expect: Optional[int] = None) -> Tuple[int, List[str]]:
+        if "\r" in line or "\n" in line:
+            raise ValueError("SMTP command lines cannot contain line breaks")
+        self.writer.write(f"{line}\r\n".encode())
+        await self.writer.drain()
+        code, lines = await self._read_reply()
+        if expect is not None and code != expect:
+            raise SMTPError(code, " ".join(lines))
+        return code, lines
+
+    @staticmethod
+    def _encode_data(message: bytes) -> bytes:
+        """CRLF line endings, dot-stuffing and the terminating <CRLF>.<CRLF>"""
+        lines = message.replace(b"\r\n", b"\n").split(b"\n")
+        if lines and lines[-1] == b"":
+            lines.pop()
+        stuffed = [b"." + line if line.startswith(b".") else line for line in lines]
+        return b"\r\n".join(stuffed) + b"\r\n.\r\n"
+
+    async def send_message(self, sender: str, recipients: List[str], message: bytes) -> Dict[str, Tuple[int, str]]:
+        """Send one message; returns the recipients the server refused"""
+        self.data_sent = False
+        for address in [sender, *recipients]:
+            check_address(address)
+        envelope = [f"MAIL FROM:<{sender}>"] + [f"RCPT TO:<{recipient}>" for recipient in recipients] + ["DATA"]
+
+        if "pipelining" in self.extensions:
+            self.writer.write("".join(f"{line}\r\n" for line in envelope).encode())
+            await self.writer.drain()
+            replies = [await self._read_reply() for _ in envelope]
+        else:
+            replies = [await self.command(envelope[0])]
+            if replies[0][0] < 400:
+                replies.extend([await self.command(line) for line in envelope[1:-1]])
+                # No DATA once every recipient has been refused
+                if any(code < 400 for code, _ in replies[1:]):
+                    replies.append(await self.command(envelope[-1]))
+
+        mail_reply = replies[0]
+        rcpt_replies = replies[1:1 + len(recipients)]
+        refused = {
+            recipient: (code, " ".join(lines))
+            for recipient, (code, lines) in zip(recipients, rcpt_replies)
+            if code >= 400
+        }
+        data_reply = replies[-1] if len(replies) == len(envelope) else (503, ["DATA not sent"])
+
+        if data_reply[0] == 354:
+            if mail_reply[0] >= 400 or len(refused) == len(recipients):
+                # Server accepted DATA without a valid envelope: end it empty, then reset
+                self.writer.write(b".\r\n")
+                await self.writer.drain()
+                await self._read_reply()
+                await self.command("RSET")
+                raise SMTPError(mail_reply[0] if mail_reply[0] >= 400 else 550, "All recipients were refused")
+            self.data_sent = True
+            self.writer.write(self._encode_data(message))
+            await self.writer.drain()
+            await self._expect(250)
+        else:
+            await self.command("RSET")
+            if mail_reply[0] >= 400:
+                raise SMTPError(mail_reply[0], " ".join(mail_reply[1]))
+            if len(refused) == len(recipients):
+                code, text = next(iter(refused.values()))
+                raise SMTPError(code, f"All recipients were refused: {text}")
+            raise SMTPError(data_reply[0], " ".join(data_reply[1]))
+
+        self.messages_sent += 1
+        self.last_used = time.monotonic()
+        return refused
+
+    async def noop(self) -> bool:
+        try:
+            code, _ = await self.command("NOOP")
+            return code == 250
+        except (OSError, asyncio.TimeoutError, ConnectionError):
+            return False
+
+    async def close(self):
+        if not self.is_connected:
+            return
+        try:
+            await asyncio.wait_for(self.command("QUIT"), timeout=5)
+        except Exception:
+            pass
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except Exception:
+            pass
+
+class SMTPPool:
+    """Persistent, bounded pool of SMTP sessions reused across messages.
+
+    Idle sessions are checked with NOOP before reuse and recycled after
+    `max_messages` messages or `max_idle` seconds, before servers drop them.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        starttls: bool = True,
+        implicit_tls: bool = False,
+        size: int = 4,
+        max_idle: float = 60,
+        max_messages: int = 100
+    ):
+        self.connection_args = dict(
+            host=host, port=port, username=username, password=password,
+            starttls=starttls, implicit_tls=implicit_tls
+        )
+        self.size = size
+        self.max_idle = max_idle
+        self.max_messages = max_messages
+        self._idle: List[SMTPConnection] = []
+        self._slots = asyncio.Semaphore(size)
+        self.stats = {"sent": 0, "failed": 0, "connections_opened": 0}
+
+    async def _open(self) -> SMTPConnection:
+        connection = SMTPConnection(**self.connection_args)
+        await connection.connect()
+        self.stats["connections_opened"] += 1
+        return connection
+
+    async def _checkout(self) -> SMTPConnection:
+        while self._idle:
+            connection = self._idle.pop()
+            idle_for = time.monotonic() - connection.last_used
+            if not connection.is_connected or idle_for > self.max_idle:
+                await connection.close()
+                continue
+            # Sessions idle for a while may have been dropped by the server
+            if idle_for > 5 and not await connection.noop():
+                await connection.close()
+                continue
+            return connection
+        return await self._open()
+
+    @asynccontextmanager
+    async def connection(self):
+        async with self._slots:
+            connection = await self._checkout()
+            healthy = False
+            try:
+                yield connection
+                healthy = True
+            except SMTPError:
+                # Protocol-level refusal: the session itself is still usable
+                healthy = True
+                raise
+            finally:
+                if healthy and connection.is_connected and connection.messages_sent < self.max_messages:
+                    self._idle.append(connection)
+                else:
+                    await connection.close()
+
+    async def send(self, sender: str, recipients: List[str], message: bytes) -> Dict[str, Tuple[int, str]]:
+        """Send one message over a pooled session, retrying once on a dropped connection.
+
+        Only failures before the message content was written are retried: after
+        that the server may have accepted it, and a resend could deliver it twice.
+        """
+        # Checked before a session is taken: a bad address is final, not worth a retry
+        try:
+            for address in [sender, *recipients]:
+                check_address(address)
+        except SMTPError:
+            self.stats["failed"] += 1
+            raise
+        for attempt in range(2):
+            connection = None
+            try:
+                async with self.connection() as connection:
+                    refused = await connection.send_message(sender, recipients, message)
+                self.stats["sent"] += 1
+                return refused
+            except (ConnectionError, OSError, asyncio.TimeoutError):
+                if attempt == 1 or (connection is not None and connection.data_sent):
+                    self.stats["failed"] += 1
+                    raise
+            except SMTPError:
+                self.stats["failed"] += 1
+                raise
+
+    async def send_batch(self, messages: List[Tuple[str, List[str], bytes]]) -> List[Optional[Exception]]:
+        """Send many messages spread over the pool's sessions; returns None or the error per message"""
+        async def send_one(message):
+            try:
+                await self.send(*message)
+                return None
+            except Exception as e:
+                return e
+
+        return await asyncio.gather(*(send_one(message) for message in messages))
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(connection.close() for connection in idle), return_exceptions=True)
+
+# Pools shared by every service instance in this process, keyed by server and account
+_pools: Dict[tuple, SMTPPool] = {}
+
+def get_smtp_pool(
+    host: str,
+    port: int,
+    username: Optional[str] = None,
+    password: Optional[str] = None,
+    starttls: bool = True,
+    implicit_tls: bool = False,
+    size: int = 4
+) -> SMTPPool:
+    key = (host, port, username, starttls, implicit_tls)
+    pool = _pools.get(key)
+    if pool is None:
+        pool = _pools[key] = SMTPPool(host, port, username, password, starttls, implicit_tls, size)
+    return pool
+
+async def close_smtp_pools():
+    pools = list(_pools.values())
+    _pools.clear()
+    await asyncio.gather(*(pool.close() for pool in pools), return_exceptions=True)
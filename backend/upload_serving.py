@@ -0,0 +1,188 @@
+# Upload Serving for Driving School Platform
+import os
+import hmac
+import time
+import hashlib
+import zipfile
+import mimetypes
+from pathlib import Path
+from typing import Optional, Tuple, Iterable, Iterator
+from urllib.parse import urlencode, parse_qs
+import aiofiles
+from fastapi import Request
+from fastapi.responses import Response, FileResponse, StreamingResponse
+
+# Folders holding files shown to everyone (school galleries, profile photos);
+# everything else needs a signed URL
+PUBLIC_UPLOAD_FOLDERS = ("driving_schools/", "profile_photos/")
+
+# Uploaded files are never rewritten in place (UUID or content-hash names), so they can be cached forever
+PUBLIC_CACHE_CONTROL = "public, max-age=31536000, immutable"
+PRIVATE_CACHE_CONTROL = "private, max-age=3600, immutable"
+
+CHUNK_SIZE = 64 * 1024
+
+class UploadUrlSigner:
+    """HMAC-signed, expiring URLs for private uploads, checked without a database read"""
+
+    def __init__(self, secret_key: str, url_prefix: str = "/demo-uploads", ttl_seconds: Optional[int] = None):
+        self.secret = secret_key.encode()
+        self.url_prefix = url_prefix
+        self.ttl_seconds = ttl_seconds or int(os.environ.get('UPLOAD_URL_TTL_SECONDS', '3600'))
+
+    def is_public(self, relative_path: str) -> bool:
+        # A path climbing out of a public folder is judged as private
+        return relative_path.startswith(PUBLIC_UPLOAD_FOLDERS) and ".." not in relative_path.split("/")
+
+    def _signature(self, relative_path: str, expires: int) -> str:
+        message = f"{relative_path}:{expires}".encode()
+        return hmac.new(self.secret, message, hashlib.sha256).hexdigest()[:32]
+
+    def sign(self, file_url: str) -> str:
+        """Append an expiry and signature to a private local upload URL"""
+        if not file_url.startswith(f"{self.url_prefix}/") or '?' in file_url:
+            return file_url
+        relative_path = file_url[len(self.url_prefix) + 1:]
+        if self.is_public(relative_path):
+            return file_url
+
+        # Expiry rounded up to a window boundary so a file keeps the same URL
+        # (and stays in browser caches) for a whole window
+        expires = (int(time.time()) // self.ttl_seconds + 2) * self.ttl_seconds
+        query = urlencode({"expires": expires, "signature": self._signature(relative_path, expires)})
+        return f"{file_url}?{query}"
+
+    def verify(self, relative_path: str, expires: Optional[str], signature: Optional[str]) -> bool:
+        if self.is_public(relative_path):
+            return True
+        if not expires or not signature or not expires.isdigit():
+            return False
+        if int(expires) < time.time():
+            return False
+        return hmac.compare_digest(self._signature(relative_path, int(expires)), signature)
+
+    def verify_url(self, file_url: str) -> bool:
+        """Check the signature carried in the query string of an upload URL"""
+        path, _, query = file_url.partition('?')
+        params = parse_qs(query)
+        return self.verify(
+            path[len(self.url_prefix) + 1:],
+            params.get("expires", [None])[0],
+            params.get("signature", [None])[0]
+        )
+
+def file_etag(path: Path, stat_result: os.stat_result) -> str:
+    """Strong validator; content-addressed blobs carry their hash in the file name"""
+    stem = path.name.split('.')[0]
+    if len(stem) == 64 and all(c in "0123456789abcdef" for c in stem):
+        return f'"{path.name}"'
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single `bytes=` range into inclusive offsets.
+
+    Returns None for headers we do not handle (the full file is served) and
+    raises ValueError when the range cannot be satisfied.
+    """
+    unit, _, spec = range_header.partition('=')
+    if unit.strip() != "bytes" or ',' in spec:
+        return None
+    start, _, end = spec.strip().partition('-')
+    try:
+        if start == "":
+            # Suffix range: the last N bytes
+            length = int(end)
+            if length <= 0:
+                raise ValueError("Empty suffix range")
+            return max(size - length, 0), size - 1
+        first = int(start)
+        last = int(end) if end else size - 1
+    except ValueError:
+        raise ValueError("Malformed range")
+    if first >= size or last < first:
+        raise ValueError("Range not satisfiable")
+    return first, min(last, size - 1)
+
+async def _read_range(path: Path, start: int, end: int):
+    async with aiofiles.open(path, 'rb') as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def serve_file(request: Request, path: Path, cache_control: str) -> Response:
+    """Serve an uploaded file with validators, caching headers and byte ranges"""
+    stat_result = path.stat()
+    etag = file_etag(path, stat_result)
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(',')]):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, stat_result.st_size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{stat_result.st_size}"})
+
+        if byte_range:
+            start, end = byte_range
+            headers.update({
+                "Content-Range": f"bytes {start}-{end}/{stat_result.st_size}",
+                "Content-Length": str(end - start + 1)
+            })
+            media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+            if request.method == "HEAD":
+                return Response(status_code=206, headers=headers, media_type=media_type)
+            return StreamingResponse(_read_range(path, start, end), status_code=206, headers=headers, media_type=media_type)
+
+    # Whole file: FileResponse hands the path to the server (ASGI pathsend) when supported
+    return FileResponse(path, headers=headers, stat_result=stat_result)
+
+class _ZipStreamBuffer:
+    """Unseekable sink that hands written bytes over to the response as they are produced"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def stream_zip(files: Iterable[Tuple[str, Path]]) -> Iterator[bytes]:
+    """Build a ZIP archive incrementally; only one chunk is held in memory at a time.
+
+    PDFs are already compressed, so entries are stored rather than deflated.
+    """
+    buffer = _ZipStreamBuffer()
+    # An unseekable sink makes zipfile write sizes in data descriptors after each entry
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for arcname, path in files:
+            with open(path, 'rb') as source, archive.open(arcname, mode="w", force_zip64=True) as entry:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    entry.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            data = buffer.drain()
+            if data:
+                yield data
+    yield buffer.drain()
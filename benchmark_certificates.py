@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark certificate PDF rendering:
+- raster QR codes (qrcode PNG embedded through a base64 round trip, the
+  previous implementation) against native vector QR codes drawn by reportlab
+- throughput per core with templates rebuilt for every certificate (the
+  previous behaviour) against templates compiled once per process
+
+Usage: python benchmark_certificates.py [iterations]
+"""
+
+import sys
+import time
+import base64
+from io import BytesIO
+from pathlib import Path
+from datetime import datetime, timedelta
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+import qrcode
+from reportlab.platypus import Image
+import certificate_rendering
+
+SAMPLE_CERTIFICATE = {
+    "student_name": "Amina Benali",
+    "student_id": "3f1c2a9e-5b7d-4e21-9c0a-8d6f4b2e1a77",
+    "school_name": "Auto-École El Djazair",
+    "school_location": "12 Rue Didouche Mourad, Alger",
+    "certificate_number": "DZ-ALG-000123",
+    "issue_date": datetime(2025, 6, 1),
+    "expiry_date": datetime(2025, 6, 1) + timedelta(days=5*365)
+}
+
+def raster_qr_drawing(data: str, size: float = 100):
+    """Previous implementation: PNG -> base64 -> bytes -> reportlab Image"""
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(data)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffered = BytesIO()
+    img.save(buffered, format="PNG")
+    encoded = base64.b64encode(buffered.getvalue()).decode()
+    return Image(BytesIO(base64.b64decode(encoded)), width=size, height=size)
+
+def run(label: str, iterations: int):
+    certificate_rendering.render_certificate_pdf(SAMPLE_CERTIFICATE)  # warm up fonts and caches
+    start = time.perf_counter()
+    for _ in range(iterations):
+        pdf_bytes = certificate_rendering.render_certificate_pdf(SAMPLE_CERTIFICATE)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<8} {elapsed / iterations * 1000:8.2f} ms/certificate   {len(pdf_bytes) / 1024:7.1f} KiB")
+    return elapsed / iterations, len(pdf_bytes)
+
+def throughput(certificate: dict, iterations: int, rebuild_template: bool) -> float:
+    """Certificates rendered per second in this process"""
+    certificate_rendering.render_certificate_pdf(certificate)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        if rebuild_template:
+            certificate_rendering._templates.clear()
+        certificate_rendering.render_certificate_pdf(certificate)
+    return iterations / (time.perf_counter() - start)
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    print(f"📄 Rendering {iterations} certificates per variant\n")
+
+    vector_qr_drawing = certificate_rendering.qr_drawing
+    certificate_rendering.qr_drawing = raster_qr_drawing
+    raster_time, raster_size = run("raster", iterations)
+
+    certificate_rendering.qr_drawing = vector_qr_drawing
+    vector_time, vector_size = run("vector", iterations)
+
+    print(f"\n⚡ Speedup: {raster_time / vector_time:.2f}x   📦 Size: {vector_size / raster_size * 100:.0f}% of raster")
+
+    print(f"\n🏭 Throughput on one core\n")
+    for template, accent_color in (("en", None), ("fr", "#0b6e4f")):
+        certificate = {**SAMPLE_CERTIFICATE, "template": template, "accent_color": accent_color}
+        rebuilt = throughput(certificate, iterations, rebuild_template=True)
+        compiled = throughput(certificate, iterations, rebuild_template=False)
+        print(f"{template:<3} rebuilt {rebuilt:7.1f} cert/s   compiled {compiled:7.1f} cert/s   ({compiled / rebuilt:.2f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Benchmark notification email rendering, the CPU side of bulk sends:
+- the previous implementation: the whole HTML page rebuilt with f-strings
+  and wrapped in a MIMEMultipart for every message
+- EmailRenderer: layouts compiled once per type, language and priority,
+  rendered emails cached by content, messages assembled from the cached
+  encoded body
+
+Two workloads: a broadcast (the same content for every recipient) and
+reminders (a different session in each message's metadata).
+
+Usage: python benchmark_email_templates.py [emails]
+"""
+
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+from notification_templates import EmailRenderer, build_message
+
+FROM_EMAIL = "noreply@example.com"
+
+def legacy_email_template(user: dict, notification: dict) -> str:
+    """Previous implementation: the whole page rebuilt with f-strings for every message"""
+    priority_colors = {
+        "low": "#28a745",
+        "medium": "#ffc107", 
+        "high": "#fd7e14",
+        "urgent": "#dc3545"
+    }
+
+    priority_color = priority_colors.get(notification["priority"], "#007bff")
+
+    template = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="utf-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <title>{notification['title']}</title>
+    </head>
+    <body style="font-family: Arial, sans-serif; margin: 0; padding: 20px; background-color: #f4f4f4;">
+        <div style="max-width: 600px; margin: 0 auto; background-color: white; border-radius: 8px; overflow: hidden; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
+
+            <!-- Header -->
+            <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center;">
+                <h1 style="margin: 0; font-size: 28px;">🚗 Driving School Platform</h1>
+                <p style="margin: 10px 0 0 0; opacity: 0.9;">مدرسة تعليم القيادة الجزائرية</p>
+            </div>
+
+            <!-- Priority Badge -->
+            <div style="padding: 20px; border-left: 4px solid {priority_color}; background-color: #f8f9fa;">
+                <div style="display: inline-block; background-color: {priority_color}; color: white; padding: 4px 12px; border-radius: 12px; font-size: 12px; font-weight: bold; text-transform: uppercase;">
+                    {notification['priority']} Priority
+                </div>
+            </div>
+
+            <!-- Content -->
+            <div style="padding: 30px;">
+                <h2 style="color: #333; margin-top: 0;">{notification['title']}</h2>
+                <p style="color: #666; line-height: 1.6; font-size: 16px;">{notification['message']}</p>
+
+                <!-- Metadata -->
+                {legacy_format_metadata(notification.get('metadata', {}))}
+            </div>
+
+            <!-- CTA Button -->
+            <div style="padding: 0 30px 30px;">
+                <a href="{os.environ.get('FRONTEND_URL', 'http://localhost:3000')}/dashboard" 
+                   style="display: inline-block; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 12px 30px; text-decoration: none; border-radius: 25px; font-weight: bold;">
+                    Open Dashboard
+                </a>
+            </div>
+
+            <!-- Footer -->
+            <div style="background-color: #f8f9fa; padding: 20px; text-align: center; color: #666; font-size: 14px;">
+                <p style="margin: 0;">This is an automated message from the Driving School Platform</p>
+                <p style="margin: 5px 0 0 0;">🇩🇿 Algeria Driving Education System</p>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+    return template
+def legacy_format_metadata(metadata: dict) -> str:
+    """Format metadata for email display"""
+    if not metadata:
+        return ""
+
+    html = "<div style='background-color: #f8f9fa; padding: 15px; border-radius: 6px; margin-top: 20px;'>"
+    html += "<h4 style='margin: 0 0 10px 0; color: #495057;'>Additional Information:</h4>"
+
+    for key, value in metadata.items():
+        if key not in ['internal_id', 'system_data']:  # Skip internal keys
+            formatted_key = key.replace('_', ' ').title()
+            html += f"<p style='margin: 5px 0; color: #6c757d;'><strong>{formatted_key}:</strong> {value}</p>"
+
+    html += "</div>"
+    return html
+
+def legacy_build_email(user: dict, notification: dict) -> bytes:
+    msg = MIMEMultipart()
+    msg['From'] = FROM_EMAIL
+    msg['To'] = user["email"]
+    msg['Subject'] = f"🚗 {notification['title']} - Driving School Platform"
+    msg.attach(MIMEText(legacy_email_template(user, notification), 'html'))
+    return msg.as_bytes()
+
+def workload(name: str, count: int) -> list:
+    deliveries = []
+    for index in range(count):
+        user = {"id": str(uuid.uuid4()), "email": f"student{index}@example.com"}
+        if name == "broadcast":
+            notification = {
+                "type": "school_broadcast",
+                "title": "School closed on Friday",
+                "message": "The school is closed on Friday for the national holiday. Lessons resume on Saturday.",
+                "priority": "high",
+                "metadata": {"school_name": "Auto-École El Djazair", "broadcast_id": "b1"}
+            }
+        else:
+            notification = {
+                "type": "session_reminder",
+                "title": "Session Reminder",
+                "message": f"You have a driving session tomorrow at {8 + index % 10}:00",
+                "priority": "high",
+                "metadata": {"session_id": str(uuid.uuid4()), "session_type": "driving"}
+            }
+        deliveries.append((user, notification))
+    return deliveries
+
+def bench(label: str, build, deliveries: list):
+    started = time.perf_counter()
+    size = sum(len(build(user, notification)) for user, notification in deliveries)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {elapsed:7.3f}s  {len(deliveries) / elapsed:9.0f} emails/s  "
+          f"{elapsed / len(deliveries) * 1e6:7.1f}us/email  {size / len(deliveries) / 1024:5.1f}KB avg")
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    for name in ("broadcast", "reminders"):
+        deliveries = workload(name, count)
+        print(f"{count} {name} emails")
+        bench("  f-strings + MIMEMultipart", legacy_build_email, deliveries)
+        renderer = EmailRenderer()
+        bench("  compiled + cached", lambda user, notification: build_message(
+            FROM_EMAIL, user["email"], renderer.render(notification)
+        ), deliveries)
+        print(f"  cache: {renderer.stats}")
+
+if __name__ == "__main__":
+    main()
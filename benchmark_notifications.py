@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Benchmark EnhancedNotificationService against MongoDB.
+
+Reminder generation (schedule_reminders):
+- the previous row-by-row loop (one existence query, plus a school lookup for
+  payment reminders, and one notification write per row)
+- the set-based implementation (one existence query and one insert_many per
+  batch, one school lookup per batch of new schools)
+
+Notification statistics (get_notification_stats, behind GET /notifications/stats):
+- the previous six count_documents calls
+- the single $group aggregation over the (user_id, is_read, priority) index,
+  with expired notifications purged by the expiry sweep instead of filtered
+
+School-wide broadcast (broadcast, behind POST /notifications/broadcast):
+- the previous per-recipient create_notification loop
+- chunked insert_many, then the outbox drained into a local SMTP sink with
+  one job claimed at a time versus batched claims and shared SMTP sends
+
+Runs against MONGO_URL in a separate database (BENCHMARK_DB, default
+driving_school_benchmark), which is dropped and reseeded for every run.
+Database round trips are counted with a pymongo command listener.
+
+Usage: python benchmark_notifications.py [sessions_per_day]
+       python benchmark_notifications.py stats [notifications_per_user]
+       python benchmark_notifications.py broadcast [recipients]
+"""
+
+import os
+import sys
+import time
+import uuid
+import random
+import asyncio
+import statistics
+from pathlib import Path
+from datetime import datetime, timedelta
+from pymongo import monitoring
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+from benchmark_smtp import SinkSMTPServer
+from smtp_transport import close_smtp_pools
+from enhanced_notifications import EnhancedNotificationService, NotificationPriority, NotificationChannel
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+BENCHMARK_DB = os.environ.get('BENCHMARK_DB', 'driving_school_benchmark')
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+async def seed(db, sessions_per_day: int):
+    await db.client.drop_database(BENCHMARK_DB)
+    await db.enhanced_notifications.create_index([("type", 1), ("metadata.session_id", 1)])
+    await db.enhanced_notifications.create_index([("type", 1), ("metadata.enrollment_id", 1), ("created_at", -1)])
+
+    tomorrow = (datetime.utcnow() + timedelta(days=1)).replace(hour=8, minute=0, second=0, microsecond=0)
+    schools = [{"id": str(uuid.uuid4()), "name": f"Auto-École {index}"} for index in range(200)]
+    await db.driving_schools.insert_many(schools)
+
+    sessions = [
+        {
+            "id": str(uuid.uuid4()),
+            "student_id": str(uuid.uuid4()),
+            "session_type": "driving",
+            "scheduled_at": tomorrow + timedelta(minutes=index % 600),
+            "status": "scheduled"
+        }
+        for index in range(sessions_per_day)
+    ]
+    enrollments = [
+        {
+            "id": str(uuid.uuid4()),
+            "student_id": session["student_id"],
+            "driving_school_id": schools[index % len(schools)]["id"],
+            "amount": 25000,
+            "payment_status": "pending",
+            "created_at": datetime.utcnow() - timedelta(days=5)
+        }
+        for index, session in enumerate(sessions[:sessions_per_day // 5])
+    ]
+    for start in range(0, len(sessions), 10000):
+        await db.sessions.insert_many(sessions[start:start + 10000])
+    await db.enrollments.insert_many(enrollments)
+
+    # One session in ten was already reminded by an earlier run
+    service = EnhancedNotificationService(db.client)
+    service.db = service.outbox.db = db
+    await service.create_notifications([
+        service.build_notification(
+            user_id=session["student_id"],
+            notification_type="session_reminder",
+            title="Session Reminder",
+            message="Earlier reminder",
+            metadata={"session_id": session["id"], "session_type": session["session_type"]}
+        )
+        for session in sessions[::10]
+    ])
+
+async def legacy_schedule_reminders(service: EnhancedNotificationService):
+    """Previous implementation, minus inline delivery (both versions queue it)"""
+    now = datetime.utcnow()
+    tomorrow = now + timedelta(days=1)
+    sessions_cursor = service.db.sessions.find({
+        "scheduled_at": {
+            "$gte": tomorrow.replace(hour=0, minute=0, second=0),
+            "$lt": tomorrow.replace(hour=23, minute=59, second=59)
+        },
+        "status": "scheduled"
+    })
+    async for session in sessions_cursor:
+        existing_reminder = await service.db.enhanced_notifications.find_one({
+            "user_id": session["student_id"],
+            "type": "session_reminder",
+            "metadata.session_id": session["id"]
+        })
+        if not existing_reminder:
+            await service.create_notification(
+                user_id=session["student_id"],
+                notification_type="session_reminder",
+                title="Session Reminder",
+                message=f"You have a {session['session_type']} session scheduled for tomorrow at {session['scheduled_at'].strftime('%H:%M')}",
+                priority=NotificationPriority.HIGH,
+                channels=[NotificationChannel.EMAIL, NotificationChannel.IN_APP],
+                metadata={"session_id": session["id"], "session_type": session["session_type"]}
+            )
+
+    three_days_ago = now - timedelta(days=3)
+    enrollments_cursor = service.db.enrollments.find({
+        "payment_status": "pending",
+        "created_at": {"$lt": three_days_ago}
+    })
+    async for enrollment in enrollments_cursor:
+        recent_reminder = await service.db.enhanced_notifications.find_one({
+            "user_id": enrollment["student_id"],
+            "type": "payment_reminder",
+            "metadata.enrollment_id": enrollment["id"],
+            "created_at": {"$gte": now - timedelta(hours=24)}
+        })
+        if not recent_reminder:
+            school = await service.db.driving_schools.find_one({"id": enrollment["driving_school_id"]})
+            await service.create_notification(
+                user_id=enrollment["student_id"],
+                notification_type="payment_reminder",
+                title="Payment Reminder",
+                message=f"Your enrollment payment for {school['name'] if school else 'driving school'} is still pending. Please complete your payment to continue.",
+                priority=NotificationPriority.MEDIUM,
+                channels=[NotificationChannel.EMAIL, NotificationChannel.IN_APP],
+                metadata={"enrollment_id": enrollment["id"], "amount": enrollment["amount"]}
+            )
+
+async def run(name: str, schedule, client, counter: CommandCounter, sessions_per_day: int):
+    db = client[BENCHMARK_DB]
+    await seed(db, sessions_per_day)
+    service = EnhancedNotificationService(client)
+    service.db = service.outbox.db = db
+    before_notifications = await db.enhanced_notifications.count_documents({})
+
+    counter.count = 0
+    started = time.perf_counter()
+    await schedule(service)
+    elapsed = time.perf_counter() - started
+    round_trips = counter.count
+
+    created = await db.enhanced_notifications.count_documents({}) - before_notifications
+    queued = await db.notification_outbox.count_documents({"channel": "email"})
+    print(f"{name:<12} {elapsed:8.2f}s  {round_trips:8d} round trips  {created:7d} reminders  {queued:7d} emails queued")
+
+    # A second pass must find everything already reminded
+    started = time.perf_counter()
+    await schedule(service)
+    again = await db.enhanced_notifications.count_documents({}) - before_notifications - created
+    print(f"{'  rerun':<12} {time.perf_counter() - started:8.2f}s  {again:7d} duplicate reminders")
+
+async def seed_notifications(db, users: int, per_user: int) -> list:
+    await db.client.drop_database(BENCHMARK_DB)
+    await db.enhanced_notifications.create_index([("user_id", 1), ("is_read", 1), ("priority", 1)])
+    await db.enhanced_notifications.create_index([("user_id", 1), ("is_read", 1), ("priority", 1), ("expires_at", 1)])
+
+    now = datetime.utcnow()
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    priorities = [priority.value for priority in NotificationPriority]
+    for user_id in user_ids:
+        await db.enhanced_notifications.insert_many([
+            {
+                "id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "type": "session_reminder",
+                "title": "Session Reminder",
+                "message": "Your session starts soon",
+                "priority": random.choice(priorities),
+                "is_read": random.random() < 0.7,
+                # One in ten has expired, one in ten expires later
+                "expires_at": random.choice([None] * 8 + [now - timedelta(days=1), now + timedelta(days=7)]),
+                "created_at": now
+            }
+            for _ in range(per_user)
+        ])
+    return user_ids
+
+async def legacy_notification_stats(service: EnhancedNotificationService, user_id: str) -> dict:
+    """Previous implementation: six count_documents with the same expiry filter"""
+    now = datetime.utcnow()
+    not_expired = [{"expires_at": None}, {"expires_at": {"$gte": now}}]
+    total_notifications = await service.db.enhanced_notifications.count_documents({"user_id": user_id, "$or": not_expired})
+    unread_notifications = await service.db.enhanced_notifications.count_documents({"user_id": user_id, "is_read": False, "$or": not_expired})
+    priority_counts = {}
+    for priority in NotificationPriority:
+        priority_counts[priority] = await service.db.enhanced_notifications.count_documents({
+            "user_id": user_id, "priority": priority, "is_read": False, "$or": not_expired
+        })
+    return {
+        "total_notifications": total_notifications,
+        "unread_notifications": unread_notifications,
+        "unread_by_priority": priority_counts,
+        "read_percentage": round((total_notifications - unread_notifications) / total_notifications * 100, 1) if total_notifications > 0 else 0
+    }
+
+async def run_stats(client, counter: CommandCounter, per_user: int, users: int = 100, rounds: int = 5):
+    db = client[BENCHMARK_DB]
+    user_ids = await seed_notifications(db, users, per_user)
+    service = EnhancedNotificationService(client)
+    service.db = service.outbox.db = db
+
+    print(f"{users} users x {per_user} notifications, stats for every user x {rounds}")
+    expected = {user_id: await legacy_notification_stats(service, user_id) for user_id in user_ids}
+    # The legacy filter gives the same answer once the sweep has purged expired rows
+    purged = await service.expire_notifications()
+    print(f"expiry sweep purged {purged} notifications")
+    for name, stats in (
+        ("6 counts", lambda user_id: legacy_notification_stats(service, user_id)),
+        ("aggregation", service.get_notification_stats)
+    ):
+        latencies = []
+        counter.count = 0
+        for _ in range(rounds):
+            for user_id in user_ids:
+                started = time.perf_counter()
+                result = await stats(user_id)
+                latencies.append(time.perf_counter() - started)
+                assert result == expected[user_id], (name, result, expected[user_id])
+        latencies.sort()
+        print(f"{name:<12} p50 {statistics.median(latencies) * 1000:7.2f}ms  "
+              f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:7.2f}ms  "
+              f"{counter.count / len(latencies):4.1f} round trips per call")
+
+async def drain_outbox(service: EnhancedNotificationService, claim_batch: int) -> float:
+    service.outbox.claim_batch = claim_batch
+    started = time.perf_counter()
+    service.outbox.start()
+    while await service.db.notification_outbox.count_documents({"status": {"$ne": "delivered"}}):
+        await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - started
+    await service.outbox.stop()
+    return elapsed
+
+async def run_broadcast(client, counter: CommandCounter, recipients: int):
+    sink = SinkSMTPServer(0.001)
+    sink.start()
+    # Plain SMTP to the sink, and no channel rate limit: the point is the pipeline's own overhead
+    os.environ.update(
+        SMTP_SERVER="127.0.0.1", SMTP_PORT=str(sink.port), SMTP_STARTTLS="false",
+        FROM_EMAIL="noreply@example.com", NOTIFICATION_RATE_LIMITS="", NOTIFICATION_POLL_SECONDS="0.1"
+    )
+    db = client[BENCHMARK_DB]
+    user_ids = [str(uuid.uuid4()) for _ in range(recipients)]
+    channels = [NotificationChannel.EMAIL, NotificationChannel.IN_APP]
+    print(f"{recipients} recipients, email + in-app, high priority (no digest)")
+
+    for name, claim_batch in (("per-user", 1), ("broadcast", 50)):
+        await client.drop_database(BENCHMARK_DB)
+        await db.notification_outbox.create_index([("status", 1), ("next_attempt_at", 1)])
+        await db.notification_outbox.create_index("claim")
+        await db.users.insert_many([
+            {"id": user_id, "email": f"{user_id}@example.com", "first_name": "Student"} for user_id in user_ids
+        ])
+        service = EnhancedNotificationService(client)
+        service.db = service.outbox.db = db
+
+        counter.count = 0
+        started = time.perf_counter()
+        if claim_batch == 1:
+            for user_id in user_ids:
+                await service.create_notification(
+                    user_id, "school_broadcast", "School closed", "The school is closed on Friday",
+                    priority=NotificationPriority.HIGH, channels=channels
+                )
+        else:
+            await service.broadcast(
+                user_ids, "school_broadcast", "School closed", "The school is closed on Friday",
+                priority=NotificationPriority.HIGH, channels=channels
+            )
+        stored = time.perf_counter() - started
+        store_round_trips = counter.count
+
+        counter.count = 0
+        received = sink.received
+        delivered = await drain_outbox(service, claim_batch)
+        print(f"{name:<12} store {stored:6.2f}s ({recipients / stored:8.0f}/s, {store_round_trips:6d} round trips)  "
+              f"deliver {delivered:6.2f}s ({recipients / delivered:6.0f} emails/s, {counter.count:6d} round trips)  "
+              f"sink received {sink.received - received}")
+        await close_smtp_pools()
+
+async def main():
+    counter = CommandCounter()
+    client = AsyncIOMotorClient(MONGO_URL, event_listeners=[counter])
+
+    if len(sys.argv) > 1 and sys.argv[1] == "stats":
+        await run_stats(client, counter, int(sys.argv[2]) if len(sys.argv) > 2 else 2000)
+    elif len(sys.argv) > 1 and sys.argv[1] == "broadcast":
+        await run_broadcast(client, counter, int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
+    else:
+        sessions_per_day = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+        print(f"{sessions_per_day} sessions tomorrow, {sessions_per_day // 5} pending enrollments, 10% already reminded")
+        await run("row-by-row", legacy_schedule_reminders, client, counter, sessions_per_day)
+        await run("set-based", lambda service: service.schedule_reminders(), client, counter, sessions_per_day)
+    await client.drop_database(BENCHMARK_DB)
+
+if __name__ == "__main__":
+    asyncio.run(main())
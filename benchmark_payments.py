@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Benchmark BaridiMob payment creation against a local fake gateway:
+- blocking requests.post with a 30 second timeout (the previous implementation)
+- the pooled httpx client with per-provider timeouts, a retry budget and a
+  circuit breaker used by EnhancedPaymentService
+
+The fake gateway runs in its own thread and answers every request after a
+simulated latency, either healthy (200), failing (503) or not at all (hang).
+While payments are created a ticker measures how long the event loop stays
+blocked: that stall is what every other request of the worker waits for.
+
+No database is needed: _create_baridimob_payment only talks to the gateway.
+
+Usage: python benchmark_payments.py [payments] [latency_ms]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import requests
+import threading
+from pathlib import Path
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+os.environ['BARIDIMOB_API_KEY'] = 'benchmark-key'
+os.environ['BARIDIMOB_MERCHANT_ID'] = 'benchmark-merchant'
+os.environ.setdefault('BARIDIMOB_TIMEOUT_SECONDS', '1')
+os.environ.setdefault('BARIDIMOB_CIRCUIT_RESET_SECONDS', '60')
+
+from enhanced_payments import EnhancedPaymentService
+from payment_gateway import close_gateway_clients
+
+class FakeGateway:
+    """Minimal HTTP/1.1 server that plays the BaridiMob payments API"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.mode = "healthy"
+        self.received = 0
+        self.idempotency_keys = set()
+        self.port = None
+        self._ready = threading.Event()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def reset(self, mode: str):
+        self.mode = mode
+        self.received = 0
+        self.idempotency_keys = set()
+
+    def start(self):
+        threading.Thread(target=lambda: asyncio.run(self._serve()), daemon=True).start()
+        self._ready.wait()
+
+    async def _serve(self):
+        server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                headers = {}
+                for line in head.decode().split("\r\n")[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                body = json.loads(await reader.readexactly(int(headers.get("content-length", 0))) or b"{}")
+                self.received += 1
+                if "idempotency-key" in headers:
+                    self.idempotency_keys.add(headers["idempotency-key"])
+
+                if self.mode == "hang":
+                    await asyncio.sleep(3600)
+                await asyncio.sleep(self.latency)
+                if self.mode == "failing":
+                    status, reply = "503 Service Unavailable", {"error": "maintenance"}
+                else:
+                    order_id = body.get("order_id", "")
+                    status, reply = "200 OK", {
+                        "payment_id": f"BMP-{order_id}",
+                        "payment_url": f"https://pay.example/{order_id}",
+                        "reference": f"BM{order_id[:8].upper()}",
+                        "expires_at": "2030-01-01T00:00:00"
+                    }
+                data = json.dumps(reply).encode()
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode()
+                    + data
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+async def legacy_create_baridimob_payment(service, payment_doc: dict, user: dict) -> dict:
+    """The previous implementation: a blocking call inside a coroutine"""
+    try:
+        response = requests.post(
+            f"{service.baridimob_base_url}/v1/payments",
+            json={"merchant_id": service.baridimob_merchant_id, "order_id": payment_doc["id"], "amount": 100},
+            headers={"Authorization": f"Bearer {service.baridimob_api_key}"},
+            timeout=30
+        )
+        if response.status_code == 200:
+            return response.json()
+        raise Exception("Failed to create BaridiMob payment")
+    except Exception:
+        return {"error": "BaridiMob service unavailable", "simulation": True}
+
+USER = {"first_name": "Amina", "last_name": "Benali", "email": "amina@example.com", "phone": "0550000000"}
+
+def payment(index: int) -> dict:
+    return {"id": f"payment-{index:06d}", "amount": 15000.0, "currency": "DZD", "description": "Enrollment payment"}
+
+async def measure(create, count: int) -> dict:
+    """Create `count` payments concurrently while watching the event loop"""
+    stalls = []
+    running = True
+
+    async def ticker():
+        while running:
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            stalls.append(time.perf_counter() - started - 0.005)
+
+    watcher = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(create(payment(index)) for index in range(count)))
+    elapsed = time.perf_counter() - started
+    running = False
+    await watcher
+    return {
+        "elapsed": elapsed,
+        "max_stall": max(stalls, default=0),
+        "fallbacks": sum(1 for result in results if result.get("simulation"))
+    }
+
+def report(name: str, result: dict, gateway: FakeGateway):
+    print(f"{name:<34} {result['elapsed'] * 1000:9.1f}ms total  "
+          f"loop stall max {result['max_stall'] * 1000:8.1f}ms  "
+          f"gateway hits {gateway.received:4d}  fallbacks {result['fallbacks']}")
+
+async def run(mode: str, count: int, gateway: FakeGateway, legacy: bool) -> dict:
+    gateway.reset(mode)
+    service = EnhancedPaymentService(AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017')))
+    if legacy:
+        result = await measure(lambda doc: legacy_create_baridimob_payment(service, doc, USER), count)
+    else:
+        result = await measure(lambda doc: service._create_baridimob_payment(doc, USER, None), count)
+        result["metrics"] = service.baridimob.get_metrics()
+    await close_gateway_clients()
+    return result
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 50
+    gateway = FakeGateway(latency_ms / 1000)
+    gateway.start()
+    os.environ['BARIDIMOB_BASE_URL'] = gateway.url
+    print(f"{count} payments, gateway latency {latency_ms:.0f}ms\n")
+
+    print("Healthy gateway")
+    report("  blocking requests.post", asyncio.run(run("healthy", count, gateway, legacy=True)), gateway)
+    result = asyncio.run(run("healthy", count, gateway, legacy=False))
+    report("  pooled httpx client", result, gateway)
+    assert result["fallbacks"] == 0 and len(gateway.idempotency_keys) == count
+
+    print("\nFailing gateway (503)")
+    report("  blocking requests.post", asyncio.run(run("failing", count, gateway, legacy=True)), gateway)
+    result = asyncio.run(run("failing", count, gateway, legacy=False))
+    report("  httpx + retry budget + breaker", result, gateway)
+    print(f"    {result['metrics']}")
+    assert result["fallbacks"] == count
+
+    print(f"\nHanging gateway (previous implementation: {count} x 30s timeout, each blocking the loop)")
+    result = asyncio.run(run("hang", count, gateway, legacy=False))
+    report("  httpx + retry budget + breaker", result, gateway)
+    print(f"    {result['metrics']}")
+    assert result["fallbacks"] == count
+
+if __name__ == "__main__":
+    main()
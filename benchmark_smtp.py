@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Benchmark email delivery against a local debugging SMTP server:
+- one blocking smtplib connection per message (the previous implementation)
+- the pooled, pipelined async transport used by EnhancedNotificationService
+
+The sink server runs in its own thread and delays each batch of replies by a
+simulated round trip, so the cost of chatty SMTP exchanges shows up as it
+does against a real relay. The sink speaks plain SMTP, so the baseline skips
+STARTTLS and AUTH, which only flatters it.
+
+Usage: python benchmark_smtp.py [messages] [rtt_ms]
+"""
+
+import sys
+import time
+import asyncio
+import smtplib
+import threading
+import statistics
+from pathlib import Path
+from email.mime.text import MIMEText
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+from smtp_transport import SMTPPool
+
+class SinkSMTPServer:
+    """Minimal ESMTP server that accepts and discards every message"""
+
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.received = 0
+        self.port = None
+        self._ready = threading.Event()
+
+    def start(self):
+        threading.Thread(target=lambda: asyncio.run(self._serve()), daemon=True).start()
+        self._ready.wait()
+
+    async def _serve(self):
+        server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        writer.write(b"220 sink ESMTP\r\n")
+        buffer = b""
+        in_data = False
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                break
+            buffer += chunk
+            replies = []
+            while True:
+                if in_data:
+                    end = buffer.find(b"\r\n.\r\n")
+                    if end < 0 and not buffer.startswith(b".\r\n"):
+                        break
+                    buffer = buffer[3:] if end < 0 else buffer[end + 5:]
+                    in_data = False
+                    self.received += 1
+                    replies.append(b"250 OK queued")
+                    continue
+                line, sep, rest = buffer.partition(b"\r\n")
+                if not sep:
+                    break
+                buffer = rest
+                verb = line[:4].upper()
+                if verb == b"EHLO":
+                    replies.append(b"250-sink\r\n250-PIPELINING\r\n250 8BITMIME")
+                elif verb == b"DATA":
+                    in_data = True
+                    replies.append(b"354 End data with <CR><LF>.<CR><LF>")
+                elif verb == b"QUIT":
+                    replies.append(b"221 Bye")
+                else:
+                    replies.append(b"250 OK")
+            if replies:
+                # One simulated round trip per batch of replies
+                await asyncio.sleep(self.rtt)
+                writer.write(b"\r\n".join(replies) + b"\r\n")
+                await writer.drain()
+        writer.close()
+
+def build_message(index: int) -> bytes:
+    msg = MIMEText("<p>Your lesson is scheduled for tomorrow at 10:00.</p>\n.leading dot line\n" * 20, "html")
+    msg["From"] = "noreply@example.com"
+    msg["To"] = f"student{index}@example.com"
+    msg["Subject"] = "Lesson reminder"
+    return msg.as_bytes()
+
+def report(name: str, latencies: list, elapsed: float):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<32} p50 {statistics.median(latencies) * 1000:7.1f}ms  "
+          f"p95 {p95 * 1000:7.1f}ms  {len(latencies) / elapsed:8.1f} msg/s")
+
+def bench_per_message(port: int, messages: list):
+    latencies = []
+    started = time.perf_counter()
+    for index, message in enumerate(messages):
+        t0 = time.perf_counter()
+        server = smtplib.SMTP("127.0.0.1", port)
+        server.sendmail("noreply@example.com", f"student{index}@example.com", message)
+        server.quit()
+        latencies.append(time.perf_counter() - t0)
+    report("smtplib, connection per message", latencies, time.perf_counter() - started)
+
+async def bench_pool(port: int, messages: list, size: int):
+    pool = SMTPPool("127.0.0.1", port, starttls=False, size=size, max_messages=len(messages))
+    latencies = []
+
+    pending = iter(enumerate(messages))
+
+    async def worker():
+        # One sender per pooled connection, so latency is the send itself, not queueing
+        for index, message in pending:
+            t0 = time.perf_counter()
+            await pool.send("noreply@example.com", [f"student{index}@example.com"], message)
+            latencies.append(time.perf_counter() - t0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(size)))
+    elapsed = time.perf_counter() - started
+    await pool.close()
+    report(f"pooled + pipelined, {size} conn", latencies, elapsed)
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rtt_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    sink = SinkSMTPServer(rtt_ms / 1000)
+    sink.start()
+    messages = [build_message(index) for index in range(count)]
+
+    print(f"{count} messages, simulated round trip {rtt_ms}ms")
+    bench_per_message(sink.port, messages)
+    for size in (1, 4):
+        asyncio.run(bench_pool(sink.port, messages, size))
+    print(f"sink received {sink.received} messages")
+
+if __name__ == "__main__":
+    main()
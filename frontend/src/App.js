@@ -246,7 +246,7 @@ function App() {
   const fetchDrivingSchools = async (customFilters = {}) => {
     try {
       setLoading(true);
-      const queryParams = { ...filters, ...customFilters };
+      const queryParams = { ...filters, ...customFilters, image_variant: 'card' };
       
       const cleanedParams = {};
       Object.keys(queryParams).forEach(key => {
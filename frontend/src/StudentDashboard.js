@@ -31,6 +31,19 @@ const StudentDashboard = ({ user, token }) => {
     }
   }, [user]);
 
+  // New notifications are pushed by the server instead of polled
+  useEffect(() => {
+    if (!user || user.role !== 'student' || !token) return;
+
+    const stream = new EventSource(`${API_BASE_URL}/api/notifications/stream?token=${encodeURIComponent(token)}`);
+    stream.addEventListener('notification', (event) => {
+      const notification = JSON.parse(event.data);
+      setNotifications(prev => [notification, ...prev.filter(item => item.id !== notification.id)]);
+    });
+
+    return () => stream.close();
+  }, [user, token]);
+
   const fetchDashboardData = async () => {
     try {
       setLoading(true);
@@ -91,31 +91,57 @@ const DocumentUpload = ({
     setUploadProgress(prev => ({ ...prev, [docType]: 0 }));
 
     try {
-      const formData = new FormData();
-      formData.append('file', file);
-      formData.append('document_type', docType);
-
       const token = localStorage.getItem('auth_token') || localStorage.getItem('token');
-      
-      // Create XMLHttpRequest for progress tracking
-      const xhr = new XMLHttpRequest();
-      
-      xhr.upload.addEventListener('progress', (e) => {
-        if (e.lengthComputable) {
-          const percentComplete = (e.loaded / e.total) * 100;
-          setUploadProgress(prev => ({ ...prev, [docType]: percentComplete }));
-        }
-      });
+      const backendUrl = process.env.REACT_APP_BACKEND_URL;
 
-      const response = await new Promise((resolve, reject) => {
+      // Create XMLHttpRequest for progress tracking
+      const sendWithProgress = (method, url, body, headers) => new Promise((resolve, reject) => {
+        const xhr = new XMLHttpRequest();
+        xhr.upload.addEventListener('progress', (e) => {
+          if (e.lengthComputable) {
+            const percentComplete = (e.loaded / e.total) * 100;
+            setUploadProgress(prev => ({ ...prev, [docType]: percentComplete }));
+          }
+        });
         xhr.onload = () => resolve(xhr);
         xhr.onerror = () => reject(new Error('Upload failed'));
-        
-        xhr.open('POST', `${process.env.REACT_APP_BACKEND_URL}/api/documents/upload`);
-        xhr.setRequestHeader('Authorization', `Bearer ${token}`);
-        xhr.send(formData);
+        xhr.open(method, url);
+        Object.entries(headers).forEach(([name, value]) => xhr.setRequestHeader(name, value));
+        xhr.send(body);
+      });
+
+      // Prefer uploading straight to object storage with a presigned URL
+      const grantResponse = await fetch(`${backendUrl}/api/documents/upload-grant`, {
+        method: 'POST',
+        headers: { 'Authorization': `Bearer ${token}`, 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          document_type: docType,
+          file_name: file.name,
+          content_type: file.type || 'application/octet-stream',
+          file_size: file.size
+        })
       });
 
+      let response;
+      if (grantResponse.ok) {
+        const grant = await grantResponse.json();
+        const putResponse = await sendWithProgress(grant.method, grant.upload_url, file, grant.headers);
+        if (putResponse.status >= 300) {
+          throw new Error('Upload failed');
+        }
+        response = await sendWithProgress('POST', `${backendUrl}/api/uploads/${grant.grant_id}/complete`, null, {
+          'Authorization': `Bearer ${token}`
+        });
+      } else {
+        // Direct uploads not available: send the file through the API
+        const formData = new FormData();
+        formData.append('file', file);
+        formData.append('document_type', docType);
+        response = await sendWithProgress('POST', `${backendUrl}/api/documents/upload`, formData, {
+          'Authorization': `Bearer ${token}`
+        });
+      }
+
       if (response.status === 200) {
         const data = JSON.parse(response.responseText);
         
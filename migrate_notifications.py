@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Migration script to move the legacy `notifications` collection into
+`enhanced_notifications`, the single store every notification endpoint reads.
+
+Documents are copied in `_id` order, in batches, with insert-only upserts on
+the notification id: running it again (or after an interruption) skips what is
+already there. Unread counters of the affected users are marked for a lazy
+rebuild instead of being recomputed here.
+
+Usage: python migrate_notifications.py [batch_size]
+"""
+
+import os
+import sys
+import asyncio
+from pathlib import Path
+from pymongo import UpdateOne
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+from enhanced_notifications import EnhancedNotificationService
+
+async def migrate_notifications(batch_size: int = 1000):
+    """Copy legacy notifications into enhanced_notifications"""
+
+    # Connect to MongoDB
+    MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client.driving_school_platform
+    service = EnhancedNotificationService(client)
+
+    try:
+        print("📬 Starting migration of legacy notifications...")
+
+        legacy_count = await db.notifications.count_documents({})
+        print(f"📊 Found {legacy_count} legacy notifications")
+
+        copied = 0
+        scanned = 0
+        users = set()
+        last_id = None
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            batch = await db.notifications.find(query).sort("_id", 1).limit(batch_size).to_list(length=None)
+            if not batch:
+                break
+            last_id = batch[-1]["_id"]
+            scanned += len(batch)
+
+            operations = []
+            for legacy in batch:
+                notification = service.from_legacy(legacy)
+                operations.append(UpdateOne(
+                    {"id": notification["id"]},
+                    {"$setOnInsert": notification},
+                    upsert=True
+                ))
+            result = await db.enhanced_notifications.bulk_write(operations, ordered=False)
+            copied += result.upserted_count
+            users.update(legacy["user_id"] for legacy in batch)
+            print(f"🔄 {scanned}/{legacy_count} scanned, {copied} copied")
+
+        # Counters are rebuilt from the store on the next read
+        if users:
+            await db.notification_counters.update_many(
+                {"user_id": {"$in": list(users)}},
+                {"$set": {"initialized": False}}
+            )
+        print(f"✅ Copied {copied} notifications for {len(users)} users ({scanned - copied} already present)")
+
+        # Verify migration
+        if scanned == legacy_count:
+            print("✨ Migration successful! The `notifications` collection is no longer read and can be dropped.")
+        else:
+            print(f"⚠️  Warning: {legacy_count - scanned} legacy notifications changed during the run; run it again")
+
+    except Exception as e:
+        print(f"❌ Error during migration: {str(e)}")
+
+    finally:
+        client.close()
+        print("🔌 Database connection closed")
+
+if __name__ == "__main__":
+    asyncio.run(migrate_notifications(int(sys.argv[1]) if len(sys.argv) > 1 else 1000))
@@ -0,0 +1,75 @@
+"""
+Shared fixtures: the API on an in-memory MongoDB (mongomock-motor), with
+uploads written to a temporary directory. Background workers are not started.
+"""
+
+import sys
+import time
+import uuid
+import asyncio
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+class App:
+    """The server module wired to a fresh database, with helpers to call it"""
+
+    def __init__(self, server, client, loop):
+        self.server = server
+        self.db = server.db
+        self.client = client
+        self.loop = loop
+
+    def run(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def user(self, role: str = "student", **fields) -> tuple:
+        """Insert a user and return (auth headers, user)"""
+        user = {
+            "id": str(uuid.uuid4()),
+            "email": f"{uuid.uuid4().hex[:8]}@example.com",
+            "first_name": "Amina",
+            "last_name": "Benali",
+            "role": role,
+            "is_active": True,
+            **fields
+        }
+        self.run(self.db.users.insert_one(dict(user)))
+        token = self.server.create_access_token({"sub": user["id"]})
+        return {"Authorization": f"Bearer {token}"}, user
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "demo-uploads").mkdir()
+
+    import server
+    from fastapi.testclient import TestClient
+    from mongomock_motor import AsyncMongoMockClient
+
+    mongo = AsyncMongoMockClient()
+    database = mongo.driving_school_platform
+    monkeypatch.setattr(server, "client", mongo)
+    monkeypatch.setattr(server, "db", database)
+    for service in (
+        server.storage_replicator,
+        server.certificate_numbers,
+        server.reminder_scheduler,
+        server.notification_service,
+        server.notification_service.outbox
+    ):
+        monkeypatch.setattr(service, "db", database)
+    scheduler = server.reminder_scheduler
+    monkeypatch.setattr(scheduler, "wheel", type(scheduler.wheel)(scheduler._tick_of(time.time())))
+
+    loop = asyncio.new_event_loop()
+    for collection, keys, options in server.APP_INDEXES:
+        try:
+            loop.run_until_complete(database[collection].create_index(keys, **options))
+        except Exception:
+            pass
+
+    yield App(server, TestClient(server.app), loop)
+    loop.close()
@@ -0,0 +1,60 @@
+"""
+Tests for school broadcasts: text is bounded and escaped in emails, and each
+school may only send a few per hour.
+"""
+
+import base64
+
+import pytest
+
+def school(app, school_id: str = "school-1", students: int = 2) -> dict:
+    headers, manager = app.user("manager")
+    app.run(app.db.driving_schools.insert_one({"id": school_id, "name": "Auto-École El Bahdja", "manager_id": manager["id"]}))
+    app.run(app.db.enrollments.insert_many([
+        {"id": f"{school_id}-enrollment-{index}", "driving_school_id": school_id,
+         "student_id": f"{school_id}-student-{index}", "enrollment_status": "approved"}
+        for index in range(students)
+    ]))
+    return headers
+
+def broadcast(app, headers, title: str = "Closed on Friday", message: str = "The school is closed on Friday"):
+    return app.client.post("/api/notifications/broadcast", json={
+        "title": title, "message": message, "audience": "students", "channels": ["in_app"]
+    }, headers=headers)
+
+@pytest.mark.parametrize("title, message, status", [
+    ("x" * 201, "Closed", 422),
+    ("Closed", "x" * 2001, 422),
+    ("", "Closed", 422),
+    ("   ", "Closed", 400)
+])
+def test_broadcast_text_is_bounded(app, title, message, status):
+    headers = school(app)
+
+    assert broadcast(app, headers, title, message).status_code == status
+    assert app.run(app.db.enhanced_notifications.count_documents({})) == 0
+
+def test_broadcast_markup_is_escaped_in_emails(app):
+    headers = school(app, students=1)
+
+    assert broadcast(app, headers, "<b>Closed</b>", "<a href='https://evil.example'>Pay here</a>").json()["recipients"] == 1
+
+    notification = app.run(app.db.enhanced_notifications.find_one({}))
+    html = base64.decodebytes(app.server.notification_service.email_renderer.render(notification).body).decode("utf-8")
+    assert "<a href='https://evil.example'>" not in html
+    assert "&lt;a href=&#x27;https://evil.example&#x27;&gt;Pay here&lt;/a&gt;" in html
+    assert "&lt;b&gt;Closed&lt;/b&gt;" in html
+
+def test_broadcasts_are_limited_per_school(app, monkeypatch):
+    monkeypatch.setattr(app.server, "BROADCASTS_PER_HOUR", 2)
+    headers = school(app)
+    other_headers = school(app, "school-2")
+
+    assert broadcast(app, headers).status_code == 200
+    assert broadcast(app, headers).status_code == 200
+    refused = broadcast(app, headers)
+
+    assert refused.status_code == 429
+    assert 0 < int(refused.headers["retry-after"]) <= 3601
+    assert app.run(app.db.notification_broadcasts.count_documents({"driving_school_id": "school-1"})) == 2
+    assert broadcast(app, other_headers).status_code == 200
@@ -0,0 +1,61 @@
+"""
+Tests for content-addressed document storage: identical uploads share one
+blob, and a blob is garbage-collected once no document references it.
+"""
+
+import hashlib
+
+def upload(app, headers, content: bytes, document_type: str = "id_card"):
+    return app.client.post(
+        "/api/documents/upload",
+        data={"document_type": document_type},
+        files={"file": ("scan.jpg", content, "image/jpeg")},
+        headers=headers
+    )
+
+def blob(app, content: bytes):
+    return app.run(app.db.file_blobs.find_one({"sha256": hashlib.sha256(content).hexdigest()}))
+
+def test_identical_uploads_share_one_blob(app):
+    first, _ = app.user()
+    second, _ = app.user()
+
+    assert upload(app, first, b"same scan").json()["deduplicated"] is False
+    assert upload(app, second, b"same scan").json()["deduplicated"] is True
+
+    assert blob(app, b"same scan")["ref_count"] == 2
+    assert app.run(app.db.file_blobs.count_documents({})) == 1
+
+def test_replaced_document_releases_its_blob(app):
+    headers, _ = app.user()
+    upload(app, headers, b"old scan")
+    path = app.server.local_blob_path(hashlib.sha256(b"old scan").hexdigest(), "jpg")
+    assert path.exists()
+
+    upload(app, headers, b"new scan")
+
+    assert blob(app, b"old scan") is None
+    assert not path.exists()
+    assert blob(app, b"new scan")["ref_count"] == 1
+
+def test_shared_blob_survives_until_its_last_reference(app):
+    first, _ = app.user()
+    second, _ = app.user()
+    upload(app, first, b"shared scan")
+    upload(app, second, b"shared scan")
+
+    upload(app, first, b"first replacement")
+
+    assert blob(app, b"shared scan")["ref_count"] == 1
+    assert app.server.local_blob_path(hashlib.sha256(b"shared scan").hexdigest(), "jpg").exists()
+
+def test_failed_save_releases_the_reference(app, monkeypatch):
+    headers, _ = app.user()
+
+    async def failing_save(document_data):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(app.server, "save_user_document", failing_save)
+
+    assert upload(app, headers, b"orphan scan").status_code == 500
+    assert blob(app, b"orphan scan") is None
@@ -0,0 +1,145 @@
+"""
+Tests for uploads through presigned URLs: a grant is registered once, only
+for the object it was issued for, and is given back when completion fails.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from PIL import Image
+
+class FakeBucket:
+    """Stands in for the S3 calls the upload endpoints make"""
+
+    def __init__(self):
+        self.objects = {}
+        self.deleted = []
+        self.uploaded = {}
+
+    def head_object(self, key):
+        return self.objects.get(key)
+
+    def delete_remote_object(self, storage, key, *args):
+        self.deleted.append(key)
+        self.objects.pop(key, None)
+
+    def download_object(self, key, path):
+        Image.new("RGB", (2000, 1000), "navy").save(path, "JPEG")
+
+    def upload_object(self, path, key, content_type):
+        self.uploaded[key] = content_type
+
+@pytest.fixture
+def bucket(app, monkeypatch):
+    bucket = FakeBucket()
+    for name in ("head_object", "delete_remote_object", "download_object", "upload_object"):
+        monkeypatch.setattr(app.server, name, getattr(bucket, name))
+    monkeypatch.setattr(app.server, "s3_configured", lambda: True)
+    monkeypatch.setattr(app.server, "presign_put_url", lambda key, content_type, expires: f"https://bucket.test/{key}")
+    monkeypatch.setattr(app.server, "presign_private_url", lambda url, expires: f"https://bucket.test/signed?{url}")
+    return bucket
+
+def document_grant(app, headers, file_size=1234, content_type="application/pdf"):
+    response = app.client.post("/api/documents/upload-grant", json={
+        "document_type": "id_card",
+        "file_name": "id card.pdf",
+        "content_type": content_type,
+        "file_size": file_size
+    }, headers=headers)
+    assert response.status_code == 200, response.text
+    grant_id = response.json()["grant_id"]
+    return app.run(app.db.upload_grants.find_one({"id": grant_id}))
+
+def complete(app, headers, grant):
+    return app.client.post(f"/api/uploads/{grant['id']}/complete", headers=headers)
+
+def grant_status(app, grant):
+    return app.run(app.db.upload_grants.find_one({"id": grant["id"]}))["status"]
+
+def test_grant_registers_its_document_once(app, bucket):
+    headers, user = app.user()
+    grant = document_grant(app, headers)
+    bucket.objects[grant["storage_key"]] = {"size": 1234, "content_type": "application/pdf"}
+
+    response = complete(app, headers, grant)
+
+    assert response.status_code == 200
+    document = app.run(app.db.documents.find_one({"user_id": user["id"]}))
+    assert document["storage_key"] == grant["storage_key"]
+    assert document["file_url"].startswith("private://")
+    assert grant_status(app, grant) == "completed"
+    assert complete(app, headers, grant).status_code == 404
+
+@pytest.mark.parametrize("stored", [
+    {"size": 99999, "content_type": "application/pdf"},
+    {"size": 1234, "content_type": "text/html"}
+])
+def test_object_not_matching_the_grant_is_rejected(app, bucket, stored):
+    headers, user = app.user()
+    grant = document_grant(app, headers)
+    bucket.objects[grant["storage_key"]] = stored
+
+    assert complete(app, headers, grant).status_code == 400
+
+    assert bucket.deleted == [grant["storage_key"]]
+    assert grant_status(app, grant) == "issued"
+    assert app.run(app.db.documents.count_documents({"user_id": user["id"]})) == 0
+
+def test_failed_completion_gives_the_grant_back(app, bucket, monkeypatch):
+    headers, user = app.user()
+    grant = document_grant(app, headers)
+    bucket.objects[grant["storage_key"]] = {"size": 1234, "content_type": "application/pdf"}
+    save = app.server.save_user_document
+
+    async def failing_save(document_data):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(app.server, "save_user_document", failing_save)
+    assert complete(app, headers, grant).status_code == 500
+    assert grant_status(app, grant) == "issued"
+
+    monkeypatch.setattr(app.server, "save_user_document", save)
+    assert complete(app, headers, grant).status_code == 200
+
+def test_completion_lease_expires(app, bucket):
+    headers, _ = app.user()
+    grant = document_grant(app, headers)
+    bucket.objects[grant["storage_key"]] = {"size": 1234, "content_type": "application/pdf"}
+    app.run(app.db.upload_grants.update_one({"id": grant["id"]}, {"$set": {
+        "status": "completing", "locked_until": datetime.utcnow() + timedelta(minutes=1)
+    }}))
+
+    # Held by a completion still in progress
+    assert complete(app, headers, grant).status_code == 404
+
+    app.run(app.db.upload_grants.update_one({"id": grant["id"]}, {"$set": {
+        "locked_until": datetime.utcnow() - timedelta(seconds=1)
+    }}))
+    assert complete(app, headers, grant).status_code == 200
+
+def test_school_photo_grant_gets_variants(app, bucket, monkeypatch):
+    headers, manager = app.user("manager")
+    app.run(app.db.driving_schools.insert_one({"id": "school-1", "manager_id": manager["id"], "photos": []}))
+    jobs = []
+    monkeypatch.setattr(app.server.image_pipeline, "submit", jobs.append)
+
+    assert app.client.post("/api/driving-schools/school-1/upload-photo-grant", json={
+        "photo_type": "photo", "file_name": "front.html", "content_type": "text/html", "file_size": 10
+    }, headers=headers).status_code == 400
+
+    response = app.client.post("/api/driving-schools/school-1/upload-photo-grant", json={
+        "photo_type": "photo", "file_name": "front.jpg", "content_type": "image/jpeg", "file_size": 5000
+    }, headers=headers)
+    grant = app.run(app.db.upload_grants.find_one({"id": response.json()["grant_id"]}))
+    bucket.objects[grant["storage_key"]] = {"size": 5000, "content_type": "image/jpeg"}
+
+    assert complete(app, headers, grant).status_code == 200
+    assert len(jobs) == 1
+    app.run(jobs[0])
+
+    school = app.run(app.db.driving_schools.find_one({"id": "school-1"}))
+    variants = school["photo_derivatives"][0]
+    assert variants["file_url"] == school["photos"][0]
+    assert sorted(bucket.uploaded) == sorted(
+        grant["storage_key"].rsplit(".", 1)[0] + f".{variant}.jpg" for variant in ("thumbnail", "card", "full")
+    )
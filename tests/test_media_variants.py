@@ -0,0 +1,33 @@
+"""
+Tests for /api/media/variant: Cloudinary images are redirected to a resized
+delivery URL, and nothing else is redirected off-site.
+"""
+
+import pytest
+
+from image_derivatives import is_cloudinary_url
+
+def variant(app, url: str, width: int = 160):
+    return app.client.get("/api/media/variant", params={"url": url, "width": width}, follow_redirects=False)
+
+def test_cloudinary_image_redirects_to_a_resized_variant(app, monkeypatch):
+    monkeypatch.setenv("CLOUDINARY_CLOUD_NAME", "school")
+
+    response = variant(app, "https://res.cloudinary.com/school/image/upload/v1/photo.jpg")
+
+    assert response.status_code == 307
+    assert response.headers["location"] == (
+        "https://res.cloudinary.com/school/image/upload/w_160,h_160,c_limit,q_auto,f_auto/v1/photo.jpg"
+    )
+
+@pytest.mark.parametrize("url", [
+    "https://evil.example/res.cloudinary.com/x.jpg",
+    "https://res.cloudinary.com.evil.example/school/image/upload/x.jpg",
+    "http://res.cloudinary.com/school/image/upload/x.jpg",
+    "https://res.cloudinary.com/other-account/image/upload/x.jpg"
+])
+def test_other_urls_are_not_redirected(app, monkeypatch, url):
+    monkeypatch.setenv("CLOUDINARY_CLOUD_NAME", "school")
+
+    assert not is_cloudinary_url(url)
+    assert variant(app, url).status_code == 400
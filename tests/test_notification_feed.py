@@ -0,0 +1,80 @@
+"""
+Tests for the notification feed: keyset pages are stable while new
+notifications arrive, ties on created_at are broken by id, and a malformed
+cursor is a client error.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+def seed(app, user_id: str, count: int = 7) -> list:
+    """Notifications of a user, newest first as the feed orders them; some share a created_at"""
+    start = datetime(2026, 10, 1, 9, 0)
+    notifications = [
+        {"id": f"{user_id}-{index:02d}", "user_id": user_id, "type": "general", "title": f"Notice {index}",
+         "message": "Details", "priority": "medium", "is_read": index % 2 == 0, "metadata": {},
+         "created_at": start + timedelta(minutes=index // 2)}
+        for index in range(count)
+    ]
+    app.run(app.db.enhanced_notifications.insert_many([dict(notification) for notification in notifications]))
+    return sorted(notifications, key=lambda notification: (notification["created_at"], notification["id"]), reverse=True)
+
+def pages(app, headers, url: str = "/api/notifications", **params) -> list:
+    result, cursor = [], None
+    while True:
+        response = app.client.get(url, params={**params, **({"cursor": cursor} if cursor else {})}, headers=headers)
+        assert response.status_code == 200, response.text
+        result.append(response.json())
+        cursor = response.json()["next_cursor"]
+        if not cursor:
+            return result
+
+def test_pages_cover_the_feed_once_in_order(app):
+    headers, user = app.user()
+    expected = [notification["id"] for notification in seed(app, user["id"])]
+    seed(app, "someone-else")
+
+    feed = pages(app, headers, limit=3)
+
+    assert [len(page["notifications"]) for page in feed] == [3, 3, 1]
+    assert [notification["id"] for page in feed for notification in page["notifications"]] == expected
+
+def test_new_notifications_do_not_shift_later_pages(app):
+    headers, user = app.user()
+    expected = [notification["id"] for notification in seed(app, user["id"])]
+
+    first = app.client.get("/api/notifications", params={"limit": 3}, headers=headers).json()
+    app.run(app.db.enhanced_notifications.insert_one({
+        "id": "newest", "user_id": user["id"], "type": "general", "title": "New", "message": "New",
+        "priority": "high", "is_read": False, "metadata": {}, "created_at": datetime.utcnow()
+    }))
+    second = app.client.get("/api/notifications", params={"limit": 3, "cursor": first["next_cursor"]}, headers=headers).json()
+
+    assert [notification["id"] for notification in second["notifications"]] == expected[3:6]
+
+def test_unread_only_pages(app):
+    headers, user = app.user()
+    unread = [notification["id"] for notification in seed(app, user["id"]) if not notification["is_read"]]
+
+    feed = pages(app, headers, limit=2, unread_only=True)
+
+    assert [notification["id"] for page in feed for notification in page["notifications"]] == unread
+
+def test_my_notifications_is_a_page_of_the_same_feed(app):
+    headers, user = app.user()
+    expected = [notification["id"] for notification in seed(app, user["id"])]
+
+    page = app.client.get("/api/notifications/my", params={"limit": 5}, headers=headers).json()
+
+    assert [notification["id"] for notification in page["notifications"]] == expected[:5]
+    assert page["next_cursor"]
+    assert page["total_unread"] == 3
+
+@pytest.mark.parametrize("url", ["/api/notifications", "/api/notifications/my"])
+# The second decodes to "not a date|n01"
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "bm90IGEgZGF0ZXxuMDE="])
+def test_malformed_cursor_is_a_client_error(app, url, cursor):
+    headers, _ = app.user()
+
+    assert app.client.get(url, params={"cursor": cursor}, headers=headers).status_code == 400
@@ -0,0 +1,197 @@
+"""
+Tests for the notification outbox: leased claims, retries with backoff,
+dead letters, digests, and which delivery failures are final.
+"""
+
+import socket
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from aiosmtpd.controller import Controller
+from mongomock_motor import AsyncMongoMockClient
+
+from notification_outbox import NotificationOutbox, OutboxStatus
+from smtp_transport import close_smtp_pools
+
+def outbox(deliver=None, **kwargs) -> NotificationOutbox:
+    async def delivered(job):
+        return True
+
+    box = NotificationOutbox(AsyncMongoMockClient().test, deliver or delivered, **kwargs)
+    box.rate_limiter.rates = {}
+    return box
+
+async def jobs(box: NotificationOutbox) -> dict:
+    return {job["notification_id"]: job for job in await box.db.notification_outbox.find({}).to_list(length=None)}
+
+def test_only_due_and_abandoned_jobs_are_claimed():
+    box = outbox()
+    now = datetime.utcnow()
+
+    async def run():
+        await box.enqueue_jobs(
+            box.build_jobs("due", ["email"])
+            + box.build_jobs("later", ["email"], deliver_at=now + timedelta(hours=1))
+        )
+        await box.db.notification_outbox.insert_many([
+            {"id": "held", "notification_id": "held", "channel": "email", "status": OutboxStatus.PROCESSING,
+             "locked_until": now + timedelta(minutes=1), "next_attempt_at": now, "attempts": 0},
+            {"id": "abandoned", "notification_id": "abandoned", "channel": "email", "status": OutboxStatus.PROCESSING,
+             "locked_until": now - timedelta(minutes=1), "next_attempt_at": now, "attempts": 0}
+        ])
+        first = await box._claim_jobs()
+        second = await box._claim_jobs()
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert sorted(job["notification_id"] for job in first) == ["abandoned", "due"]
+    assert second == []
+
+def test_failures_are_retried_with_backoff_then_dead_lettered():
+    dead_letters = []
+
+    async def failing(job):
+        raise ConnectionError("smtp down")
+
+    async def on_dead_letter(job, error):
+        dead_letters.append((job["notification_id"], error))
+
+    box = outbox(failing, on_dead_letter=on_dead_letter)
+    box.max_attempts = 2
+
+    async def attempt():
+        await box.db.notification_outbox.update_many({}, {"$set": {"next_attempt_at": datetime.utcnow()}})
+        await box._process_jobs(await box._claim_jobs())
+        return (await jobs(box))["n1"]
+
+    async def run():
+        await box.enqueue("n1", ["email"])
+        return await attempt(), await attempt()
+
+    retried, dead = asyncio.run(run())
+
+    assert retried["status"] == OutboxStatus.PENDING
+    assert retried["attempts"] == 1
+    assert retried["next_attempt_at"] > datetime.utcnow()
+    assert dead["status"] == OutboxStatus.DEAD
+    assert dead_letters == [("n1", "smtp down")]
+
+def test_false_is_a_final_outcome():
+    async def refused(job):
+        return False
+
+    box = outbox(refused)
+
+    async def run():
+        await box.enqueue("n1", ["sms"])
+        await box._process_jobs(await box._claim_jobs())
+        return (await jobs(box))["n1"]
+
+    job = asyncio.run(run())
+
+    assert job["status"] == OutboxStatus.DELIVERED
+    assert job["delivered"] is False
+    assert job["attempts"] == 0
+
+def test_digest_jobs_are_delivered_together_once():
+    digests = []
+
+    async def deliver_digest(digest_jobs):
+        digests.append(sorted(job["notification_id"] for job in digest_jobs))
+        return True
+
+    box = outbox(deliver_digest=deliver_digest)
+    box.digest_window = 60
+
+    async def run():
+        for notification_id in ("n1", "n2", "n3"):
+            await box.enqueue(notification_id, ["email"], digest_key="user-1")
+        await box.db.notification_outbox.update_one({"notification_id": "n1"}, {"$set": {"next_attempt_at": datetime.utcnow()}})
+        # A job left from an earlier claim of another digest is not picked up
+        await box.db.notification_outbox.insert_one({
+            "id": "stale", "notification_id": "stale", "channel": "email", "digest_key": "user-1:email",
+            "status": OutboxStatus.PROCESSING, "claim": "earlier", "locked_until": datetime.utcnow() + timedelta(minutes=1),
+            "next_attempt_at": datetime.utcnow(), "attempts": 0
+        })
+        await box._process_jobs(await box._claim_jobs())
+        await box._process_jobs(await box._claim_jobs())
+        return await jobs(box)
+
+    stored = asyncio.run(run())
+
+    assert digests == [["n1", "n2", "n3"]]
+    assert all(stored[notification_id]["status"] == OutboxStatus.DELIVERED for notification_id in ("n1", "n2", "n3"))
+    assert stored["stale"]["status"] == OutboxStatus.PROCESSING
+
+class RefusingHandler:
+    """Refuses recipients at permanent.example with 550 and at busy.example with 451"""
+
+    def __init__(self):
+        self.messages = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.endswith("@permanent.example"):
+            return "550 5.1.1 No such user"
+        if address.endswith("@busy.example"):
+            return "451 4.3.0 Try again later"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope.rcpt_tos)
+        return "250 Message accepted"
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture
+def smtp_env(monkeypatch):
+    handler = RefusingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    monkeypatch.setenv("SMTP_SERVER", "127.0.0.1")
+    monkeypatch.setenv("SMTP_PORT", str(controller.port))
+    monkeypatch.setenv("SMTP_STARTTLS", "false")
+    monkeypatch.setenv("FROM_EMAIL", "noreply@school.example")
+    yield handler
+    controller.stop()
+
+def test_permanent_smtp_rejections_are_not_retried(smtp_env):
+    from enhanced_notifications import EnhancedNotificationService, NotificationChannel, NotificationPriority
+
+    service = EnhancedNotificationService(AsyncMongoMockClient())
+    service.outbox.rate_limiter.rates = {}
+    users = {"ok": "amina@ok.example", "gone": "karim@permanent.example", "busy": "sara@busy.example"}
+
+    async def run():
+        try:
+            await service.db.users.insert_many([
+                {"id": user_id, "email": email, "first_name": "Amina", "last_name": "Benali"}
+                for user_id, email in users.items()
+            ])
+            for user_id in users:
+                await service.create_notification(
+                    user_id, "exam", "Exam scheduled", "Your exam is on Monday",
+                    priority=NotificationPriority.HIGH, channels=[NotificationChannel.EMAIL]
+                )
+            await service.outbox._process_jobs(await service.outbox._claim_jobs())
+            notifications = {
+                notification["id"]: notification["user_id"]
+                for notification in await service.db.enhanced_notifications.find({}).to_list(length=None)
+            }
+            return {notifications[job["notification_id"]]: job for job in (await jobs(service.outbox)).values()}
+        finally:
+            await close_smtp_pools()
+
+    by_user = asyncio.run(run())
+
+    assert by_user["ok"]["delivered"] is True
+    assert by_user["gone"]["status"] == OutboxStatus.DELIVERED
+    assert by_user["gone"]["delivered"] is False
+    assert by_user["busy"]["status"] == OutboxStatus.PENDING
+    assert by_user["busy"]["attempts"] == 1
+    assert smtp_env.messages == [["amina@ok.example"]]
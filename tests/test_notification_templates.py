@@ -0,0 +1,71 @@
+"""
+Tests for notification emails: user text is escaped in the HTML body and
+cannot add header lines to the message.
+"""
+
+import base64
+from email import message_from_bytes
+from email.header import decode_header, make_header
+
+import pytest
+
+from enhanced_notifications import EnhancedNotificationService
+from notification_templates import EmailRenderer, build_message
+from smtp_transport import SMTPError
+
+SCRIPT = "<script>alert('x')</script>"
+
+def notification(**fields) -> dict:
+    return {"type": "general", "priority": "high", "title": "Road test", "message": "See you Monday", "metadata": {}, **fields}
+
+def body(rendered) -> str:
+    return base64.decodebytes(rendered.body).decode("utf-8")
+
+def test_title_message_and_metadata_are_escaped():
+    html = body(EmailRenderer().render(notification(
+        title=f"Exam {SCRIPT}",
+        message=f"Bring <b>your ID</b> & {SCRIPT}",
+        metadata={"location": "<img src=x onerror=alert(1)>", "<i>room</i>": 3}
+    )))
+
+    assert "<script>" not in html
+    assert "<img" not in html
+    assert "<b>your ID</b>" not in html
+    assert "Exam &lt;script&gt;alert(&#x27;x&#x27;)&lt;/script&gt;" in html
+    assert "Bring &lt;b&gt;your ID&lt;/b&gt; &amp; " in html
+    assert "&lt;I&gt;Room&lt;/I&gt;:</strong> 3" in html
+
+def test_digest_keeps_its_markup_and_escapes_its_parts():
+    service = EnhancedNotificationService.__new__(EnhancedNotificationService)
+    digest = service._build_digest([
+        {"id": "n1", "user_id": "u1", "priority": "low", "title": "Exam <soon>", "message": SCRIPT},
+        {"id": "n2", "user_id": "u1", "priority": "medium", "title": "Payment", "message": "Due"}
+    ])
+
+    html = body(EmailRenderer().render(digest))
+
+    assert "<strong>Exam &lt;soon&gt;</strong>: &lt;script&gt;" in html
+    assert "<br><strong>Payment</strong>: Due" in html
+    assert digest["message"] == f"Exam <soon>: {SCRIPT}\nPayment: Due"
+
+def test_line_breaks_in_a_title_stay_in_the_subject():
+    rendered = EmailRenderer().render(notification(title="Hello\r\nBcc: victim@example.com"))
+
+    message = message_from_bytes(build_message("noreply@school.example", "amina@example.com", rendered))
+
+    assert message["Bcc"] is None
+    assert not any(character in rendered.subject.replace("\r\n ", "") for character in "\r\n")
+    assert "Bcc: victim@example.com" in str(make_header(decode_header(message["Subject"])))
+
+@pytest.mark.parametrize("from_email, to_email", [
+    ("noreply@school.example", "amina@example.com\r\nBcc: victim@example.com"),
+    ("noreply@school.example\nBcc: victim@example.com", "amina@example.com"),
+    ("noreply@school.example", "Amina <amina@example.com>")
+])
+def test_addresses_cannot_add_header_lines(from_email, to_email):
+    rendered = EmailRenderer().render(notification())
+
+    with pytest.raises(SMTPError) as error:
+        build_message(from_email, to_email, rendered)
+
+    assert error.value.permanent
@@ -0,0 +1,165 @@
+"""
+Tests for the payment gateway client, its circuit breaker and retry budget,
+against an in-process httpx.MockTransport.
+
+Run with: python -m pytest tests/test_payment_gateway.py
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+
+import httpx
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+from payment_gateway import GatewayClient, GatewayError, CircuitOpenError, CircuitBreaker, RetryBudget
+
+class FakeGateway:
+    """Answers every request with `status`, recording the idempotency keys it saw"""
+
+    def __init__(self, status: int = 200):
+        self.status = status
+        self.received = 0
+        self.idempotency_keys = []
+        self.hang = False
+        self.crash = False
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.received += 1
+        self.idempotency_keys.append(request.headers.get("Idempotency-Key"))
+        if self.crash:
+            raise RuntimeError("unexpected failure")
+        if self.hang:
+            await asyncio.sleep(3600)
+        return httpx.Response(self.status, json={"payment_id": "BMP-1"})
+
+def client_for(gateway: FakeGateway, **kwargs) -> GatewayClient:
+    client = GatewayClient("baridimob", "https://gateway.test", backoff=0, **kwargs)
+    client._client = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(gateway))
+    return client
+
+async def post_and_close(client: GatewayClient, **kwargs):
+    try:
+        return await client.post("/v1/payments", {"amount": 100}, **kwargs)
+    finally:
+        await client.close()
+
+def open_breaker(reset_seconds: float = 0) -> CircuitBreaker:
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=reset_seconds)
+    breaker.record_failure()
+    return breaker
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=60)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.allow()
+
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+def test_half_open_breaker_lets_a_single_probe_through():
+    breaker = open_breaker()
+
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = open_breaker(reset_seconds=60)
+    breaker.opened_at -= 60
+    assert breaker.allow()
+
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+def test_retry_budget_is_a_fraction_of_requests():
+    budget = RetryBudget(ratio=0.5, minimum=1)
+
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+
+def test_overloaded_gateway_is_retried_with_the_same_idempotency_key():
+    gateway = FakeGateway(status=503)
+    client = client_for(gateway, max_retries=2)
+
+    with pytest.raises(GatewayError) as error:
+        asyncio.run(post_and_close(client, idempotency_key="payment-1"))
+
+    assert error.value.status_code == 503
+    assert gateway.received == 3
+    assert gateway.idempotency_keys == ["payment-1"] * 3
+    assert client.get_metrics()["retries_total"] == 2
+
+def test_retries_stop_when_the_budget_is_spent():
+    gateway = FakeGateway(status=503)
+    client = client_for(gateway, max_retries=5, budget=RetryBudget(ratio=0, minimum=1))
+
+    with pytest.raises(GatewayError):
+        asyncio.run(post_and_close(client))
+
+    assert gateway.received == 2
+
+def test_rejected_request_is_not_retried_nor_counted_as_a_failure():
+    gateway = FakeGateway(status=400)
+    client = client_for(gateway, breaker=CircuitBreaker(failure_threshold=1))
+
+    with pytest.raises(GatewayError) as error:
+        asyncio.run(post_and_close(client))
+
+    assert error.value.status_code == 400
+    assert gateway.received == 1
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+def test_open_circuit_rejects_without_calling_the_gateway():
+    gateway = FakeGateway()
+    client = client_for(gateway, breaker=open_breaker(reset_seconds=60))
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(post_and_close(client))
+
+    assert gateway.received == 0
+
+def test_cancelled_probe_releases_the_half_open_slot():
+    gateway = FakeGateway()
+    gateway.hang = True
+    client = client_for(gateway, breaker=open_breaker())
+
+    async def run():
+        try:
+            probe = asyncio.create_task(client.post("/v1/payments", {"amount": 100}))
+            await asyncio.sleep(0.05)
+            probe.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await probe
+            gateway.hang = False
+            return await client.post("/v1/payments", {"amount": 100})
+        finally:
+            await client.close()
+
+    assert asyncio.run(run()) == {"payment_id": "BMP-1"}
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+def test_probe_failing_outside_the_transport_releases_the_half_open_slot():
+    gateway = FakeGateway()
+    gateway.crash = True
+    client = client_for(gateway, breaker=open_breaker())
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(post_and_close(client))
+
+    assert client.breaker.allow()
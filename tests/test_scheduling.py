@@ -0,0 +1,125 @@
+"""
+Tests for scheduling sessions, exams and video lessons: times are future
+naive UTC, only the people involved can change an event, and reminders go
+to everyone taking part and are dropped when the event is cancelled.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+def in_days(days: float) -> str:
+    return (datetime.utcnow() + timedelta(days=days)).replace(microsecond=0).isoformat()
+
+@pytest.fixture
+def lesson(app):
+    """A student with a road course and an approved teacher at a school"""
+    student_headers, student = app.user()
+    teacher_headers, teacher_user = app.user("teacher")
+    manager_headers, manager = app.user("manager")
+    app.run(app.db.driving_schools.insert_one({"id": "school-1", "manager_id": manager["id"]}))
+    app.run(app.db.teachers.insert_one({
+        "id": "teacher-1", "user_id": teacher_user["id"], "driving_school_id": "school-1", "is_approved": True
+    }))
+    app.run(app.db.courses.insert_one({
+        "id": "course-1", "course_type": "road", "exam_status": "available", "enrollment_id": "enrollment-1"
+    }))
+    return {
+        "student": (student_headers, student),
+        "teacher": (teacher_headers, teacher_user),
+        "manager": (manager_headers, manager)
+    }
+
+def schedule_session(app, headers, scheduled_at: str):
+    return app.client.post("/api/sessions/schedule", json={
+        "course_id": "course-1", "teacher_id": "teacher-1", "scheduled_at": scheduled_at
+    }, headers=headers)
+
+def pending_reminders(app, subject_type: str, subject_id: str) -> list:
+    return app.run(app.db.scheduled_reminders.find({
+        "subject_type": subject_type, "subject_id": subject_id, "status": "pending"
+    }).to_list(length=None))
+
+@pytest.mark.parametrize("scheduled_at", ["next tuesday", in_days(-1), in_days(2) + "+01:00"])
+def test_session_time_must_be_future_naive_utc(app, lesson, scheduled_at):
+    headers, _ = lesson["student"]
+
+    assert schedule_session(app, headers, scheduled_at).status_code == 400
+    assert app.run(app.db.sessions.count_documents({})) == 0
+
+def test_session_reminders_reach_the_student_and_the_teacher(app, lesson):
+    headers, student = lesson["student"]
+    _, teacher_user = lesson["teacher"]
+
+    session_id = schedule_session(app, headers, in_days(2)).json()["session_id"]
+
+    reminders = pending_reminders(app, "session", session_id)
+    assert len(reminders) == 2
+    assert all(reminder["user_ids"] == [student["id"], teacher_user["id"]] for reminder in reminders)
+
+@pytest.mark.parametrize("role, allowed", [("student", True), ("teacher", True), ("manager", True), ("other", False)])
+def test_only_people_involved_can_cancel_a_session(app, lesson, role, allowed):
+    session_id = schedule_session(app, lesson["student"][0], in_days(2)).json()["session_id"]
+    headers = lesson[role][0] if role in lesson else app.user()[0]
+
+    response = app.client.post(f"/api/sessions/{session_id}/cancel", headers=headers)
+
+    assert response.status_code == (200 if allowed else 403)
+    assert (pending_reminders(app, "session", session_id) == []) is allowed
+
+def test_reschedule_moves_reminders_and_validates_the_time(app, lesson):
+    headers, _ = lesson["student"]
+    session_id = schedule_session(app, headers, in_days(2)).json()["session_id"]
+    url = f"/api/sessions/{session_id}/reschedule"
+
+    assert app.client.post(url, data={"scheduled_at": in_days(-1)}, headers=headers).status_code == 400
+
+    new_time = in_days(5)
+    assert app.client.post(url, data={"scheduled_at": new_time}, headers=headers).status_code == 200
+    reminders = pending_reminders(app, "session", session_id)
+    assert {reminder["event_at"] for reminder in reminders} == {datetime.fromisoformat(new_time)}
+    assert len(reminders[0]["user_ids"]) == 2
+
+def test_exam_date_is_validated(app, lesson):
+    headers, _ = lesson["student"]
+    app.run(app.db.external_experts.insert_one({"id": "expert-1", "specialization": ["road"], "is_available": True}))
+
+    def schedule_exam(preferred_dates):
+        return app.client.post("/api/exams/schedule", json={
+            "course_id": "course-1", "exam_type": "road", "preferred_dates": preferred_dates, "location": "Algiers"
+        }, headers=headers)
+
+    assert schedule_exam([]).status_code == 400
+    assert schedule_exam(["yesterday"]).status_code == 400
+    assert schedule_exam([in_days(-1)]).status_code == 400
+    assert app.run(app.db.exam_schedules.count_documents({})) == 0
+
+    exam_id = schedule_exam([in_days(7)]).json()["exam_id"]
+    assert len(pending_reminders(app, "exam", exam_id)) == 2
+
+def create_room(app, headers, student, scheduled_at: str):
+    return app.client.post("/api/video-rooms", json={
+        "course_id": "course-1", "student_id": student["id"], "scheduled_at": scheduled_at
+    }, headers=headers)
+
+def test_video_room_time_is_validated(app, lesson):
+    headers, _ = lesson["teacher"]
+    _, student = lesson["student"]
+
+    assert create_room(app, headers, student, in_days(-1)).status_code == 400
+    assert create_room(app, headers, student, in_days(1) + "Z").status_code == 400
+    assert app.run(app.db.video_rooms.count_documents({})) == 0
+
+def test_cancelling_a_video_room_drops_its_reminders(app, lesson):
+    teacher_headers, _ = lesson["teacher"]
+    _, student = lesson["student"]
+    room_id = create_room(app, teacher_headers, student, in_days(2)).json()["id"]
+    assert len(pending_reminders(app, "video_room", room_id)) == 2
+
+    url = f"/api/video-rooms/{room_id}/cancel"
+    assert app.client.post(url, headers=lesson["manager"][0]).status_code == 403
+    assert app.client.post(url, headers=lesson["student"][0]).status_code == 200
+    assert app.client.post(url, headers=teacher_headers).status_code == 400
+
+    assert pending_reminders(app, "video_room", room_id) == []
+    assert app.run(app.db.video_rooms.find_one({"id": room_id}))["is_active"] is False
@@ -0,0 +1,205 @@
+"""
+Tests for the async SMTP transport against a local aiosmtpd server.
+
+Run with: python -m pytest tests/test_smtp_transport.py
+"""
+
+import sys
+import socket
+import asyncio
+from pathlib import Path
+
+import pytest
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+from smtp_transport import SMTPPool, SMTPConnection, SMTPError
+
+MESSAGE = b"Subject: Lesson reminder\r\n\r\nYour lesson is tomorrow.\r\n.leading dot\r\n"
+
+class RecordingHandler:
+    """Accepts every message, refusing recipients at refused.example"""
+
+    def __init__(self, pipelining: bool = False, drop_after_data: bool = False):
+        self.pipelining = pipelining
+        self.drop_after_data = drop_after_data
+        self.messages = []
+        self.sessions = set()
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        session.host_name = hostname
+        self.sessions.add(id(session))
+        if self.pipelining:
+            responses.insert(-1, "250-PIPELINING")
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.endswith("@refused.example"):
+            return "550 5.1.1 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.mail_from, list(envelope.rcpt_tos), envelope.content))
+        if self.drop_after_data:
+            # Accepted, but the reply never reaches the client
+            server.transport.close()
+        return "250 Message accepted"
+
+def authenticator(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=auth_data.login == b"school" and auth_data.password == b"secret")
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture
+def smtp_server():
+    """Starts aiosmtpd servers for a test and returns their port"""
+    controllers = []
+
+    def start(handler, **smtp_parameters):
+        controller = Controller(handler, hostname="127.0.0.1", port=free_port(), **smtp_parameters)
+        controller.start()
+        controllers.append(controller)
+        return controller.port
+
+    yield start
+    for controller in controllers:
+        controller.stop()
+
+def pool_for(port: int, **kwargs) -> SMTPPool:
+    return SMTPPool("127.0.0.1", port, starttls=False, **kwargs)
+
+async def send_and_close(pool: SMTPPool, messages: list):
+    try:
+        return await pool.send_batch(messages)
+    finally:
+        await pool.close()
+
+def test_pipelined_messages_share_a_session(smtp_server):
+    handler = RecordingHandler(pipelining=True)
+    pool = pool_for(smtp_server(handler), size=1)
+    messages = [("noreply@example.com", [f"student{index}@example.com"], MESSAGE) for index in range(5)]
+
+    errors = asyncio.run(send_and_close(pool, messages))
+
+    assert errors == [None] * 5
+    assert len(handler.messages) == 5
+    assert pool.stats["connections_opened"] == 1
+    # Dot-stuffing is undone by the server
+    assert b"\r\n.leading dot" in handler.messages[0][2]
+
+def test_refused_recipients_are_reported(smtp_server):
+    handler = RecordingHandler(pipelining=True)
+    pool = pool_for(smtp_server(handler))
+
+    async def run():
+        try:
+            return await pool.send("noreply@example.com", ["ok@example.com", "ghost@refused.example"], MESSAGE)
+        finally:
+            await pool.close()
+
+    refused = asyncio.run(run())
+
+    assert list(refused) == ["ghost@refused.example"]
+    assert refused["ghost@refused.example"][0] == 550
+    assert handler.messages[0][1] == ["ok@example.com"]
+
+def test_all_recipients_refused_raises_and_keeps_session(smtp_server):
+    handler = RecordingHandler()
+    pool = pool_for(smtp_server(handler), size=1)
+
+    async def run():
+        try:
+            with pytest.raises(SMTPError) as error:
+                await pool.send("noreply@example.com", ["ghost@refused.example"], MESSAGE)
+            assert error.value.code == 550
+            assert error.value.permanent
+            await pool.send("noreply@example.com", ["ok@example.com"], MESSAGE)
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
+
+    assert len(handler.messages) == 1
+    assert pool.stats["connections_opened"] == 1
+
+@pytest.mark.parametrize("sender, recipient", [
+    ("noreply@example.com", "student@x.example>\r\nRCPT TO:<victim@other.example"),
+    ("noreply@example.com", "student@x.example\n"),
+    ("noreply@example.com>\r\nRSET", "student@example.com")
+])
+def test_addresses_with_line_breaks_are_rejected_before_sending(smtp_server, sender, recipient):
+    handler = RecordingHandler(pipelining=True)
+    pool = pool_for(smtp_server(handler))
+
+    errors = asyncio.run(send_and_close(pool, [(sender, [recipient], MESSAGE)]))
+
+    assert isinstance(errors[0], SMTPError) and errors[0].code == 501
+    assert errors[0].permanent
+    assert handler.messages == []
+    assert pool.stats["connections_opened"] == 0
+
+def test_command_lines_cannot_carry_a_second_command():
+    connection = SMTPConnection("127.0.0.1", 25)
+
+    with pytest.raises(ValueError):
+        asyncio.run(connection.command("NOOP\r\nRSET"))
+
+def test_only_5xx_replies_are_permanent():
+    assert SMTPError(550, "No such user").permanent
+    assert not SMTPError(451, "Try again later").permanent
+
+def test_dropped_idle_session_is_replaced(smtp_server):
+    handler = RecordingHandler()
+    pool = pool_for(smtp_server(handler), size=1)
+
+    async def run():
+        try:
+            await pool.send("noreply@example.com", ["first@example.com"], MESSAGE)
+            # The server drops the idle session behind the pool's back
+            pool._idle[0].writer.transport.abort()
+            await pool.send("noreply@example.com", ["second@example.com"], MESSAGE)
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
+
+    assert [rcpt for _, rcpt, _ in handler.messages] == [["first@example.com"], ["second@example.com"]]
+    assert pool.stats["connections_opened"] == 2
+
+def test_connection_lost_after_data_is_not_resent(smtp_server):
+    handler = RecordingHandler(drop_after_data=True)
+    pool = pool_for(smtp_server(handler))
+
+    async def run():
+        try:
+            with pytest.raises((ConnectionError, OSError)):
+                await pool.send("noreply@example.com", ["student@example.com"], MESSAGE)
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
+
+    assert len(handler.messages) == 1
+    assert pool.stats["failed"] == 1
+
+@pytest.mark.parametrize("excluded", [["LOGIN"], ["PLAIN"]])
+def test_authenticates_with_plain_or_login(smtp_server, excluded):
+    handler = RecordingHandler()
+    port = smtp_server(
+        handler,
+        authenticator=authenticator,
+        auth_require_tls=False,
+        auth_exclude_mechanism=excluded
+    )
+    pool = SMTPPool("127.0.0.1", port, username="school", password="secret", starttls=False)
+
+    errors = asyncio.run(send_and_close(pool, [("noreply@example.com", ["student@example.com"], MESSAGE)]))
+
+    assert errors == [None]
+    assert len(handler.messages) == 1
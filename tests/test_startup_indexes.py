@@ -0,0 +1,24 @@
+"""
+Tests for index creation at startup: an index that existing data prevents
+does not keep the others from being built.
+"""
+
+from mongomock_motor import AsyncMongoMockClient
+
+def test_each_index_is_built_independently(app, monkeypatch):
+    database = AsyncMongoMockClient().driving_school_platform
+    monkeypatch.setattr(app.server, "db", database)
+    # Legacy duplicates: the unique enrollment index cannot be built
+    app.run(database.certificates.insert_many([
+        {"id": "certificate-1", "certificate_number": "DZ-16-000001", "enrollment_id": "enrollment-1"},
+        {"id": "certificate-2", "certificate_number": "DZ-16-000002", "enrollment_id": "enrollment-1"}
+    ]))
+
+    failed = app.run(app.server.ensure_indexes())
+
+    assert failed == [("certificates", "enrollment_id")]
+    assert "sha256_1" in app.run(database.file_blobs.index_information())
+    assert "certificate_number_1" in app.run(database.certificates.index_information())
+    # Indexes listed after the failing one are built too
+    last_collection = app.server.APP_INDEXES[-1][0]
+    assert len(app.run(database[last_collection].index_information())) > 1
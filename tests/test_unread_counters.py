@@ -0,0 +1,128 @@
+"""
+Tests for the per-user unread counters: every change to a notification
+keeps them equal to a recount, and a rebuild never overwrites an update
+made while it was counting.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from enhanced_notifications import EnhancedNotificationService, NotificationPriority
+
+@pytest.fixture
+def service():
+    service = EnhancedNotificationService(AsyncMongoMockClient())
+    asyncio.run(service.db.notification_counters.create_index("user_id", unique=True))
+    return service
+
+async def recount(service, user_id: str) -> int:
+    return await service.db.enhanced_notifications.count_documents({"user_id": user_id, "is_read": False})
+
+async def notify(service, user_id: str, priority=NotificationPriority.MEDIUM, **kwargs) -> str:
+    return await service.create_notification(user_id, "general", "Hello", "Welcome to the school", priority=priority, **kwargs)
+
+def test_counters_follow_every_change(service):
+    async def run():
+        await service.get_unread_counts("u1")
+        first = await notify(service, "u1", NotificationPriority.HIGH)
+        second = await notify(service, "u1")
+        await notify(service, "u1")
+        await notify(service, "u1", expires_at=datetime.utcnow() - timedelta(minutes=1))
+        steps = [await service.get_unread_counts("u1")]
+
+        await service.mark_as_read(first, "u1")
+        await service.mark_as_read(first, "u1")
+        steps.append(await service.get_unread_counts("u1"))
+
+        await service.delete_notification(second, "u1")
+        steps.append(await service.get_unread_counts("u1"))
+
+        await service.expire_notifications()
+        steps.append(await service.get_unread_counts("u1"))
+
+        await service.mark_all_as_read("u1")
+        steps.append(await service.get_unread_counts("u1"))
+        return steps
+
+    steps = asyncio.run(run())
+
+    assert [step["unread"] for step in steps] == [4, 3, 2, 1, 0]
+    assert steps[0]["unread_by_priority"]["high"] == 1
+    assert steps[1]["unread_by_priority"]["high"] == 0
+
+class NotificationArrivesDuringCount:
+    """The database as the rebuild sees it: a notification is created right after it counts"""
+
+    def __init__(self, service, user_id: str, arrivals: int = 1):
+        self.db = service.db
+        self.service = service
+        self.user_id = user_id
+        self.arrivals = arrivals
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+    @property
+    def enhanced_notifications(self):
+        collection = self.db.enhanced_notifications
+        arrival = self
+
+        class Aggregate:
+            def __init__(self, pipeline):
+                self.cursor = collection.aggregate(pipeline)
+
+            async def to_list(self, length=None):
+                groups = await self.cursor.to_list(length=length)
+                if arrival.arrivals:
+                    arrival.arrivals -= 1
+                    self_db, arrival.service.db = arrival.service.db, arrival.db
+                    await notify(arrival.service, arrival.user_id)
+                    arrival.service.db = self_db
+                return groups
+
+        class Collection:
+            def __getattr__(self, name):
+                return getattr(collection, name)
+
+            def aggregate(self, pipeline):
+                return Aggregate(pipeline)
+
+        return Collection()
+
+@pytest.mark.parametrize("existing", [False, True])
+def test_rebuild_does_not_lose_concurrent_updates(service, existing):
+    async def run():
+        await service.db.enhanced_notifications.insert_one({
+            "id": "old", "user_id": "u1", "priority": "medium", "is_read": False, "created_at": datetime.utcnow()
+        })
+        if existing:
+            # A counter written before counters were initialized from a recount
+            await service.db.notification_counters.insert_one({"user_id": "u1", "unread": 0})
+        real_db = service.db
+        service.db = NotificationArrivesDuringCount(service, "u1")
+        counts = await service.get_unread_counts("u1")
+        service.db = real_db
+        return counts, await service.get_unread_counts("u1"), await recount(service, "u1")
+
+    during, after, unread = asyncio.run(run())
+
+    assert unread == 2
+    assert during["unread"] == 2
+    assert after["unread"] == 2
+
+def test_rebuild_that_keeps_losing_is_not_stored(service):
+    async def run():
+        real_db = service.db
+        service.db = NotificationArrivesDuringCount(service, "u1", arrivals=10)
+        counts = await service.get_unread_counts("u1")
+        service.db = real_db
+        stored = await service.db.notification_counters.find_one({"user_id": "u1"})
+        return counts, stored, await service.get_unread_counts("u1"), await recount(service, "u1")
+
+    _, stored, after, unread = asyncio.run(run())
+
+    assert not stored.get("initialized")
+    assert after["unread"] == unread
@@ -0,0 +1,89 @@
+"""
+Tests for serving local uploads: public folders are open, everything else
+needs a signed URL checked on the resolved path, with caching validators and
+byte ranges.
+"""
+
+from pathlib import Path
+
+import pytest
+
+from upload_serving import UploadUrlSigner, parse_range
+
+CONTENT = b"0123456789" * 10
+
+def store(relative_path: str) -> str:
+    path = Path("demo-uploads") / relative_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(CONTENT)
+    return f"/demo-uploads/{relative_path}"
+
+def test_public_upload_is_served_without_a_signature(app):
+    url = store("driving_schools/school-1/photo/front.jpg")
+
+    response = app.client.get(url)
+
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["cache-control"].startswith("public")
+
+def test_private_upload_needs_a_valid_signature(app):
+    url = store("documents/id_card/user-1/scan.pdf")
+    signed = app.server.upload_signer.sign(url)
+
+    assert app.client.get(url).status_code == 403
+    assert app.client.get(signed.replace("signature=", "signature=0")).status_code == 403
+
+    response = app.client.get(signed)
+    assert response.status_code == 200
+    assert response.headers["cache-control"].startswith("private")
+
+def test_signature_is_bound_to_the_path():
+    signer = UploadUrlSigner("secret")
+    signed = signer.sign("/demo-uploads/documents/a.pdf")
+
+    assert signer.verify_url(signed)
+    assert not signer.verify_url(signed.replace("a.pdf", "b.pdf"))
+
+@pytest.mark.parametrize("path", [
+    "driving_schools/%2E%2E/documents/id_card/user-1/scan.pdf",
+    "driving_schools/..%2Fdocuments/id_card/user-1/scan.pdf"
+])
+def test_public_prefix_does_not_open_private_files(app, path):
+    store("documents/id_card/user-1/scan.pdf")
+
+    assert app.client.get(f"/demo-uploads/{path}").status_code == 403
+
+def test_files_outside_the_uploads_folder_are_not_served(app):
+    Path("secret.txt").write_text("not an upload")
+
+    assert app.client.get("/demo-uploads/driving_schools/..%2F..%2Fsecret.txt").status_code == 404
+
+def test_matching_etag_is_not_modified(app):
+    url = store("driving_schools/school-1/logo.png")
+    etag = app.client.get(url).headers["etag"]
+
+    response = app.client.get(url, headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+
+def test_byte_ranges(app):
+    url = store("driving_schools/school-1/tour.mp4")
+
+    partial = app.client.get(url, headers={"Range": "bytes=10-19"})
+    assert partial.status_code == 206
+    assert partial.content == CONTENT[10:20]
+    assert partial.headers["content-range"] == f"bytes 10-19/{len(CONTENT)}"
+
+    assert app.client.get(url, headers={"Range": "bytes=-5"}).content == CONTENT[-5:]
+    assert app.client.get(url, headers={"Range": "bytes=500-"}).status_code == 416
+    # A stale If-Range gets the whole file
+    assert app.client.get(url, headers={"Range": "bytes=0-1", "If-Range": '"old"'}).status_code == 200
+
+def test_parse_range():
+    assert parse_range("bytes=0-", 10) == (0, 9)
+    assert parse_range("bytes=5-100", 10) == (5, 9)
+    assert parse_range("bytes=0-1,4-5", 10) is None
+    with pytest.raises(ValueError):
+        parse_range("bytes=9-2", 10)